@@ -1,5 +1,20 @@
+import click
 from flask import Flask
-from database import init_db, migrate_db
+from database import init_db, migrate_db, get_db, get_read_db, close_connection
+import counters
+import querycheck
+import timeline
+import trending
+import recommendations
+import images
+import media
+import jobs
+import assets
+import fragments
+import profiling
+import sessions
+import transfer
+import users
 from routes.auth import auth_bp
 from routes.feed import feed_bp
 from routes.profile import profile_bp
@@ -10,6 +25,8 @@ from routes.api import api_bp
 
 app = Flask(__name__)
 app.secret_key = 'change_this_secret_in_production_123'
+# The cookie holds only a session id; the session itself is a row in `sessions`
+app.session_interface = sessions.SQLiteSessionInterface()
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(feed_bp)
@@ -19,6 +36,143 @@ app.register_blueprint(search_bp)
 app.register_blueprint(notif_bp)
 app.register_blueprint(api_bp)
 
+app.teardown_appcontext(close_connection)
+
+# PROFILING=1: per-request SQL/template timing, slow-request log and /metrics
+profiling.init_app(app)
+
+app.jinja_env.filters['variants'] = images.load
+app.jinja_env.globals['srcset'] = images.srcset
+app.jinja_env.globals['static_url'] = assets.static_url
+app.jinja_env.globals['post_card'] = fragments.post_card
+app.jinja_env.globals['profile_header'] = fragments.profile_header
+# `viewer`: the signed-in user's name, theme, accent and avatar, from the user cache
+app.context_processor(users.viewer)
+
+# /static with fingerprinted-asset caching, ETags, Range and optional X-Sendfile/X-Accel
+app.view_functions['static'] = assets.serve_static
+
+@app.cli.command('rebuild-counters')
+def rebuild_counters_command():
+    """Recompute post_stats/user_stats from the raw tables."""
+    counters.rebuild(get_db())
+    click.echo('Counters rebuilt')
+
+@app.cli.command('verify-counters')
+def verify_counters_command():
+    """Compare stored counters with the raw tables; exit 1 on drift."""
+    drift = counters.verify(get_db())
+    for table, key_id, column, stored, actual in drift:
+        click.echo(f'{table}[{key_id}].{column}: stored={stored} actual={actual}')
+    if drift:
+        raise SystemExit(1)
+    click.echo('Counters OK')
+
+@app.cli.command('rebuild-timeline')
+def rebuild_timeline_command():
+    """Re-materialize every home timeline from the follow graph."""
+    timeline.rebuild(get_db())
+    click.echo('Timelines rebuilt')
+
+@app.cli.command('compact-trending')
+def compact_trending_command():
+    """Rebase trending scores to now and drop stale entries (the worker also does it daily)."""
+    trending.compact(get_db())
+    click.echo('Trending scores compacted')
+
+@app.cli.command('rebuild-trending')
+def rebuild_trending_command():
+    """Recompute trending scores from likes and comments."""
+    trending.rebuild(get_db())
+    click.echo('Trending scores rebuilt')
+
+@app.cli.command('refresh-recommendations')
+@click.option('--limit', type=int, default=None, help='Refresh at most this many users.')
+def refresh_recommendations_command(limit):
+    """Recompute stale or invalidated "who to follow" lists now (the worker also does it periodically)."""
+    count = recommendations.refresh(get_db(), limit)
+    click.echo(f'Refreshed recommendations for {count} users')
+
+@app.cli.command('process-images')
+def process_images_command():
+    """Queue resized WebP/AVIF variants for images uploaded before the pipeline."""
+    count = media.process_existing(get_db())
+    click.echo(f'Queued {count} images')
+
+@app.cli.command('gc-media')
+@click.option('--dry-run', is_flag=True, help='Report what would be removed without changing anything.')
+def gc_media_command(dry_run):
+    """Fix blob refcounts and delete upload files nothing refers to."""
+    stats = media.gc(get_db(), dry_run=dry_run)
+    click.echo(' '.join(f'{key}={value}' for key, value in stats.items()))
+
+@app.cli.command('worker')
+@click.option('--once', is_flag=True, help='Exit when no job is due instead of polling.')
+def worker_command(once):
+    """Run background jobs (image variants, file cleanup, recommendations, trending compaction)."""
+    jobs.work(get_db(), once=once, log=click.echo)
+
+@app.cli.command('revoke-sessions')
+@click.argument('username')
+def revoke_sessions_command(username):
+    """Sign a user out of every session."""
+    db = get_db()
+    user = db.execute('SELECT id FROM users WHERE username=?', (username,)).fetchone()
+    if user is None:
+        raise click.ClickException(f'No user {username}')
+    count = sessions.revoke(db, user['id'])
+    db.commit()
+    click.echo(f'Revoked {count} sessions')
+
+@app.cli.command('jobs')
+@click.option('--retry-failed', is_flag=True, help='Re-queue every failed job.')
+def jobs_command(retry_failed):
+    """Show job queue depth and failures."""
+    db = get_db()
+    if retry_failed:
+        click.echo(f'Re-queued {jobs.retry_failed(db)} jobs')
+    for key, value in jobs.stats(db).items():
+        click.echo(f'{key}: {value}')
+    for row in db.execute("SELECT id, kind, attempts, last_error FROM jobs WHERE status='failed' ORDER BY id DESC LIMIT 10"):
+        click.echo(f"failed #{row['id']} {row['kind']} attempts={row['attempts']}\n{row['last_error']}")
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create missing tables and apply pending schema migrations."""
+    init_db()
+    migrate_db()
+
+@app.cli.command('export-data')
+@click.argument('path')
+def export_data_command(path):
+    """Write every table to PATH (JSON lines, gzipped if PATH ends in .gz)."""
+    for table, count in transfer.export(get_read_db(), path).items():
+        click.echo(f'{table}: {count}')
+
+@app.cli.command('import-data')
+@click.argument('path')
+@click.option('--yes', is_flag=True, help='Do not ask before replacing the current data.')
+def import_data_command(path, yes):
+    """Replace this database's data with an export-data file (e.g. moving to DATABASE_URL)."""
+    if not yes:
+        click.confirm('Every table in the file is emptied first. Continue?', abort=True)
+    try:
+        counts = transfer.load(get_db(), path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for table, count in counts.items():
+        click.echo(f'{table}: {count}')
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any statement issued by the hot routes does a full table scan."""
+    scans = querycheck.check(app)
+    for sql, detail in scans:
+        click.echo(f'{detail}\n    {sql}')
+    if scans:
+        raise SystemExit(1)
+    click.echo('Query plans OK')
+
 if __name__ == '__main__':
     init_db()
     migrate_db()
@@ -0,0 +1,104 @@
+"""Serving for /static: fingerprinted assets, cache headers, ETags and ranges.
+
+Templates link CSS/JS through static_url(), which appends ?v=<content hash>;
+such requests, and everything under uploads/ (content-addressed or uuid
+names that are never rewritten), are sent with a one-year immutable
+Cache-Control. Other static requests must revalidate and get a 304 on a
+matching ETag. Partial uploads under uploads/tmp are not served at all.
+werkzeug's conditional send_file answers Range requests with 206, so video
+and audio seeking works. Set MEDIA_OFFLOAD to hand the bytes to the front
+server instead of a Python worker:
+
+    MEDIA_OFFLOAD=x-sendfile    Apache mod_xsendfile / lighttpd
+    MEDIA_OFFLOAD=x-accel       nginx; location X_ACCEL_PREFIX must be
+                                `internal` and alias the static folder
+"""
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import Response, abort, current_app, request
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+import media
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+FINGERPRINT_LENGTH = 12
+OFFLOAD = os.environ.get('MEDIA_OFFLOAD', '')            # '', 'x-sendfile' or 'x-accel'
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected-static/')
+
+_fingerprints = {}        # path -> (mtime_ns, size, sha256 hex)
+_fingerprints_lock = threading.Lock()
+
+
+def fingerprint(path):
+    """sha256 of a file's content, cached until its mtime or size changes."""
+    st = os.stat(path)
+    with _fingerprints_lock:
+        cached = _fingerprints.get(path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    with _fingerprints_lock:
+        _fingerprints[path] = (st.st_mtime_ns, st.st_size, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def static_url(filename):
+    """/static URL with a content fingerprint, cacheable forever (Jinja global)."""
+    path = safe_join(current_app.static_folder, filename)
+    try:
+        version = fingerprint(path)[:FINGERPRINT_LENGTH]
+    except (OSError, TypeError):
+        return f'/static/{filename}'
+    return f'/static/{filename}?v={version}'
+
+
+def _etag(filename, path):
+    if filename.startswith('uploads/'):
+        # Upload names are never reused for different bytes, so the name is the identity
+        st = os.stat(path)
+        return f'{os.path.basename(filename)}-{st.st_size}'
+    return fingerprint(path)[:FINGERPRINT_LENGTH * 2]
+
+
+def _is_partial_upload(path):
+    tmp = os.path.realpath(os.path.join(media.UPLOAD_FOLDER, media.TMP_FOLDER))
+    return os.path.commonpath([os.path.realpath(path), tmp]) == tmp
+
+
+def _cache(response, immutable):
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def serve_static(filename):
+    """Replacement view for Flask's `static` endpoint (installed in app.py)."""
+    path = safe_join(current_app.static_folder, filename)
+    if path is None or not os.path.isfile(path) or _is_partial_upload(path):
+        abort(404)
+    etag = _etag(filename, path)
+    immutable = filename.startswith('uploads/') or (
+        request.args.get('v') and etag.startswith(request.args['v']))
+
+    if OFFLOAD == 'x-accel':
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX + filename
+        response.set_etag(etag)
+        return _cache(response, immutable)
+
+    response = send_file(path, request.environ, conditional=True, etag=etag,
+                         max_age=IMMUTABLE_MAX_AGE if immutable else None,
+                         use_x_sendfile=OFFLOAD == 'x-sendfile',
+                         response_class=current_app.response_class)
+    return _cache(response, immutable)
@@ -0,0 +1,74 @@
+"""Set-based hydration of many posts and users at once (GET /api/batch).
+
+A client holding a screen of post cards and follow buttons refreshes every
+count, its own liked/following state and the newest comments with one
+request instead of one per item. Each part is a single query over an IN
+list of at most MAX_IDS ids; comment previews walk the
+(post_id, created_at) index backwards and stop after `preview` rows per
+post, so a post with thousands of comments costs the same as one with two.
+Ids that do not come back no longer exist (deleted posts or users).
+"""
+MAX_IDS = 200           # per list; keeps the IN (...) under SQLite's parameter limit
+PREVIEW = 2             # newest comments returned per post by default
+MAX_PREVIEW = 5
+
+
+def parse_ids(value):
+    """'1,2,3' -> [1, 2, 3], dropping blanks, garbage and duplicates."""
+    ids = []
+    for part in (value or '').split(','):
+        part = part.strip()
+        if part.isdigit() and int(part) not in ids:
+            ids.append(int(part))
+    return ids
+
+
+def _marks(ids):
+    return ','.join('?' * len(ids))
+
+
+def post_states(db, uid, post_ids, preview=PREVIEW):
+    """{post_id: {like_count, comment_count, version, user_liked, comments}} for posts that exist."""
+    if not post_ids:
+        return {}
+    states = {r['id']: dict(r, user_liked=bool(r['user_liked']), comments=[]) for r in db.execute(f'''
+        SELECT p.id, COALESCE(ps.like_count, 0) AS like_count,
+               COALESCE(ps.comment_count, 0) AS comment_count,
+               COALESCE(ps.version, 0) AS version,
+               EXISTS(SELECT 1 FROM likes WHERE user_id = ? AND post_id = p.id) AS user_liked
+        FROM posts p LEFT JOIN post_stats ps ON ps.post_id = p.id
+        WHERE p.id IN ({_marks(post_ids)})
+    ''', (uid, *post_ids))}
+    if preview and states:
+        ids = list(states)
+        comments = db.execute(f'''
+            SELECT c.id, c.post_id, c.user_id, c.content, c.created_at,
+                   u.username, u.avatar_color, COALESCE(u.avatar_img, '') AS avatar_img
+            FROM posts p
+            JOIN comments c ON c.id IN (SELECT id FROM comments WHERE post_id = p.id
+                                        ORDER BY created_at DESC, id DESC LIMIT ?)
+            JOIN users u ON u.id = c.user_id
+            WHERE p.id IN ({_marks(ids)})
+            ORDER BY c.post_id, c.created_at, c.id
+        ''', (preview, *ids)).fetchall()
+        for c in comments:
+            states[c['post_id']]['comments'].append(dict(c))
+    return states
+
+
+def user_states(db, uid, user_ids):
+    """{user_id: {username, avatar fields, counts, is_following, follows_you}} for users that exist."""
+    if not user_ids:
+        return {}
+    rows = db.execute(f'''
+        SELECT u.id, u.username, u.avatar_color, COALESCE(u.avatar_img, '') AS avatar_img,
+               COALESCE(us.post_count, 0) AS post_count,
+               COALESCE(us.followers_count, 0) AS followers_count,
+               COALESCE(us.following_count, 0) AS following_count,
+               EXISTS(SELECT 1 FROM followers WHERE follower_id = ? AND following_id = u.id) AS is_following,
+               EXISTS(SELECT 1 FROM followers WHERE follower_id = u.id AND following_id = ?) AS follows_you
+        FROM users u LEFT JOIN user_stats us ON us.user_id = u.id
+        WHERE u.id IN ({_marks(user_ids)})
+    ''', (uid, uid, *user_ids)).fetchall()
+    return {r['id']: dict(r, is_following=bool(r['is_following']), follows_you=bool(r['follows_you']))
+            for r in rows}
@@ -0,0 +1,199 @@
+"""Concurrent-connection capacity: idle SSE streams held open vs. request latency.
+
+    python bench/connections.py --db /tmp/bench.db --streams 2000          # threads and gevent
+    python bench/connections.py --db /tmp/bench.db --models gevent --streams 5000
+    python bench/connections.py --url http://127.0.0.1:8000 --streams 500  # a running server
+
+For each worker model a gunicorn server is started on a copy of the dataset
+(gunicorn.conf.py, WORKER_MODEL=<model>). The benchmark logs in, opens
+--streams /notifications/stream connections, the kind of idle long-lived
+request that pins a thread, and, while they stay open, times --probes
+sequential /notifications/count requests. A model that cannot hold the
+streams shows up as streams not established and probes that time out.
+"""
+import argparse
+import asyncio
+import http.cookiejar
+import os
+import resource
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import database
+import dataset
+from load import percentile
+
+CONNECT_PARALLELISM = 200   # streams being opened at once
+
+
+def login(base_url, username):
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    data = urllib.parse.urlencode({'username': username, 'password': dataset.PASSWORD}).encode()
+    opener.open(base_url + '/login', data=data, timeout=30).read()
+    cookie = '; '.join(f'{c.name}={c.value}' for c in jar)
+    if 'session=' not in cookie:
+        raise RuntimeError('login failed')
+    return cookie
+
+
+def _request(host, path, cookie, extra=''):
+    return (f'GET {path} HTTP/1.1\r\nHost: {host}\r\nCookie: {cookie}\r\n{extra}\r\n').encode()
+
+
+async def open_stream(host, port, cookie, timeout):
+    """Open one SSE stream; returns the writer once the first event arrived, or None."""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    try:
+        writer.write(_request(host, '/notifications/stream', cookie, 'Accept: text/event-stream\r\n'))
+        await writer.drain()
+        status = await asyncio.wait_for(reader.readline(), timeout)
+        if b' 200 ' not in status:
+            raise ConnectionError(status)
+        await asyncio.wait_for(reader.readuntil(b'event: count'), timeout)
+        return writer
+    except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        writer.close()
+        return None
+
+
+async def probe(host, port, cookie, timeout):
+    """Latency of one GET /notifications/count on a fresh connection, or None on timeout."""
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        writer.write(_request(host, '/notifications/count', cookie, 'Connection: close\r\n'))
+        await writer.drain()
+        body = await asyncio.wait_for(reader.read(), timeout)
+        writer.close()
+    except (OSError, asyncio.TimeoutError):
+        return None
+    return time.perf_counter() - started if b' 200 ' in body.split(b'\r\n', 1)[0] else None
+
+
+async def measure(base_url, cookie, args):
+    url = urllib.parse.urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    gate = asyncio.Semaphore(CONNECT_PARALLELISM)
+
+    async def gated():
+        async with gate:
+            return await open_stream(host, port, cookie, args.timeout)
+
+    baseline = [await probe(host, port, cookie, args.timeout) for _ in range(args.probes)]
+    started = time.perf_counter()
+    writers = await asyncio.gather(*(gated() for _ in range(args.streams)))
+    open_seconds = time.perf_counter() - started
+    held = [w for w in writers if w is not None]
+    loaded = [await probe(host, port, cookie, args.timeout) for _ in range(args.probes)]
+    for w in held:
+        w.close()
+    return {'streams': len(held), 'open_seconds': open_seconds,
+            'idle': sorted(p for p in baseline if p is not None),
+            'loaded': sorted(p for p in loaded if p is not None)}
+
+
+def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/login', timeout=2).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server at {base_url} did not start')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def spawn(model, db_path, workdir, args):
+    """Start gunicorn for one worker model on its own copy of the dataset."""
+    rundir = os.path.join(workdir, model)
+    os.makedirs(rundir)
+    shutil.copy(db_path, os.path.join(rundir, 'social.db'))
+    port = free_port()
+    env = dict(os.environ, WORKER_MODEL=model, WEB_CONCURRENCY=str(args.workers))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', os.path.join(REPO, 'gunicorn.conf.py'),
+         '--chdir', rundir, '--pythonpath', REPO, '--bind', f'127.0.0.1:{port}',
+         '--backlog', str(max(2048, args.streams)), '--log-level', 'warning', 'app:app'],
+        env=env, start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT if args.quiet else None)
+    return server, f'http://127.0.0.1:{port}'
+
+
+def report(label, result, args):
+    def ms(values, p):
+        return f'{percentile(values, p) * 1000:8.1f}' if values else '       -'
+    print(f'{label:<10} {result["streams"]:>6}/{args.streams:<6} {result["open_seconds"]:>7.1f}s '
+          f'{ms(result["idle"], 50)} {ms(result["loaded"], 50)} {ms(result["loaded"], 99)} '
+          f'{len(result["loaded"]):>4}/{args.probes}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='Dataset from dataset.py; a small one is generated if omitted.')
+    parser.add_argument('--url', help='Measure a running server instead of spawning gunicorn.')
+    parser.add_argument('--models', default='threads,gevent', help='Worker models to compare.')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes.')
+    parser.add_argument('--streams', type=int, default=1000)
+    parser.add_argument('--probes', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=10, help='Seconds per connect/request.')
+    parser.add_argument('--quiet', action='store_true', help='Hide server logs.')
+    args = parser.parse_args()
+
+    # Each stream is a socket on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 2 * args.streams + 256)), hard))
+
+    header = (f'{"model":<10} {"streams held":>13} {"open":>8} {"p50 idle":>8} {"p50 busy":>8} '
+              f'{"p99 busy":>8} probes')
+    if args.url:
+        print(header)
+        report('server', asyncio.run(measure(args.url, login(args.url, 'user1'), args)), args)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'bench.db')
+        if args.db:
+            shutil.copy(args.db, db_path)
+        else:
+            dataset.generate(db_path, argparse.Namespace(
+                users=200, follows=20, posts=2000, likes=10000, comments=2000, stories=50,
+                notifications=2000, days=30, alpha=1.2, seed=1), log=lambda *a: None)
+        # Datasets generated before newer migrations are brought up to date
+        previous, database.DATABASE = database.DATABASE, db_path
+        try:
+            database.migrate_db()
+        finally:
+            database.DATABASE = previous
+        print(header)
+        for model in args.models.split(','):
+            server, base_url = spawn(model, db_path, workdir, args)
+            try:
+                wait_until_up(base_url)
+                report(model, asyncio.run(measure(base_url, login(base_url, 'user1'), args)), args)
+            finally:
+                # Threads stuck in open streams would hold up a graceful stop
+                os.killpg(server.pid, signal.SIGKILL)
+                server.wait()
+
+
+if __name__ == '__main__':
+    main()
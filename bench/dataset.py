@@ -0,0 +1,169 @@
+"""Generate a synthetic social graph for benchmarks.
+
+    python bench/dataset.py --users 5000 --out /tmp/bench.db
+
+Follower counts follow a power law (a few accounts have most of the
+followers), posting activity is skewed the same way, and likes and comments
+concentrate on popular authors and recent posts. Every user is user<N> with
+the password PASSWORD, so load.py (or a browser) can log in as anyone. The
+derived tables (counters, timelines, search index, trending) are rebuilt at
+the end exactly as the migrations would.
+"""
+import argparse
+import bisect
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash
+
+import counters
+import database
+import fulltext
+import notifications
+import timeline
+import trending
+
+PASSWORD = 'bench-password'
+WORDS = ('sunset coffee travel music photo weekend city friends dinner beach morning '
+         'mountain cat dog book movie game code design summer winter rain party art').split()
+COLORS = ('#6366f1', '#ec4899', '#f59e0b', '#10b981', '#3b82f6', '#ef4444')
+BATCH = 10000
+
+
+def timestamp(seconds_ago):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - seconds_ago))
+
+
+def text(rng, low=3, high=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def insert(db, sql, rows):
+    """executemany in BATCH-sized slices, so generators never materialize fully."""
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, BATCH)):
+        db.executemany(sql, batch)
+
+
+def _sampler(rng, weights):
+    """Draw indexes with probability proportional to weights."""
+    cumulative = list(itertools.accumulate(weights))
+    total = cumulative[-1]
+    return lambda: bisect.bisect(cumulative, rng.random() * total)
+
+
+def populate(db, args, rng):
+    n = args.users
+    password_hash = generate_password_hash(PASSWORD)
+    # Pareto weights: popularity (who gets followed/liked) and activity (who posts)
+    popularity = [rng.paretovariate(args.alpha) for _ in range(n)]
+    activity = [rng.paretovariate(args.alpha) for _ in range(n)]
+
+    insert(db, 'INSERT INTO users (id, username, password_hash, bio, avatar_color, created_at) VALUES (?,?,?,?,?,?)',
+           ((i + 1, f'user{i + 1}', password_hash, text(rng, 0, 8), rng.choice(COLORS),
+             timestamp(rng.uniform(30, 365) * 86400)) for i in range(n)))
+
+    popular = _sampler(rng, popularity)
+
+    def follows():
+        for i in range(n):
+            # Out-degree is heavy-tailed too, capped so one user cannot follow everyone
+            degree = min(int(rng.paretovariate(1.5) * args.follows / 3), n - 1)
+            targets = {popular() for _ in range(degree)} - {i}
+            for j in targets:
+                yield i + 1, j + 1, timestamp(rng.uniform(0, 90) * 86400)
+    insert(db, 'INSERT OR IGNORE INTO followers (follower_id, following_id, created_at) VALUES (?,?,?)', follows())
+
+    active = _sampler(rng, activity)
+    # Posts get ids in time order; recent ones are denser, like a live site
+    ages = sorted((rng.expovariate(1 / (args.days * 86400 / 4)) for _ in range(args.posts)), reverse=True)
+    authors = [active() + 1 for _ in range(args.posts)]
+    insert(db, 'INSERT INTO posts (id, user_id, content, created_at) VALUES (?,?,?,?)',
+           ((i + 1, authors[i], text(rng), timestamp(age)) for i, age in enumerate(ages)))
+
+    # Engagement: a post's weight is its author's popularity, boosted when recent
+    engaging = _sampler(rng, [popularity[authors[i] - 1] * (1 + 10 * (i > args.posts * 0.9))
+                              for i in range(args.posts)])
+    insert(db, 'INSERT OR IGNORE INTO likes (user_id, post_id, created_at) VALUES (?,?,?)',
+           ((rng.randint(1, n), engaging() + 1, timestamp(rng.uniform(0, args.days) * 86400))
+            for _ in range(args.likes)))
+    insert(db, 'INSERT INTO comments (post_id, user_id, content, created_at) VALUES (?,?,?,?)',
+           ((engaging() + 1, rng.randint(1, n), text(rng, 1, 8), timestamp(rng.uniform(0, args.days) * 86400))
+            for _ in range(args.comments)))
+
+    insert(db, "INSERT INTO stories (user_id, content, bg_color, created_at, expires_at) VALUES (?,?,?,?,?)",
+           ((active() + 1, text(rng, 1, 5), rng.choice(COLORS), timestamp(age), timestamp(age - 86400))
+            for age in (rng.uniform(0, 2 * 86400) for _ in range(args.stories))))
+
+    def notification_rows():
+        for _ in range(args.notifications):
+            kind = rng.choice(('like', 'like', 'comment', 'follow'))
+            post_id = engaging() + 1 if kind != 'follow' else None
+            user_id = authors[post_id - 1] if post_id else popular() + 1
+            yield (user_id, rng.randint(1, n), kind, post_id, int(rng.random() < 0.8),
+                   timestamp(rng.uniform(0, args.days) * 86400))
+    # Loaded raw, then grouped the way the migration groups existing rows
+    db.execute('DROP INDEX idx_notifications_open_group')
+    insert(db, 'INSERT INTO notifications (user_id, from_user_id, type, post_id, is_read, created_at) VALUES (?,?,?,?,?,?)',
+           notification_rows())
+    notifications.merge_existing(db)
+    db.executescript(notifications.GROUP_INDEX)
+    db.commit()
+
+
+def generate(path, args, log=print):
+    """Create and fill a fresh database at path."""
+    if os.path.exists(path):
+        os.remove(path)
+    previous, database.DATABASE = database.DATABASE, path
+    try:
+        database.init_db()
+        database.migrate_db()
+    finally:
+        database.DATABASE = previous
+    db = database._connect(path)
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = OFF')
+    started = time.perf_counter()
+    populate(db, args, random.Random(args.seed))
+    log(f'populated in {time.perf_counter() - started:.1f}s')
+    for name, rebuild in (('counters', counters.rebuild), ('timeline', timeline.rebuild),
+                          ('search index', fulltext.rebuild), ('trending', trending.rebuild)):
+        started = time.perf_counter()
+        rebuild(db)
+        log(f'rebuilt {name} in {time.perf_counter() - started:.1f}s')
+    db.execute('ANALYZE')
+    db.commit()
+    for table in ('users', 'followers', 'posts', 'likes', 'comments', 'stories', 'notifications'):
+        log(f'{table:>14}: {db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]}')
+    db.close()
+
+
+def add_arguments(parser):
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--follows', type=int, default=50, help='Mean accounts followed per user.')
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--likes', type=int, default=200000)
+    parser.add_argument('--comments', type=int, default=40000)
+    parser.add_argument('--stories', type=int, default=500)
+    parser.add_argument('--notifications', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=30, help='Age of the oldest activity.')
+    parser.add_argument('--alpha', type=float, default=1.2, help='Pareto shape; lower is more skewed.')
+    parser.add_argument('--seed', type=int, default=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--out', required=True, help='Database file to create (overwritten).')
+    args = parser.parse_args()
+    generate(args.out, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+"""Drive the app with concurrent logged-in clients and report latency percentiles.
+
+    python bench/load.py --clients 16 --duration 30                 # fresh dataset, in-process app
+    python bench/load.py --db /tmp/bench.db --save baseline.json    # reuse a dataset (dataset.py)
+    python bench/load.py --db /tmp/bench.db --compare baseline.json
+    python bench/load.py --db /tmp/bench.db --url http://127.0.0.1:8000   # a running server on that db
+    python bench/load.py --db /tmp/bench.db --hot-posts 3 --mix like=60  # a like storm on a few viral posts
+
+Each client logs in as a random user<N> and then loops over a weighted mix
+of feed, profile, search, like, comment and notification-count requests
+(weights from MIX, or --mix).
+Without --url the real Flask app is called in-process through its test
+client, one thread per client; with --url requests go over HTTP, so the
+server's workers (gunicorn, gevent, ...) are measured as deployed.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dataset
+
+# name -> relative weight in the request mix
+MIX = {
+    'feed': 30,
+    'feed_page': 10,
+    'profile': 15,
+    'search': 10,
+    'like': 15,
+    'comment': 5,
+    'notification_count': 15,
+}
+
+
+class InProcessClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, form=None, body=None):
+        response = self.client.open(path, method=method, data=form, json=body)
+        response.close()
+        return response.status_code, response.get_json(silent=True) if response.is_json else None
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+                                                  _NoRedirect)
+
+    def request(self, method, path, form=None, body=None):
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                payload = response.read()
+                status = response.status
+                is_json = response.headers.get_content_type() == 'application/json'
+        except urllib.error.HTTPError as e:
+            payload, status, is_json = e.read(), e.code, False
+        return status, json.loads(payload) if is_json else None
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Sample:
+    """Users, posts and search words to draw request parameters from."""
+
+    def __init__(self, path, hot_posts=0):
+        db = sqlite3.connect(path)
+        self.usernames = [r[0] for r in db.execute('SELECT username FROM users')]
+        self.user_ids = [r[0] for r in db.execute('SELECT id FROM users')]
+        # Engagement targets recent posts, as on a live site
+        self.post_ids = [r[0] for r in db.execute('SELECT id FROM posts ORDER BY id DESC LIMIT 2000')]
+        # Likes concentrated on a few posts when asked (a post going viral)
+        self.like_ids = self.post_ids[:hot_posts] if hot_posts else self.post_ids
+        db.close()
+
+
+def step(client, name, sample, rng, state):
+    """Issue one request of the named kind; returns the HTTP status."""
+    if name == 'feed':
+        return client.request('GET', '/')[0]
+    if name == 'feed_page':
+        cursor = state.get('cursor')
+        status, data = client.request('GET', '/api/feed' + (f'?cursor={cursor}' if cursor else ''))
+        state['cursor'] = (data or {}).get('next_cursor')
+        return status
+    if name == 'profile':
+        return client.request('GET', f'/profile/{rng.choice(sample.usernames)}')[0]
+    if name == 'search':
+        return client.request('GET', '/search?q=' + urllib.parse.quote(rng.choice(dataset.WORDS)[:4]))[0]
+    if name == 'like':
+        return client.request('POST', f'/api/posts/{rng.choice(sample.like_ids)}/like', body={})[0]
+    if name == 'comment':
+        return client.request('POST', f'/api/comments/{rng.choice(sample.post_ids)}',
+                              body={'content': dataset.text(rng, 1, 6)})[0]
+    if name == 'notification_count':
+        return client.request('GET', '/notifications/count')[0]
+    raise ValueError(name)
+
+
+def run_client(make_client, sample, args, seed, deadline, results, lock):
+    rng = random.Random(seed)
+    client = make_client()
+    status, _ = client.request('POST', '/login', form={'username': rng.choice(sample.usernames),
+                                                       'password': dataset.PASSWORD})
+    if status != 302:
+        raise RuntimeError(f'login failed with HTTP {status}')
+    names, weights = zip(*args.mix.items())
+    state, local = {}, []
+    done = 0
+    while time.perf_counter() < deadline and (not args.requests or done < args.requests):
+        name = rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            ok = step(client, name, sample, rng, state) < 400
+        except Exception:
+            ok = False
+        local.append((name, time.perf_counter() - started, ok))
+        done += 1
+    with lock:
+        results.extend(local)
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(results, elapsed):
+    by_name = {}
+    for name, seconds, ok in results:
+        by_name.setdefault(name, []).append((seconds, ok))
+    by_name['total'] = [(seconds, ok) for _, seconds, ok in results]
+    summary = {}
+    for name, rows in by_name.items():
+        latencies = sorted(seconds for seconds, _ in rows)
+        summary[name] = {
+            'requests': len(rows),
+            'errors': sum(1 for _, ok in rows if not ok),
+            'rps': len(rows) / elapsed,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': latencies[-1] * 1000 if latencies else 0.0,
+        }
+    return summary
+
+
+def report(summary, baseline=None):
+    print(f'{"endpoint":<20} {"requests":>8} {"errors":>6} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+          f'{"p99 ms":>8} {"max ms":>8}')
+    for name in sorted(summary, key=lambda n: (n == 'total', n)):
+        s = summary[name]
+        print(f'{name:<20} {s["requests"]:>8} {s["errors"]:>6} {s["rps"]:>8.1f} {s["p50_ms"]:>8.2f} '
+              f'{s["p95_ms"]:>8.2f} {s["p99_ms"]:>8.2f} {s["max_ms"]:>8.2f}')
+        old = (baseline or {}).get(name)
+        if old:
+            change = lambda key: (s[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+            print(f'{"  vs baseline":<20} {"":>8} {"":>6} {change("rps"):>+7.0f}% {change("p50_ms"):>+7.0f}% '
+                  f'{change("p95_ms"):>+7.0f}% {change("p99_ms"):>+7.0f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='Dataset from dataset.py; generated into a temp dir if omitted.')
+    parser.add_argument('--url', help='Base URL of a running server using --db; in-process if omitted.')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds to run.')
+    parser.add_argument('--requests', type=int, default=0, help='Stop each client after this many requests.')
+    parser.add_argument('--save', help='Write the summary as JSON (a baseline for --compare).')
+    parser.add_argument('--compare', help='Show changes against a summary saved with --save.')
+    parser.add_argument('--hot-posts', type=int, default=0, help='Send every like to the N newest posts.')
+    parser.add_argument('--mix', default='', help='Override MIX weights, e.g. like=60,search=0.')
+    dataset.add_arguments(parser)
+    args = parser.parse_args()
+    mix = dict(MIX)
+    for part in filter(None, args.mix.split(',')):
+        name, _, weight = part.partition('=')
+        if name not in MIX or not weight.isdigit():
+            parser.error(f'--mix: expected name=weight with name one of {", ".join(MIX)}, got {part!r}')
+        mix[name] = int(weight)
+    args.mix = {name: weight for name, weight in mix.items() if weight}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = args.db
+        if path is None:
+            path = os.path.join(workdir, 'bench.db')
+            dataset.generate(path, args)
+        sample = Sample(path, args.hot_posts)
+
+        if args.url:
+            make_client = lambda: HttpClient(args.url)
+        else:
+            import database
+            from app import app
+            database.DATABASE = os.path.abspath(path)
+            make_client = lambda: InProcessClient(app)
+
+        results, lock = [], threading.Lock()
+        started = time.perf_counter()
+        deadline = started + args.duration
+        threads = [threading.Thread(target=run_client,
+                                    args=(make_client, sample, args, args.seed * 1000 + i, deadline, results, lock))
+                   for i in range(args.clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+    summary = summarize(results, elapsed)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['summary']
+    print(f'{args.clients} clients, {elapsed:.1f}s, {"HTTP " + args.url if args.url else "in-process"}')
+    report(summary, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'clients': args.clients, 'duration': elapsed, 'url': args.url, 'summary': summary}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Compare the old GROUP BY trending query with the incremental top-K read.
+
+    python bench/trending.py --users 2000 --posts 20000 --likes 200000 --comments 40000
+
+Builds a synthetic dataset in a temporary database, then times both reads.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import trending
+
+OLD_QUERY = '''
+    SELECT p.*, u.username, u.avatar_color,
+           COUNT(l.user_id) as like_count,
+           (SELECT COUNT(*) FROM comments WHERE post_id=p.id) as comment_count,
+           EXISTS(SELECT 1 FROM likes WHERE post_id=p.id AND user_id=?) as user_liked
+    FROM posts p
+    JOIN users u ON p.user_id = u.id
+    LEFT JOIN likes l ON l.post_id = p.id
+    WHERE datetime(p.created_at) > datetime('now', '-7 days')
+    GROUP BY p.id
+    ORDER BY like_count DESC
+    LIMIT 12
+'''
+
+
+def timestamp(rng, max_age):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - rng.uniform(0, max_age)))
+
+
+def populate(db, args, rng):
+    db.executemany('INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)',
+                   [(i, f'user{i}', '-') for i in range(1, args.users + 1)])
+    db.executemany('INSERT INTO posts (id, user_id, content, created_at) VALUES (?, ?, ?, ?)',
+                   [(i, rng.randint(1, args.users), f'post {i}', timestamp(rng, 14 * 86400))
+                    for i in range(1, args.posts + 1)])
+    # Skewed towards low ids so a few posts collect most of the engagement
+    pick = lambda: min(int(rng.paretovariate(1.2)), args.posts)
+    db.executemany('INSERT OR IGNORE INTO likes (user_id, post_id, created_at) VALUES (?, ?, ?)',
+                   [(rng.randint(1, args.users), pick(), timestamp(rng, 7 * 86400))
+                    for _ in range(args.likes)])
+    db.executemany('INSERT INTO comments (post_id, user_id, content, created_at) VALUES (?, ?, ?, ?)',
+                   [(pick(), rng.randint(1, args.users), 'nice', timestamp(rng, 7 * 86400))
+                    for _ in range(args.comments)])
+    db.commit()
+
+
+def bench(label, fn, runs):
+    fn()
+    started = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    per_call = (time.perf_counter() - started) / runs * 1000
+    print(f'{label:<28} {per_call:10.3f} ms/call')
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=20000)
+    parser.add_argument('--likes', type=int, default=200000)
+    parser.add_argument('--comments', type=int, default=40000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DATABASE = os.path.join(workdir, 'social.db')
+        database.init_db()
+        database.migrate_db()
+        db = database._connect(database.DATABASE)
+        populate(db, args, random.Random(args.seed))
+
+        started = time.perf_counter()
+        trending.rebuild(db)
+        print(f'{"rebuild (one-off)":<28} {(time.perf_counter() - started) * 1000:10.3f} ms')
+
+        old = bench('old GROUP BY query', lambda: db.execute(OLD_QUERY, (1,)).fetchall(), args.runs)
+        new = bench('trending.top_posts', lambda: trending.top_posts(db, 1), args.runs)
+
+        def like_write():
+            trending.record(db, random.randint(1, args.posts), 'like')
+            db.commit()
+        bench('trending.record + commit', like_write, args.runs)
+        print(f'speedup: {old / new:.0f}x')
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""Coalesced writes for like and follow toggles.
+
+A toggle used to be its own transaction: SELECT, INSERT/DELETE, a post
+lookup, the notification, COMMIT and a count, with an fsync each and every
+worker queued on SQLite's single writer. With WRITE_COALESCING on (the
+default) a toggle instead
+
+  1. works out the new state from this worker's pending intents, falling
+     back to a read connection, and records the intent "actor likes/follows
+     target = on/off" in memory;
+  2. answers at once with that state and a like count adjusted by the
+     pending intents (optimistic);
+  3. is applied by a flusher thread together with everything else that
+     arrived within FLUSH_INTERVAL, in one transaction: repeated taps on the
+     same target collapse into their final state, INSERT OR IGNORE/DELETE
+     make replays harmless, and a viral post gets one post_stats and one
+     post_scores upsert per batch instead of one per like.
+
+Durability: a toggle is acknowledged before it is committed. What can be
+lost is the intents of one worker from the last FLUSH_INTERVAL plus one
+batch if that worker is killed (SIGKILL, OOM, power loss); a normal exit
+flushes first, and a batch that fails is retried one intent at a time so
+one bad intent (a deleted post) cannot take the others with it. Other
+workers see a toggle once it is committed, at most FLUSH_INTERVAL plus
+commit time later; stats() and /metrics report the worst and average lag
+from enqueue to commit. Two workers toggling the same pair in the same
+window each read the committed state, so the second toggle can repeat the
+first rather than undo it. With WRITE_COALESCING=0 every toggle is applied
+and committed synchronously, inside the request.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+import counters
+import database
+import events
+import notifications
+import recommendations
+import timeline
+import trending
+
+ENABLED = os.environ.get('WRITE_COALESCING', '1') == '1'
+FLUSH_INTERVAL = float(os.environ.get('WRITE_FLUSH_MS', 5)) / 1000
+MAX_BATCH = 1000            # intents that trigger a flush before the interval is up
+
+LIKED = 'SELECT 1 FROM likes WHERE user_id=? AND post_id=?'
+FOLLOWING = 'SELECT 1 FROM followers WHERE follower_id=? AND following_id=?'
+
+log = logging.getLogger(__name__)
+
+
+class _Batch:
+    def __init__(self):
+        self.intents = {}                   # (pool, kind, actor, target) -> on
+        self.like_deltas = defaultdict(int) # (pool, post_id) -> pending change of like_count
+        self.started = None                 # time.monotonic() of the first intent
+
+    def __len__(self):
+        return len(self.intents)
+
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wake = threading.Event()
+_pending = _Batch()
+_inflight = _Batch()                        # taken by the flusher, not committed yet
+_flusher = None
+_stats = {'intents': 0, 'batches': 0, 'failed': 0, 'lag_seconds_max': 0.0, 'lag_seconds_total': 0.0}
+
+
+def _apply(db, intents):
+    """Apply {(kind, actor, target): on} in db's open transaction. No commit.
+
+    Returns [(user_id, kind, actor, post_id)] notifications to publish after commit.
+    """
+    pushes = []
+    like_deltas = defaultdict(int)
+    authors = {}
+    for (kind, actor, target), on in intents.items():
+        if kind == 'like':
+            if not on:
+                like_deltas[target] -= db.execute('DELETE FROM likes WHERE user_id=? AND post_id=?',
+                                                  (actor, target)).rowcount
+                continue
+            like_deltas[target] += db.execute('INSERT OR IGNORE INTO likes (user_id, post_id) VALUES (?,?)',
+                                              (actor, target)).rowcount
+            if target not in authors:
+                post = db.execute('SELECT user_id FROM posts WHERE id=?', (target,)).fetchone()
+                authors[target] = post['user_id'] if post else None
+            if authors[target] and notifications.notify(db, authors[target], 'like', actor, target):
+                pushes.append((authors[target], 'like', actor, target))
+        elif not on:
+            if db.execute('DELETE FROM followers WHERE follower_id=? AND following_id=?', (actor, target)).rowcount:
+                counters.bump_follow(db, actor, target, -1)
+                timeline.prune(db, actor, target)
+                recommendations.invalidate(db, actor)
+        else:
+            if db.execute('INSERT OR IGNORE INTO followers (follower_id, following_id) VALUES (?,?)',
+                          (actor, target)).rowcount:
+                counters.bump_follow(db, actor, target, 1)
+                timeline.backfill(db, actor, target)
+                recommendations.invalidate(db, actor, target)
+                if notifications.notify(db, target, 'follow', actor):
+                    pushes.append((target, 'follow', actor, None))
+    # One counter and one score update per post, however many likes it got
+    for post_id, delta in like_deltas.items():
+        if delta:
+            counters.bump_post(db, post_id, 'like_count', delta)
+            trending.record(db, post_id, 'like', delta)
+    return pushes
+
+
+def _publish(db, pushes):
+    # Several likes on one post in a batch land in one notification group: push it once, latest actor
+    latest = {(user_id, kind, post_id): actor for user_id, kind, actor, post_id in pushes}
+    for (user_id, kind, post_id), actor in latest.items():
+        events.publish_notification(db, user_id, kind, actor, post_id)
+
+
+def apply_now(db, kind, actor, target, on):
+    """Apply one toggle and commit (the WRITE_COALESCING=0 path)."""
+    pushes = _apply(db, {(kind, actor, target): on})
+    db.commit()
+    _publish(db, pushes)
+
+
+def _settle(pool):
+    """Forget pool's in-flight intents; call under _lock, with their commit."""
+    for batch_map in (_inflight.intents, _inflight.like_deltas):
+        for key in [key for key in batch_map if key[0] is pool]:
+            del batch_map[key]
+
+
+def _commit_group(pool, intents):
+    db = pool.acquire_writer()
+    try:
+        try:
+            pushes = _apply(db, intents)
+            # Readers see a toggle in _inflight or in the tables, never in both
+            with _lock:
+                db.commit()
+                _settle(pool)
+        except Exception:
+            db.rollback()
+            log.exception('coalesced batch of %d failed, retrying one by one', len(intents))
+            pushes = []
+            # Rare; hold the lock throughout rather than settle intent by intent
+            with _lock:
+                for key, on in intents.items():
+                    try:
+                        pushes += _apply(db, {key: on})
+                        db.commit()
+                    except Exception:
+                        db.rollback()
+                        _stats['failed'] += 1
+                        log.exception('dropped %s', key)
+                _settle(pool)
+    finally:
+        pool.release_writer(db)
+    # Pushes only read; don't keep the writer from the requests waiting on it
+    db = pool.acquire_reader()
+    try:
+        _publish(db, pushes)
+    finally:
+        pool.release_reader(db)
+
+
+def flush():
+    """Apply everything pending now (the flusher thread, shutdown, tests)."""
+    global _pending, _inflight
+    with _flush_lock:
+        with _lock:
+            batch, _pending = _pending, _Batch()
+            _inflight = batch
+        if not batch:
+            return
+        groups = defaultdict(dict)
+        for (pool, kind, actor, target), on in batch.intents.items():
+            groups[pool][(kind, actor, target)] = on
+        try:
+            for pool, intents in groups.items():
+                try:
+                    _commit_group(pool, intents)
+                except Exception:
+                    log.exception('coalesced batch of %d lost', len(intents))
+        finally:
+            lag = time.monotonic() - batch.started
+            with _lock:
+                _inflight = _Batch()
+                _stats['batches'] += 1
+                _stats['lag_seconds_max'] = max(_stats['lag_seconds_max'], lag)
+                _stats['lag_seconds_total'] += lag
+
+
+def _run():
+    while True:
+        _wake.wait()
+        _wake.clear()
+        # Collect whatever else arrives during the window
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception:
+            log.exception('write flush failed')
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():   # first toggle, or a forked worker
+        with _lock:
+            if _flusher is None or not _flusher.is_alive():
+                _flusher = threading.Thread(target=_run, name='coalesce-flusher', daemon=True)
+                _flusher.start()
+
+
+def _current(db, sql, kind, actor, target):
+    """Whether the pair is on, as this worker will see it once its pending writes land."""
+    key = (database.get_pool(), kind, actor, target)
+    with _lock:
+        for batch in (_pending, _inflight):
+            if key in batch.intents:
+                return batch.intents[key]
+    return db.execute(sql, (actor, target)).fetchone() is not None
+
+
+def _enqueue(kind, actor, target, on):
+    pool = database.get_pool()
+    with _lock:
+        batch = _pending
+        batch.intents.pop((pool, kind, actor, target), None)   # re-insert: apply in arrival order
+        batch.intents[(pool, kind, actor, target)] = on
+        if kind == 'like':
+            batch.like_deltas[(pool, target)] += 1 if on else -1
+        if batch.started is None:
+            batch.started = time.monotonic()
+        _stats['intents'] += 1
+        full = len(batch) >= MAX_BATCH
+    _ensure_flusher()
+    _wake.set()
+    if full:
+        flush()
+
+
+def _like_count(db, post_id):
+    """post_id's like count, as it will be once this worker's pending writes land."""
+    key = (database.get_pool(), post_id)
+    # Read under the lock the flusher commits with, so no batch is counted twice
+    with _lock:
+        count = counters.get_post_counts(db, post_id)['like_count']
+        return count + _pending.like_deltas.get(key, 0) + _inflight.like_deltas.get(key, 0)
+
+
+def toggle_like(uid, post_id):
+    """Flip uid's like on post_id. Returns (liked, like_count)."""
+    if not ENABLED:
+        db = database.get_db()
+        liked = not _current(db, LIKED, 'like', uid, post_id)
+        apply_now(db, 'like', uid, post_id, liked)
+        return liked, counters.get_post_counts(db, post_id)['like_count']
+    db = database.get_read_db()
+    liked = not _current(db, LIKED, 'like', uid, post_id)
+    _enqueue('like', uid, post_id, liked)
+    return liked, max(_like_count(db, post_id), 0)
+
+
+def toggle_follow(uid, user_id):
+    """Flip whether uid follows user_id. Returns the new state."""
+    if not ENABLED:
+        db = database.get_db()
+        following = not _current(db, FOLLOWING, 'follow', uid, user_id)
+        apply_now(db, 'follow', uid, user_id, following)
+        return following
+    following = not _current(database.get_read_db(), FOLLOWING, 'follow', uid, user_id)
+    _enqueue('follow', uid, user_id, following)
+    return following
+
+
+def stats():
+    with _lock:
+        result = dict(_stats, pending=len(_pending))
+    result['lag_seconds_avg'] = result['lag_seconds_total'] / result['batches'] if result['batches'] else 0.0
+    return result
+
+
+atexit.register(flush)
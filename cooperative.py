@@ -0,0 +1,117 @@
+"""Worker models, and keeping SQLite off the event loop under gevent.
+
+gunicorn.conf.py picks the worker model from WORKER_MODEL:
+
+    threads (default)  gthread workers x THREADS threads. Every open request
+                       holds a thread, including an idle /notifications/stream
+                       or a client trickling an upload chunk, so a box holds
+                       WEB_CONCURRENCY x THREADS connections.
+    gevent             cooperative workers with WORKER_CONNECTIONS greenlets
+                       each. The gevent worker monkey-patches sockets, sleeps,
+                       locks and queues, so a waiting connection costs a
+                       greenlet (a few KB) instead of a thread and one box
+                       holds thousands of streams and slow clients.
+
+SQLite is a C library gevent cannot patch: a statement, a fetch, a commit or
+a writer waiting out SQLite's busy timeout would freeze every greenlet in
+the worker. While a gevent hub runs, database._connect therefore builds
+connections from the classes below, which run those calls on the hub's
+native thread pool (DB_THREADS threads) and yield until they finish. The
+writer gets a thread of its own (dedicate()), so a like never queues behind
+a slow search while every other writer waits on its lock. Under threads
+nothing changes.
+
+The trade-off: a worker's Python work (routing, templates) runs on one
+greenlet at a time, and each SQLite round trip yields to whatever else is
+runnable. Writes that hold the writer across several statements therefore
+wait behind page renders of other requests, so latency of likes and
+comments goes up under load while the connection count goes up by orders
+of magnitude. Run WEB_CONCURRENCY at about one worker per core; stay on
+threads where few connections are long-lived.
+"""
+import os
+import sqlite3
+
+DB_THREADS = int(os.environ.get('DB_THREADS', 16))
+
+
+def active():
+    """True inside a gevent-patched process (gunicorn -k gevent)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+def _hub_pool():
+    from gevent import get_hub
+    pool = get_hub().threadpool
+    if pool.maxsize < DB_THREADS:
+        pool.maxsize = DB_THREADS
+    return pool
+
+
+def blocking(fn, *args):
+    """fn(*args), on the thread pool when cooperative, for CPU-heavy calls that
+    release the GIL (password hashing)."""
+    return _hub_pool().apply(fn, args) if active() else fn(*args)
+
+
+def dedicate(db):
+    """Run db's calls on a single thread of its own instead of the shared pool."""
+    if isinstance(db, Connection):
+        from gevent.threadpool import ThreadPool
+        db._threadpool = ThreadPool(1)
+
+
+class Cursor(sqlite3.Cursor):
+    def _offload(self, fn, *args):
+        return self.connection._offload(fn, *args)
+
+    def execute(self, sql, parameters=()):
+        return self._offload(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._offload(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return self._offload(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._offload(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._offload(super().fetchall)
+
+    def __next__(self):
+        row = self._offload(super().fetchone)
+        if row is None:
+            raise StopIteration
+        return row
+
+
+class Connection(sqlite3.Connection):
+    cursor_class = Cursor
+    _threadpool = None
+
+    def _offload(self, fn, *args):
+        return (self._threadpool or _hub_pool()).apply(fn, args)
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.cursor_class)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, script):
+        return self._offload(super().executescript, script)
+
+    def commit(self):
+        return self._offload(super().commit)
+
+    def rollback(self):
+        return self._offload(super().rollback)
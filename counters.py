@@ -0,0 +1,122 @@
+"""Precomputed like/comment/follower counters.
+
+Every write path that changes likes, comments, follows or posts bumps the
+matching counter inside the same transaction, so listings read counts with a
+single primary-key lookup instead of COUNT(*) over the raw tables.
+"""
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS post_stats (
+        post_id INTEGER PRIMARY KEY,
+        like_count INTEGER NOT NULL DEFAULT 0,
+        comment_count INTEGER NOT NULL DEFAULT 0,
+        version INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE
+    );
+    CREATE TABLE IF NOT EXISTS user_stats (
+        user_id INTEGER PRIMARY KEY,
+        post_count INTEGER NOT NULL DEFAULT 0,
+        followers_count INTEGER NOT NULL DEFAULT 0,
+        following_count INTEGER NOT NULL DEFAULT 0,
+        unread_notifications INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+"""
+
+POST_COLUMNS = ('like_count', 'comment_count')
+USER_COLUMNS = ('post_count', 'followers_count', 'following_count', 'unread_notifications')
+
+
+def _bump(db, table, key, key_id, column, delta, extra=''):
+    db.execute(f'''
+        INSERT INTO {table} ({key}, {column}) VALUES (?, MAX(?, 0))
+        ON CONFLICT({key}) DO UPDATE SET {column} = MAX({column} + ?, 0){extra}
+    ''', (key_id, delta, delta))
+
+
+def bump_post(db, post_id, column, delta):
+    """Add delta to a post counter (like_count / comment_count). No commit.
+
+    Also bumps post_stats.version, which keys the cached feed card (fragments.py).
+    """
+    if column not in POST_COLUMNS:
+        raise ValueError(column)
+    _bump(db, 'post_stats', 'post_id', post_id, column, delta, ', version = version + 1')
+
+
+def touch_posts(db, where_clause, params):
+    """Bump the version of posts whose rendering changed without a counter change. No commit."""
+    db.execute(f'UPDATE post_stats SET version = version + 1 WHERE post_id IN ({where_clause})', params)
+
+
+def bump_user(db, user_id, column, delta):
+    """Add delta to a user counter (post_count / followers_count / following_count /
+    unread_notifications). No commit."""
+    if column not in USER_COLUMNS:
+        raise ValueError(column)
+    _bump(db, 'user_stats', 'user_id', user_id, column, delta)
+
+
+def bump_follow(db, follower_id, following_id, delta):
+    bump_user(db, follower_id, 'following_count', delta)
+    bump_user(db, following_id, 'followers_count', delta)
+
+
+def get_post_counts(db, post_id):
+    row = db.execute('SELECT like_count, comment_count FROM post_stats WHERE post_id=?',
+                     (post_id,)).fetchone()
+    return dict(row) if row else {'like_count': 0, 'comment_count': 0}
+
+
+def get_user_counts(db, user_id):
+    row = db.execute('SELECT post_count, followers_count, following_count FROM user_stats WHERE user_id=?',
+                     (user_id,)).fetchone()
+    return dict(row) if row else {'post_count': 0, 'followers_count': 0, 'following_count': 0}
+
+
+# Ground truth, computed from the raw tables
+_POST_TRUTH = '''
+    SELECT p.id AS post_id,
+           (SELECT COUNT(*) FROM likes WHERE post_id = p.id) AS like_count,
+           (SELECT COUNT(*) FROM comments WHERE post_id = p.id) AS comment_count
+    FROM posts p
+'''
+_USER_TRUTH = '''
+    SELECT u.id AS user_id,
+           (SELECT COUNT(*) FROM posts WHERE user_id = u.id) AS post_count,
+           (SELECT COUNT(*) FROM followers WHERE following_id = u.id) AS followers_count,
+           (SELECT COUNT(*) FROM followers WHERE follower_id = u.id) AS following_count,
+           (SELECT COUNT(*) FROM notifications WHERE user_id = u.id AND is_read = 0) AS unread_notifications
+    FROM users u
+'''
+
+
+def rebuild(db):
+    """Recompute every counter from scratch and commit."""
+    # Upsert rather than delete, so versions only move forward and cached cards stay valid
+    db.execute('DELETE FROM post_stats WHERE post_id NOT IN (SELECT id FROM posts)')
+    db.execute(f'''
+        INSERT INTO post_stats (post_id, like_count, comment_count) {_POST_TRUTH} WHERE true
+        ON CONFLICT(post_id) DO UPDATE SET like_count = excluded.like_count,
+            comment_count = excluded.comment_count, version = version + 1
+    ''')
+    db.execute('DELETE FROM user_stats')
+    db.execute(f'INSERT INTO user_stats (user_id, {", ".join(USER_COLUMNS)}) {_USER_TRUTH}')
+    db.commit()
+
+
+def verify(db):
+    """Return a list of (table, id, column, stored, actual) for every drifted counter."""
+    drift = []
+    for table, key, truth, columns in (
+        ('post_stats', 'post_id', _POST_TRUTH, POST_COLUMNS),
+        ('user_stats', 'user_id', _USER_TRUTH, USER_COLUMNS),
+    ):
+        stored = {r[key]: r for r in db.execute(f'SELECT * FROM {table}').fetchall()}
+        for actual in db.execute(truth).fetchall():
+            row = stored.get(actual[key])
+            for col in columns:
+                have = row[col] if row else 0
+                if have != actual[col]:
+                    drift.append((table, actual[key], col, have, actual[col]))
+    return drift
@@ -1,26 +1,226 @@
+import os
+import queue
 import sqlite3
+import threading
+import time
 from flask import g
+import counters
+import timeline
+import events
+import fulltext
+import trending
+import recommendations
+import jobs
+import uploads
+import media
+import stories
+import notifications
+import sessions
+import profiling
+import cooperative
+import dialect
+import pgsql
 
-DATABASE = 'social.db'
+# A SQLite file path, or a postgresql:// URL (see pgsql.py and dialect.py)
+DATABASE = os.environ.get('DATABASE_URL', 'social.db')
 
-def get_db():
-    db = getattr(g, '_database', None)
-    if db is None:
-        db = g._database = sqlite3.connect(
-            DATABASE,
-            timeout=10,                    # чекати 10с якщо БД зайнята
-            check_same_thread=False
-        )
-        db.row_factory = sqlite3.Row
+READ_POOL_SIZE = 8                 # idle read-only connections kept per process
+READ_CACHE_KB = 32 * 1024          # page cache per reader
+READ_MMAP_BYTES = 256 * 1024 * 1024
+WRITE_POOL_SIZE = 8                # idle read-write connections kept per process (PostgreSQL)
+
+# Optional sqlite3 trace callback installed on every checked-out connection (see querycheck.py)
+trace_callback = None
+
+_connection_classes = {}
+
+def _connection_class():
+    """sqlite3.Connection, extended to time statements (PROFILING=1) and/or to run
+    them off the event loop (gevent workers, see cooperative.py)."""
+    layers = tuple(m for m, on in ((profiling, profiling.ENABLED), (cooperative, cooperative.active())) if on)
+    if not layers:
+        return sqlite3.Connection
+    cls = _connection_classes.get(layers)
+    if cls is None:
+        # Profiling goes outermost: it times the offloaded call from the request's greenlet
+        cursor = type('Cursor', tuple(m.Cursor for m in layers), {})
+        cls = _connection_classes[layers] = type('Connection', tuple(m.Connection for m in layers),
+                                                 {'cursor_class': cursor})
+    return cls
+
+def _connect(path):
+    if dialect.is_postgres_url(path):
+        return pgsql.connect(path)
+    db = sqlite3.connect(
+        path,
+        timeout=10,                    # чекати 10с якщо БД зайнята
+        check_same_thread=False,
+        factory=_connection_class(),
+    )
+    db.row_factory = sqlite3.Row
+    return db
+
+class ConnectionPool:
+    """Per-process SQLite connections: a pool of readers and one serialized writer.
+
+    Connections are configured once when opened. Readers are query_only with a
+    larger page cache and mmap; the writer is handed to one request at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self._readers = queue.LifoQueue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'readers_opened': 0, 'readers_closed': 0, 'reader_checkouts': 0,
+            'reader_reuses': 0, 'readers_in_use': 0,
+            'writer_checkouts': 0, 'writer_wait_seconds': 0.0,
+        }
+
+    def _count(self, key, delta=1):
+        with self._stats_lock:
+            self.stats[key] += delta
+
+    def _open_reader(self):
+        db = _connect(self.path)
+        db.execute("PRAGMA query_only = ON")
+        db.execute(f"PRAGMA cache_size = -{READ_CACHE_KB}")
+        db.execute(f"PRAGMA mmap_size = {READ_MMAP_BYTES}")
+        db.execute("PRAGMA temp_store = MEMORY")
+        self._count('readers_opened')
+        return db
+
+    def _open_writer(self):
+        db = _connect(self.path)
+        cooperative.dedicate(db)
         db.execute("PRAGMA foreign_keys = ON")
         db.execute("PRAGMA journal_mode = WAL")   # WAL дозволяє паралельні читання
         db.execute("PRAGMA synchronous = NORMAL")
+        return db
+
+    def acquire_reader(self):
+        try:
+            db = self._readers.get_nowait()
+            self._count('reader_reuses')
+        except queue.Empty:
+            db = self._open_reader()
+        self._count('reader_checkouts')
+        self._count('readers_in_use')
+        db.set_trace_callback(trace_callback)
+        return db
+
+    def release_reader(self, db):
+        self._count('readers_in_use', -1)
+        if db.in_transaction:
+            db.rollback()
+        if self._readers.qsize() < READ_POOL_SIZE:
+            self._readers.put(db)
+        else:
+            db.close()
+            self._count('readers_closed')
+
+    def acquire_writer(self):
+        started = time.perf_counter()
+        self._writer_lock.acquire()
+        self._count('writer_wait_seconds', time.perf_counter() - started)
+        self._count('writer_checkouts')
+        if self._writer is None:
+            self._writer = self._open_writer()
+        self._writer.set_trace_callback(trace_callback)
+        return self._writer
+
+    def release_writer(self, db):
+        try:
+            if db.in_transaction:
+                db.rollback()
+        finally:
+            self._writer_lock.release()
+
+    def snapshot(self):
+        with self._stats_lock:
+            return dict(self.stats, readers_idle=self._readers.qsize())
+
+class PostgresPool(ConnectionPool):
+    """Per-process PostgreSQL connections. The server takes concurrent writers,
+    so read-write connections are pooled like readers instead of serialized."""
+
+    def __init__(self, url):
+        super().__init__(url)
+        self._writers = queue.LifoQueue()
+
+    def _open_reader(self):
+        self._count('readers_opened')
+        return pgsql.connect(self.path, readonly=True)
+
+    def _open_writer(self):
+        return pgsql.connect(self.path)
+
+    def acquire_writer(self):
+        try:
+            db = self._writers.get_nowait()
+        except queue.Empty:
+            db = self._open_writer()
+        self._count('writer_checkouts')
+        db.set_trace_callback(trace_callback)
+        return db
+
+    def release_writer(self, db):
+        if db.in_transaction:
+            db.rollback()
+        if self._writers.qsize() < WRITE_POOL_SIZE:
+            self._writers.put(db)
+        else:
+            db.close()
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool():
+    """The pool for the current DATABASE path, recreated after a fork."""
+    with _pools_lock:
+        pool = _pools.get(DATABASE)
+        if pool is None or pool.pid != os.getpid():
+            backend = PostgresPool if dialect.is_postgres_url(DATABASE) else ConnectionPool
+            pool = _pools[DATABASE] = backend(DATABASE)
+        return pool
+
+def pool_stats():
+    return get_pool().snapshot()
+
+def get_db():
+    """Read-write connection for this request (the process-wide serialized writer)."""
+    db = getattr(g, '_database', None)
+    if db is None:
+        db = g._database = get_pool().acquire_writer()
+        g._database_pool = get_pool()
+    return db
+
+def get_read_db():
+    """Read-only pooled connection for requests that never write."""
+    db = getattr(g, '_read_database', None)
+    if db is None:
+        db = g._read_database = get_pool().acquire_reader()
+        g._read_database_pool = get_pool()
     return db
 
+def release_db():
+    """Hand this request's writer back before teardown, once it has committed.
+
+    Anything still uncommitted is rolled back; a later get_db() checks it out again.
+    """
+    db = g.pop('_database', None)
+    if db is not None:
+        g.pop('_database_pool').release_writer(db)
+
 def close_connection(exception):
-    db = getattr(g, '_database', None)
+    """Return this request's connections to their pool (registered as a teardown in app.py)."""
+    release_db()
+    db = g.pop('_read_database', None)
     if db is not None:
-        db.close()
+        g.pop('_read_database_pool').release_reader(db)
 
 def init_db():
     from app import app
@@ -106,16 +306,126 @@ def init_db():
             );
         """)
         db.commit()
-        app.teardown_appcontext(close_connection)
+
+def _column_exists(db, table, column):
+    return dialect.of(db).column_exists(db, table, column)
+
+def _m001_avatar_img(db):
+    if not _column_exists(db, 'users', 'avatar_img'):
+        db.execute("ALTER TABLE users ADD COLUMN avatar_img TEXT DEFAULT ''")
+
+def _m002_counters(db):
+    db.executescript(counters.SCHEMA)
+    counters.rebuild(db)
+
+def _m003_indexes(db):
+    db.executescript("""
+        CREATE INDEX IF NOT EXISTS idx_posts_user_created ON posts(user_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_posts_created ON posts(created_at);
+        CREATE INDEX IF NOT EXISTS idx_post_media_post ON post_media(post_id, position);
+        CREATE INDEX IF NOT EXISTS idx_likes_post ON likes(post_id);
+        CREATE INDEX IF NOT EXISTS idx_comments_post_created ON comments(post_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_followers_following ON followers(following_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_followers_follower ON followers(follower_id, created_at);
+        CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id, is_read, created_at);
+        CREATE INDEX IF NOT EXISTS idx_stories_expires ON stories(expires_at);
+        CREATE INDEX IF NOT EXISTS idx_stories_user ON stories(user_id, created_at);
+    """)
+
+def _m004_timeline(db):
+    db.executescript(timeline.SCHEMA)
+    timeline.rebuild(db)
+
+def _m005_event_log(db):
+    db.executescript(events.SCHEMA)
+
+def _m006_fulltext(db):
+    fulltext.install(db)
+
+def _m007_trending(db):
+    db.executescript(trending.SCHEMA)
+    trending.rebuild(db)
+
+def _m008_recommendations(db):
+    db.executescript(recommendations.SCHEMA)
+
+def _m009_image_variants(db):
+    if not _column_exists(db, 'post_media', 'variants'):
+        db.execute("ALTER TABLE post_media ADD COLUMN variants TEXT DEFAULT ''")
+    if not _column_exists(db, 'users', 'avatar_variants'):
+        db.execute("ALTER TABLE users ADD COLUMN avatar_variants TEXT DEFAULT ''")
+
+def _m010_jobs(db):
+    db.executescript(jobs.SCHEMA)
+
+def _m011_uploads(db):
+    db.executescript(uploads.SCHEMA)
+
+def _m012_blobs(db):
+    db.executescript(media.SCHEMA)
+
+def _m013_post_version(db):
+    if not _column_exists(db, 'post_stats', 'version'):
+        db.execute('ALTER TABLE post_stats ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+def _m014_story_indexes(db):
+    db.executescript(stories.SCHEMA)
+    stories.sweep(db)
+
+def _m015_notification_groups(db):
+    if not _column_exists(db, 'notifications', 'group_key'):
+        db.execute("ALTER TABLE notifications ADD COLUMN group_key TEXT NOT NULL DEFAULT ''")
+        db.execute('ALTER TABLE notifications ADD COLUMN actor_count INTEGER NOT NULL DEFAULT 1')
+    if not _column_exists(db, 'user_stats', 'unread_notifications'):
+        db.execute('ALTER TABLE user_stats ADD COLUMN unread_notifications INTEGER NOT NULL DEFAULT 0')
+    db.executescript(notifications.SCHEMA)
+    notifications.merge_existing(db)
+    db.executescript(notifications.GROUP_INDEX)
+    counters.rebuild(db)
+
+def _m016_sessions(db):
+    if not _column_exists(db, 'users', 'version'):
+        db.execute('ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+    db.executescript(sessions.SCHEMA)
+
+# Append-only: the position in this list is the schema version (PRAGMA user_version,
+# or the schema_version table on PostgreSQL)
+MIGRATIONS = [
+    ('add users.avatar_img', _m001_avatar_img),
+    ('post_stats/user_stats counters', _m002_counters),
+    ('secondary indexes', _m003_indexes),
+    ('home timeline fan-out table', _m004_timeline),
+    ('cross-worker event log', _m005_event_log),
+    ('FTS5 search index', _m006_fulltext),
+    ('time-decayed trending scores', _m007_trending),
+    ('cached follow recommendations', _m008_recommendations),
+    ('resized image variants', _m009_image_variants),
+    ('background job queue', _m010_jobs),
+    ('chunked uploads', _m011_uploads),
+    ('content-addressed media blobs', _m012_blobs),
+    ('post_stats.version for cached cards', _m013_post_version),
+    ('story ring indexes, sweep expired stories', _m014_story_indexes),
+    ('grouped notifications, unread counter', _m015_notification_groups),
+    ('server-side sessions, users.version', _m016_sessions),
+]
+
+def schema_version(db):
+    return dialect.of(db).schema_version(db)
+
+def run_migrations(db):
+    """Apply every migration newer than the stored user_version, in order."""
+    version = schema_version(db)
+    for number, (name, migrate) in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        migrate(db)
+        dialect.of(db).set_schema_version(db, number)
+        db.commit()
+        print(f"Migration {number}: {name}")
+    return schema_version(db)
 
 def migrate_db():
-    """Run migrations for new columns."""
+    """Bring the schema up to the latest version."""
     from app import app
     with app.app_context():
-        db = get_db()
-        try:
-            db.execute("ALTER TABLE users ADD COLUMN avatar_img TEXT DEFAULT ''")
-            db.commit()
-            print("Migration: added avatar_img column")
-        except Exception:
-            pass  # already exists
\ No newline at end of file
+        run_migrations(get_db())
@@ -0,0 +1,285 @@
+"""SQL dialects: the application's SQL is written for SQLite, this adapts it.
+
+Every query in the tree is plain SQLite SQL with ? placeholders, and on
+SQLite it runs untouched. The PostgreSQL backend (pgsql.py) passes each
+statement through Postgres.translate() once (cached), which rewrites the
+handful of constructs the two disagree on:
+
+    ?                              %s (and a literal % doubled)
+    INSERT OR IGNORE INTO t ...    INSERT INTO t ... ON CONFLICT DO NOTHING
+    datetime('now')                LOCALTIMESTAMP(0), in UTC like SQLite's
+    datetime('now', ?)             LOCALTIMESTAMP(0) + CAST(? AS INTERVAL)
+    datetime(?, 'unixepoch')       the epoch seconds as a UTC TIMESTAMP(0)
+    MAX(a, b) / MIN(a, b)          GREATEST(a, b) / LEAST(a, b)
+    a IS ? / a IS NOT ?            a IS [NOT] DISTINCT FROM ?
+    DO UPDATE SET c = c + 1        DO UPDATE SET c = t.c + 1 (Postgres would
+                                   call the bare column ambiguous)
+    INTEGER PRIMARY KEY AUTOINCREMENT, REAL, BLOB, WITHOUT ROWID
+                                   SERIAL PRIMARY KEY, DOUBLE PRECISION,
+                                   BYTEA, nothing
+
+What cannot be rewritten mechanically asks the dialect instead of the SQL:
+the schema version (PRAGMA user_version), column and table introspection,
+FOR UPDATE SKIP LOCKED for the job queue, taking a write lock up front
+(lock_for_write), and full-text search
+(fulltext.py keeps an FTS5 and a tsvector implementation). of(db) tells
+which dialect a connection speaks.
+"""
+import functools
+import re
+
+# String literals, quoted identifiers and comments are never rewritten
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*")
+_MARK = '\x00{}\x00'
+_MARKED = re.compile('\x00(\\d+)\x00')
+_IDENTIFIER = re.compile(r'(?<![\w.%\x00])([A-Za-z_]\w*)(?![\w.\x00]|\s*\()')
+_KEYWORDS = {'and', 'or', 'not', 'null', 'is', 'in', 'case', 'when', 'then', 'else', 'end',
+             'true', 'false', 'excluded', 'between', 'like', 'as', 'distinct', 'where', 'returning'}
+
+
+def is_postgres_url(target):
+    return target.startswith(('postgres://', 'postgresql://'))
+
+
+def _mask(sql):
+    literals = []
+
+    def keep(match):
+        literals.append(match.group())
+        return _MARK.format(len(literals) - 1)
+    return _LITERAL.sub(keep, sql), literals
+
+
+def _unmask(sql, literals):
+    return _MARKED.sub(lambda m: literals[int(m.group(1))], sql)
+
+
+def _call(sql, start):
+    """For the '(' at start: (index after the matching ')', [top-level arguments])."""
+    depth, args, begin = 0, [], start + 1
+    for i in range(start, len(sql)):
+        c = sql[i]
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+            if depth == 0:
+                args.append(sql[begin:i].strip())
+                return i + 1, args
+        elif c == ',' and depth == 1:
+            args.append(sql[begin:i].strip())
+            begin = i + 1
+    raise ValueError(f'unbalanced parentheses in {sql!r}')
+
+
+def _rewrite_calls(sql, name, rewrite):
+    """Replace every name(...) call whose rewrite(args) is not None."""
+    pattern = re.compile(rf'\b{name}\s*\(', re.IGNORECASE)
+    pos = 0
+    while True:
+        match = pattern.search(sql, pos)
+        if not match:
+            return sql
+        end, args = _call(sql, match.end() - 1)
+        replacement = rewrite(args)
+        if replacement is None:
+            pos = match.end()
+        else:
+            sql = sql[:match.start()] + replacement + sql[end:]
+            pos = match.start() + len(replacement)
+
+
+class SQLite:
+    name = 'sqlite'
+    skip_locked = ''
+    snapshot = 'BEGIN'          # a read transaction sees one WAL snapshot
+
+    @staticmethod
+    def translate(sql):
+        return sql
+
+    @staticmethod
+    def lock_for_write(db, table):
+        """Start a transaction that holds the write lock before its first read."""
+        db.execute('BEGIN IMMEDIATE')   # SQLite has one lock for the whole database
+
+    @staticmethod
+    def translate_script(script):
+        return script
+
+    @staticmethod
+    def schema_version(db):
+        return db.execute('PRAGMA user_version').fetchone()[0]
+
+    @staticmethod
+    def set_schema_version(db, version):
+        db.execute(f'PRAGMA user_version = {int(version)}')
+
+    @staticmethod
+    def column_exists(db, table, column):
+        return any(r['name'] == column for r in db.execute(f'PRAGMA table_info({table})'))
+
+    @staticmethod
+    def tables(db):
+        """Application tables, each after the tables its foreign keys point to."""
+        rows = db.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table' ORDER BY name").fetchall()
+        virtual = [r['name'] for r in rows if r['sql'].upper().startswith('CREATE VIRTUAL')]
+        # FTS5 tables and their shadow tables are rebuilt, not copied
+        names = [r['name'] for r in rows if not r['name'].startswith('sqlite_')
+                 and not any(r['name'] == v or r['name'].startswith(v + '_') for v in virtual)]
+        parents = {t: {r['table'] for r in db.execute(f'PRAGMA foreign_key_list({t})')} for t in names}
+        return _parents_first(parents)
+
+    @staticmethod
+    def reset_sequences(db, tables):
+        """Nothing to do: SQLite continues AUTOINCREMENT from the largest id."""
+
+
+class Postgres:
+    name = 'postgresql'
+    skip_locked = 'FOR UPDATE SKIP LOCKED'
+    snapshot = 'BEGIN ISOLATION LEVEL REPEATABLE READ READ ONLY'
+
+    @staticmethod
+    def lock_for_write(db, table):
+        """Block other writers to table until commit (readers carry on)."""
+        db.execute(f'LOCK TABLE {table} IN SHARE ROW EXCLUSIVE MODE')
+
+    @staticmethod
+    @functools.lru_cache(maxsize=2048)
+    def translate(sql):
+        masked, literals = _mask(sql)
+        masked = Postgres._common(masked.replace('%', '%%').replace('?', '%s'), literals)
+        # psycopg reads % everywhere, string literals included
+        return _unmask(masked, [literal.replace('%', '%%') for literal in literals])
+
+    @staticmethod
+    def translate_script(script):
+        """For executescript(): no placeholders, several statements."""
+        masked, literals = _mask(script)
+        statements = [Postgres._common(s, literals) for s in masked.split(';')]
+        return _unmask(';'.join(statements), literals)
+
+    @staticmethod
+    def _common(sql, literals):
+        def literal(arg):
+            match = _MARKED.fullmatch(arg)
+            return literals[int(match.group(1))][1:-1].lower() if match else None
+
+        def datetime(args):
+            if len(args) == 1 and literal(args[0]) == 'now':
+                return 'LOCALTIMESTAMP(0)'
+            if len(args) == 2 and literal(args[0]) == 'now':
+                return f'(LOCALTIMESTAMP(0) + CAST({args[1]} AS INTERVAL))'
+            if len(args) == 2 and literal(args[1]) == 'unixepoch':
+                return f"CAST(to_timestamp({args[0]}) AT TIME ZONE 'UTC' AS TIMESTAMP(0))"
+            raise ValueError(f'no PostgreSQL equivalent for datetime({", ".join(args)})')
+
+        sql = _rewrite_calls(sql, 'datetime', datetime)
+        sql = _rewrite_calls(sql, 'MAX', lambda args: f'GREATEST({", ".join(args)})' if len(args) > 1 else None)
+        sql = _rewrite_calls(sql, 'MIN', lambda args: f'LEAST({", ".join(args)})' if len(args) > 1 else None)
+        if re.search(r'\bINSERT\s+OR\s+IGNORE\b', sql, re.IGNORECASE):
+            sql = re.sub(r'\bINSERT\s+OR\s+IGNORE\b', 'INSERT', sql, flags=re.IGNORECASE)
+            returning = re.search(r'\bRETURNING\b', sql, re.IGNORECASE)
+            at = returning.start() if returning else len(sql)
+            sql = f'{sql[:at].rstrip()} ON CONFLICT DO NOTHING {sql[at:]}'.rstrip()
+        sql = re.sub(r'\bIS\s+NOT\s+(?=%s)', 'IS DISTINCT FROM ', sql, flags=re.IGNORECASE)
+        sql = re.sub(r'\bIS\s+(?=%s)', 'IS NOT DISTINCT FROM ', sql, flags=re.IGNORECASE)
+        sql = Postgres._qualify_upsert(sql)
+        # DDL
+        sql = re.sub(r'\bINTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT\b', 'SERIAL PRIMARY KEY', sql, flags=re.IGNORECASE)
+        sql = re.sub(r'\)\s*WITHOUT\s+ROWID\b', ')', sql, flags=re.IGNORECASE)
+        sql = re.sub(r'\bREAL\b', 'DOUBLE PRECISION', sql, flags=re.IGNORECASE)
+        sql = re.sub(r'\bBLOB\b', 'BYTEA', sql, flags=re.IGNORECASE)
+        return sql
+
+    @staticmethod
+    def _qualify_upsert(sql):
+        """Prefix bare columns on the right of DO UPDATE SET with the target table."""
+        match = re.search(r'\bDO\s+UPDATE\s+SET\b', sql, re.IGNORECASE)
+        if not match:
+            return sql
+        table = re.search(r'\bINSERT\s+INTO\s+(\w+)', sql, re.IGNORECASE).group(1)
+        returning = re.search(r'\bRETURNING\b', sql[match.end():], re.IGNORECASE)
+        end = match.end() + returning.start() if returning else len(sql)
+        qualify = lambda m: m.group(1) if m.group(1).lower() in _KEYWORDS else f'{table}.{m.group(1)}'
+        # Split the SET list on top-level commas; only the right-hand sides are qualified
+        assignments, depth, begin, body = [], 0, 0, sql[match.end():end]
+        for i, c in enumerate(body + ','):
+            depth += (c == '(') - (c == ')')
+            if c == ',' and depth == 0:
+                column, _, value = body[begin:i].partition('=')
+                assignments.append(f'{column}={_IDENTIFIER.sub(qualify, value)}')
+                begin = i + 1
+        return sql[:match.end()] + ','.join(assignments) + sql[end:]
+
+    @staticmethod
+    def schema_version(db):
+        # Readers are read-only: look before the table exists rather than create it
+        if db.execute("SELECT to_regclass('schema_version')").fetchone()[0] is None:
+            return 0
+        row = db.execute('SELECT version FROM schema_version WHERE id = 1').fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def set_schema_version(db, version):
+        db.execute('CREATE TABLE IF NOT EXISTS schema_version '
+                   '(id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)')
+        db.execute('INSERT INTO schema_version (id, version) VALUES (1, ?) '
+                   'ON CONFLICT (id) DO UPDATE SET version = excluded.version', (version,))
+
+    @staticmethod
+    def column_exists(db, table, column):
+        return db.execute('''SELECT 1 FROM information_schema.columns
+                             WHERE table_schema = current_schema() AND table_name = ? AND column_name = ?''',
+                          (table, column)).fetchone() is not None
+
+    @staticmethod
+    def tables(db):
+        names = [r[0] for r in db.execute('''
+            SELECT table_name FROM information_schema.tables
+            WHERE table_schema = current_schema() AND table_type = 'BASE TABLE'
+              AND table_name != 'schema_version'
+            ORDER BY table_name
+        ''')]
+        parents = {t: set() for t in names}
+        for child, parent in db.execute('''
+            SELECT tc.table_name, ccu.table_name FROM information_schema.table_constraints tc
+            JOIN information_schema.constraint_column_usage ccu
+              ON ccu.constraint_name = tc.constraint_name AND ccu.table_schema = tc.table_schema
+            WHERE tc.constraint_type = 'FOREIGN KEY' AND tc.table_schema = current_schema()
+        '''):
+            if child in parents:
+                parents[child].add(parent)
+        return _parents_first(parents)
+
+    @staticmethod
+    def reset_sequences(db, tables):
+        """Move SERIAL sequences past the ids that were inserted explicitly."""
+        for table in tables:
+            if not Postgres.column_exists(db, table, 'id'):
+                continue
+            sequence = db.execute("SELECT pg_get_serial_sequence(?, 'id')", (table,)).fetchone()[0]
+            if sequence:
+                db.execute(f'SELECT setval(CAST(? AS regclass), MAX(id)) FROM {table} HAVING MAX(id) IS NOT NULL',
+                           (sequence,))
+
+
+def _parents_first(parents):
+    ordered, seen = [], set()
+
+    def visit(table, path=()):
+        if table in seen or table in path or table not in parents:
+            return
+        for parent in sorted(parents[table]):
+            visit(parent, path + (table,))
+        seen.add(table)
+        ordered.append(table)
+    for table in sorted(parents):
+        visit(table)
+    return ordered
+
+
+def of(db):
+    """The dialect a connection speaks (sqlite3 connections carry none)."""
+    return getattr(db, 'dialect', SQLite)
@@ -0,0 +1,172 @@
+"""In-process pub/sub used to push notification events over SSE.
+
+Channels are user ids. The default LocalBackend delivers only inside the
+current process; with several gunicorn workers set EVENTS_BACKEND=sqlite so
+events are relayed through the event_log table and reach subscribers in
+every worker.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+
+import notifications
+import users
+
+SUBSCRIBER_QUEUE = 100      # pending events per open stream before dropping
+POLL_INTERVAL = 0.5         # seconds between event_log polls (sqlite backend)
+EVENT_TTL = 300             # seconds an event_log row is kept
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS event_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel INTEGER NOT NULL,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+"""
+
+
+class LocalBackend:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+        with self._lock:
+            self._subscribers[channel].add(q)
+        return q
+
+    def unsubscribe(self, channel, q):
+        with self._lock:
+            subs = self._subscribers.get(channel)
+            if subs:
+                subs.discard(q)
+                if not subs:
+                    del self._subscribers[channel]
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subs = list(self._subscribers.get(channel, ()))
+        for q in subs:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                pass  # slow client; it will resync from the next count event
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+
+class SQLiteBackend(LocalBackend):
+    """Relays events between worker processes through the shared database.
+
+    Each process publishes on one long-lived connection of its own, in short
+    transactions serialized by a lock; SQLite's busy timeout makes them wait
+    for the request writer instead of failing with "database is locked".
+    Publishers call after their own commit and may still hold the pool's
+    writer, so the pool is not used here.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._thread = None
+        self._pid = None
+        self._last_id = None
+        self._publisher = None
+        self._publisher_pid = None
+        self._publish_lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+
+    def _connection(self):
+        import database
+        return database._connect(database.DATABASE)
+
+    def _publisher_connection(self):
+        if self._publisher is None or self._publisher_pid != os.getpid():   # first use, or a forked worker
+            import cooperative
+            self._publisher = self._connection()
+            self._publisher_pid = os.getpid()
+            cooperative.dedicate(self._publisher)
+        return self._publisher
+
+    def publish(self, channel, message):
+        with self._publish_lock:
+            db = self._publisher_connection()
+            try:
+                db.execute('INSERT INTO event_log (channel, payload, created_at) VALUES (?,?,?)',
+                           (channel, json.dumps(message), time.time()))
+                db.execute('DELETE FROM event_log WHERE created_at < ?', (time.time() - EVENT_TTL,))
+                db.commit()
+            except Exception:
+                # Start over on a fresh connection next time
+                self._publisher = None
+                db.close()
+                raise
+
+    def subscribe(self, channel):
+        with self._poll_lock:
+            if self._pid != os.getpid():
+                if self._pid is not None:
+                    self._last_id = None        # a forked worker starts from the current end
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._poll, daemon=True)
+                self._thread.start()
+        return super().subscribe(channel)
+
+    def _poll(self):
+        db = None
+        try:
+            db = self._connection()
+            if self._last_id is None:
+                self._last_id = db.execute('SELECT COALESCE(MAX(id), 0) FROM event_log').fetchone()[0]
+            while True:
+                time.sleep(POLL_INTERVAL)
+                rows = db.execute('SELECT id, channel, payload FROM event_log WHERE id > ? ORDER BY id',
+                                  (self._last_id,)).fetchall()
+                for row in rows:
+                    self._last_id = row['id']
+                    self.deliver(row['channel'], json.loads(row['payload']))
+        except Exception:
+            log.exception('event_log poller stopped; the next subscribe() restarts it')
+        finally:
+            if db is not None:
+                db.close()
+            # Restarted pollers carry on from _last_id, so no event is skipped
+            with self._poll_lock:
+                self._pid = self._thread = None
+
+
+BACKENDS = {'local': LocalBackend, 'sqlite': SQLiteBackend}
+broker = BACKENDS[os.environ.get('EVENTS_BACKEND', 'local')]()
+
+
+def unread_count(db, user_id):
+    return notifications.unread_count(db, user_id)
+
+
+def publish_count(db, user_id):
+    broker.publish(user_id, {'event': 'count', 'data': {'count': unread_count(db, user_id)}})
+
+
+def publish_notification(db, user_id, kind, from_user_id, post_id=None):
+    """Push a new notification and the recipient's unread count. Call after commit."""
+    sender = users.get(db, from_user_id)
+    broker.publish(user_id, {'event': 'notification', 'data': {
+        'count': unread_count(db, user_id),
+        'type': kind,
+        'post_id': post_id,
+        'from_user_id': from_user_id,
+        'username': sender['username'] if sender else '',
+        'avatar_color': sender['avatar_color'] if sender else '',
+    }})
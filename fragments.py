@@ -0,0 +1,124 @@
+"""In-process cache of rendered HTML fragments (feed post cards, profile headers).
+
+A post card is rendered once per (post id, post_stats.version) without any
+viewer state and stored in a byte-bounded LRU; the few per-viewer bits (liked
+state, the commenter avatar) are left as HTML comment markers and substituted
+on every render. User text is autoescaped, so it can never contain a marker.
+post_stats.version is bumped with every like/comment counter change and when
+a post's media is swapped for processed variants; a deleted post is dropped
+with forget(). Profile headers are keyed by the values they display, so they
+need no invalidation at all.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from markupsafe import Markup
+
+MAX_BYTES = int(os.environ.get('FRAGMENT_CACHE_BYTES', 16 * 1024 * 1024))
+
+LIKED = '<!--fragment:liked-->'
+HEART = '<!--fragment:heart-->'
+VIEWER_AVATAR = '<!--fragment:viewer-avatar-->'
+
+
+class LRUCache:
+    """Thread-safe LRU of rendered strings, bounded by their total length."""
+
+    def __init__(self, name, max_bytes):
+        self.name = name
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def discard(self, match):
+        """Drop every entry whose key satisfies match(key)."""
+        with self._lock:
+            for key in [k for k in self._items if match(k)]:
+                self._bytes -= len(self._items.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._items), 'bytes': self._bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+# Post cards are the bulk of a feed page; headers are one per profile view
+post_cards = LRUCache('post_card', MAX_BYTES * 3 // 4)
+profile_headers = LRUCache('profile_header', MAX_BYTES // 4)
+CACHES = (post_cards, profile_headers)
+
+
+def _render(template, **context):
+    return current_app.jinja_env.get_template(template).render(**context)
+
+
+def post_card(post, media, viewer_avatar=''):
+    """Feed card for one hydrated post (Jinja global).
+
+    Only values covered by the key are visible to the template: the post
+    version covers counts and media, and the author's colour can be edited.
+    """
+    key = (post['id'], post['version'], post['avatar_color'])
+    html = post_cards.get(key)
+    if html is None:
+        html = _render('_post_card.html', post=post, media=media)
+        post_cards.put(key, html)
+    return Markup(html
+                  .replace(LIKED, ' liked' if post['user_liked'] else '')
+                  .replace(HEART, '❤️' if post['user_liked'] else '🤍')
+                  .replace(VIEWER_AVATAR, str(viewer_avatar)))
+
+
+def profile_header(user, counts):
+    """Avatar, stats and bio of a profile page (Jinja global); the follow button stays outside."""
+    key = (user['id'], user['username'], user['avatar_color'], user['avatar_img'] or '',
+           user['avatar_variants'] or '', user['bio'] or '',
+           counts['post_count'], counts['followers_count'], counts['following_count'])
+    html = profile_headers.get(key)
+    if html is None:
+        html = _render('_profile_header.html', user=user, **counts)
+        profile_headers.put(key, html)
+    return Markup(html)
+
+
+def forget(post_id):
+    """Drop a deleted post's cards from this process (other workers age them out)."""
+    post_cards.discard(lambda key: key[0] == post_id)
+
+
+def stats():
+    """{'post_card': {'entries', 'bytes', 'hits', 'misses', 'evictions'}, 'profile_header': {...}}."""
+    return {cache.name: cache.stats() for cache in CACHES}
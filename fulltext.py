@@ -0,0 +1,162 @@
+"""SQLite FTS5 index over usernames, bios, post content and comments.
+
+The *_fts tables are external-content indexes kept in sync by triggers, so
+every write path (register, edit_profile, create_post, comments, cascading
+deletes) updates them inside its own transaction.
+
+On PostgreSQL the same searches run on GIN indexes over to_tsvector()
+expressions of the tables themselves (PG_SCHEMA), which the server keeps
+current without triggers. Only the "hits" subquery differs per dialect; it
+yields (rowid, score/rank) with lower meaning better either way.
+"""
+import re
+
+import dialect
+
+SEARCH_LIMIT = 20
+
+_TOKENIZER = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+SCHEMA = f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+        username, bio, content = 'users', content_rowid = 'id', {_TOKENIZER}
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+        content, content = 'posts', content_rowid = 'id', {_TOKENIZER}
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS comments_fts USING fts5(
+        content, content = 'comments', content_rowid = 'id', {_TOKENIZER}
+    );
+
+    CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN
+        INSERT INTO users_fts (rowid, username, bio) VALUES (new.id, new.username, new.bio);
+    END;
+    CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, username, bio) VALUES ('delete', old.id, old.username, old.bio);
+    END;
+    CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username, bio ON users BEGIN
+        INSERT INTO users_fts (users_fts, rowid, username, bio) VALUES ('delete', old.id, old.username, old.bio);
+        INSERT INTO users_fts (rowid, username, bio) VALUES (new.id, new.username, new.bio);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS posts_fts_ai AFTER INSERT ON posts BEGIN
+        INSERT INTO posts_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS posts_fts_ad AFTER DELETE ON posts BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS posts_fts_au AFTER UPDATE OF content ON posts BEGIN
+        INSERT INTO posts_fts (posts_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO posts_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS comments_fts_ai AFTER INSERT ON comments BEGIN
+        INSERT INTO comments_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS comments_fts_ad AFTER DELETE ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS comments_fts_au AFTER UPDATE OF content ON comments BEGIN
+        INSERT INTO comments_fts (comments_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO comments_fts (rowid, content) VALUES (new.id, new.content);
+    END;
+"""
+
+# 'simple': no stemming or stop words, like unicode61 (diacritics are kept, though)
+_USER_VECTOR = ("setweight(to_tsvector('simple', username), 'A') || "
+                "setweight(to_tsvector('simple', COALESCE(bio, '')), 'B')")
+_CONTENT_VECTOR = "to_tsvector('simple', COALESCE(content, ''))"
+
+PG_SCHEMA = f"""
+    CREATE INDEX IF NOT EXISTS idx_users_search ON users USING GIN (({_USER_VECTOR}));
+    CREATE INDEX IF NOT EXISTS idx_posts_search ON posts USING GIN (({_CONTENT_VECTOR}));
+    CREATE INDEX IF NOT EXISTS idx_comments_search ON comments USING GIN (({_CONTENT_VECTOR}));
+"""
+
+# Best matches first, at most `limit` of them: (rowid, score) rows, lower is better
+_HITS = {
+    dialect.SQLite: {
+        'users': '''SELECT rowid, bm25(users_fts, 10.0, 1.0) AS score
+                    FROM users_fts WHERE users_fts MATCH ? ORDER BY score LIMIT ?''',
+        'posts': 'SELECT rowid, rank AS score FROM posts_fts WHERE posts_fts MATCH ? ORDER BY rank LIMIT ?',
+        'comments': 'SELECT rowid, rank AS score FROM comments_fts WHERE comments_fts MATCH ? ORDER BY rank LIMIT ?',
+    },
+    dialect.Postgres: {
+        table: f'''SELECT id AS rowid, -ts_rank({vector}, query) AS score
+                    FROM {table}, to_tsquery('simple', ?) query
+                    WHERE {vector} @@ query ORDER BY score LIMIT ?'''
+        for table, vector in (('users', _USER_VECTOR), ('posts', _CONTENT_VECTOR), ('comments', _CONTENT_VECTOR))
+    },
+}
+
+
+def install(db):
+    """Create the search indexes for db's dialect and fill them."""
+    if dialect.of(db) is dialect.Postgres:
+        db.executescript(PG_SCHEMA)
+    else:
+        db.executescript(SCHEMA)
+        rebuild(db)
+
+
+def rebuild(db):
+    if dialect.of(db) is dialect.Postgres:
+        return                  # expression indexes are never stale
+    for table in ('users_fts', 'posts_fts', 'comments_fts'):
+        db.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+    db.commit()
+
+
+def match_query(q):
+    """Turn free text into an FTS5 prefix query ('ali bo' -> '"ali"* "bo"*'), or None."""
+    tokens = re.findall(r'\w+', q)
+    if not tokens:
+        return None
+    return ' '.join(f'"{t}"*' for t in tokens[:8])
+
+
+def _hits(db, table, match):
+    """The hits subquery for db, and match in the syntax it expects."""
+    if dialect.of(db) is dialect.Postgres:
+        # '"ali"* "bo"*' -> 'ali:* & bo:*'
+        match = ' & '.join(f"'{token}':*" for token in re.findall(r'"(\w+)"\*', match))
+    return _HITS[dialect.of(db)][table], match
+
+
+def search_users(db, uid, match, limit=SEARCH_LIMIT):
+    hits, match = _hits(db, 'users', match)
+    return db.execute(f'''
+        SELECT u.*,
+               COALESCE(us.followers_count, 0) as followers_count,
+               EXISTS(SELECT 1 FROM followers WHERE follower_id=? AND following_id=u.id) as is_following
+        FROM ({hits}) hits
+        JOIN users u ON u.id = hits.rowid
+        LEFT JOIN user_stats us ON us.user_id = u.id
+        WHERE u.id != ?
+        ORDER BY hits.score, followers_count DESC
+    ''', (uid, match, limit + 1, uid)).fetchall()[:limit]
+
+
+def search_posts(db, match, limit=SEARCH_LIMIT):
+    hits, match = _hits(db, 'posts', match)
+    return db.execute(f'''
+        SELECT p.id, p.user_id, p.content, p.created_at, u.username, u.avatar_color,
+               COALESCE(ps.like_count, 0) as like_count,
+               COALESCE(ps.comment_count, 0) as comment_count
+        FROM ({hits}) hits
+        JOIN posts p ON p.id = hits.rowid
+        JOIN users u ON u.id = p.user_id
+        LEFT JOIN post_stats ps ON ps.post_id = p.id
+        ORDER BY hits.score
+    ''', (match, limit)).fetchall()
+
+
+def search_comments(db, match, limit=SEARCH_LIMIT):
+    hits, match = _hits(db, 'comments', match)
+    return db.execute(f'''
+        SELECT c.id, c.post_id, c.user_id, c.content, c.created_at, u.username, u.avatar_color
+        FROM ({hits}) hits
+        JOIN comments c ON c.id = hits.rowid
+        JOIN users u ON u.id = c.user_id
+        ORDER BY hits.score
+    ''', (match, limit)).fetchall()
@@ -0,0 +1,27 @@
+"""gunicorn settings; the worker model comes from WORKER_MODEL (see cooperative.py).
+
+    WORKER_MODEL=threads   gthread, THREADS threads per worker (default)
+    WORKER_MODEL=gevent    gevent, WORKER_CONNECTIONS greenlets per worker
+"""
+import os
+
+worker_model = os.environ.get('WORKER_MODEL', 'threads')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+# The local events backend only reaches streams open in the same worker (events.py)
+if workers > 1:
+    if os.environ.setdefault('EVENTS_BACKEND', 'sqlite') == 'local':
+        raise RuntimeError('EVENTS_BACKEND=local drops SSE events across workers; '
+                           'use EVENTS_BACKEND=sqlite or WEB_CONCURRENCY=1')
+
+if worker_model == 'gevent':
+    worker_class = 'gevent'
+    worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 2000))
+else:
+    worker_class = 'gthread'
+    threads = int(os.environ.get('THREADS', 32))
+
+# /notifications/stream holds a request open for minutes; gevent and gthread workers
+# heartbeat independently of requests, so this only bounds a truly stuck worker
+timeout = 120
+graceful_timeout = 30
@@ -0,0 +1,119 @@
+"""Resize, strip and re-encode uploaded images.
+
+process() turns one upload into a family of files named <stem>_<width>.<ext>
+(one per width in the profile and per format in FORMATS plus a JPEG/PNG
+fallback) and returns a small dict describing them. It is stored as JSON in
+post_media.variants / users.avatar_variants and rendered by the picture()
+macro (templates/_picture.html) and pictureHTML() in main.js as
+<picture>/srcset, so browsers download the smallest file that fits.
+"""
+import json
+import os
+
+from PIL import Image, ImageOps, features
+
+PROFILES = {
+    'post': (480, 960, 1600),   # feed column at 1x/2x, full view
+    'avatar': (48, 96, 256),    # list avatars, sm avatars at 2x, profile header
+}
+FORMATS = tuple(f for f in ('avif', 'webp') if features.check(f))
+QUALITY = {'avif': 55, 'webp': 80, 'jpeg': 82}
+AVIF_SPEED = 8                  # 0 (smallest) .. 10 (fastest) encoder effort
+MAX_PIXELS = 40_000_000         # refuse decompression bombs above this
+
+Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+
+EXT = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp', 'avif': 'avif'}
+
+
+def _prepare(img, square):
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+    img = img.convert('RGBA' if has_alpha else 'RGB')
+    if square:
+        img = ImageOps.fit(img, (min(img.size),) * 2, Image.LANCZOS)
+    return img, has_alpha
+
+
+def _save(img, path, fmt, icc_profile):
+    # Only the pixels and the colour profile are written: EXIF (GPS, camera
+    # serials), XMP and comments from the upload are dropped here.
+    options = {'icc_profile': icc_profile} if icc_profile else {}
+    if fmt == 'jpeg':
+        options.update(quality=QUALITY['jpeg'], optimize=True, progressive=True)
+    elif fmt == 'png':
+        options.update(optimize=True)
+    elif fmt == 'webp':
+        options.update(quality=QUALITY['webp'], method=4)
+    elif fmt == 'avif':
+        options.update(quality=QUALITY['avif'], speed=AVIF_SPEED)
+    img.save(path, fmt.upper(), **options)
+
+
+def process(src, dest_dir, stem, profile='post'):
+    """Write every variant of the image at src into dest_dir.
+
+    Returns the variants dict, or None if src is not something we re-encode
+    (animated GIF/WebP), in which case the caller keeps the original.
+    Raises OSError/Image.DecompressionBombError for unreadable images.
+    """
+    with Image.open(src) as original:
+        if getattr(original, 'is_animated', False):
+            return None
+        icc_profile = original.info.get('icc_profile')
+        img, has_alpha = _prepare(original, square=profile == 'avatar')
+
+    fallback = 'png' if has_alpha else 'jpeg'
+    widths = sorted({min(w, img.width) for w in PROFILES[profile]})
+
+    for width in widths:
+        height = max(1, round(img.height * width / img.width))
+        resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+        for fmt in (*FORMATS, fallback):
+            _save(resized, os.path.join(dest_dir, f'{stem}_{width}.{EXT[fmt]}'), fmt, icc_profile)
+
+    return {
+        'widths': widths,
+        'formats': [EXT[f] for f in (*FORMATS, fallback)],
+        'width': img.width,
+        'height': img.height,
+    }
+
+
+def variant(base, info, width, ext=None):
+    """Relative path of one variant; base is the file's path without _<width>.<ext>."""
+    return f"{base}_{width}.{ext or info['formats'][-1]}"
+
+
+def base_of(filename):
+    """'images/ab12_960.jpg' -> 'images/ab12'."""
+    return filename.rsplit('_', 1)[0]
+
+
+def pick(info, at_least):
+    """Smallest stored width >= at_least (or the largest one)."""
+    return next((w for w in info['widths'] if w >= at_least), info['widths'][-1])
+
+
+def srcset(filename, info, ext):
+    base = base_of(filename)
+    return ', '.join(f"/static/uploads/{variant(base, info, w, ext)} {w}w" for w in info['widths'])
+
+
+def files(filename, info):
+    """Every file on disk belonging to one processed image."""
+    base = base_of(filename)
+    return [variant(base, info, w, ext) for w in info['widths'] for ext in info['formats']]
+
+
+def load(value):
+    """Column value -> variants dict (or None for unprocessed media)."""
+    if not value:
+        return None
+    if isinstance(value, dict):
+        return value
+    return json.loads(value)
+
+
+def dump(info):
+    return json.dumps(info, separators=(',', ':')) if info else ''
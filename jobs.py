@@ -0,0 +1,148 @@
+"""Durable background jobs stored in SQLite.
+
+Requests enqueue() work inside their own transaction, so a job exists if and
+only if the write that needs it was committed. `flask worker` claims due jobs
+one at a time, runs the handler registered for their kind and retries
+failures with exponential backoff; jobs that keep failing are parked as
+'failed' for inspection (`flask jobs`, `flask jobs --retry-failed`).
+"""
+import json
+import time
+import traceback
+
+import dialect
+
+MAX_ATTEMPTS = 5
+BACKOFF = 30                # seconds before the first retry; doubles each attempt
+LEASE = 15 * 60             # a 'running' job older than this is assumed crashed
+POLL_INTERVAL = 1.0         # seconds the worker sleeps when the queue is empty
+KEEP_DONE = 24 * 3600       # finished jobs are kept this long for `flask jobs`
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        run_at REAL NOT NULL,
+        locked_at REAL,
+        finished_at REAL,
+        last_error TEXT DEFAULT '',
+        created_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs(status, run_at);
+    CREATE INDEX IF NOT EXISTS idx_jobs_kind_created ON jobs(kind, created_at);
+"""
+
+HANDLERS = {}
+PERIODIC = {}               # kind -> seconds between runs, enqueued by the worker
+
+
+def handler(kind):
+    """Register fn(db, **payload) as the handler for a job kind."""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def periodic(kind, interval):
+    """Have the worker enqueue a payload-less job of this kind every interval seconds."""
+    PERIODIC[kind] = interval
+
+
+def enqueue(db, kind, delay=0, **payload):
+    """Queue a job in the caller's transaction. No commit."""
+    now = time.time()
+    db.execute('INSERT INTO jobs (kind, payload, run_at, created_at) VALUES (?,?,?,?)',
+               (kind, json.dumps(payload), now + delay, now))
+
+
+def claim(db):
+    """Mark the next due job as running and return it, or None. Commits."""
+    now = time.time()
+    db.execute("UPDATE jobs SET status='queued' WHERE status='running' AND locked_at < ?",
+               (now - LEASE,))
+    # SQLite has one writer; on PostgreSQL concurrent workers skip each other's row
+    job = db.execute(f'''
+        UPDATE jobs SET status='running', locked_at=?, attempts=attempts + 1
+        WHERE id = (SELECT id FROM jobs WHERE status='queued' AND run_at <= ?
+                    ORDER BY run_at LIMIT 1 {dialect.of(db).skip_locked})
+        RETURNING id, kind, payload, attempts
+    ''', (now, now)).fetchone()
+    db.commit()
+    return job
+
+
+def run(db, job):
+    """Run one claimed job and record the outcome. Returns True on success."""
+    try:
+        HANDLERS[job['kind']](db, **json.loads(job['payload']))
+    except Exception:
+        db.rollback()
+        error = traceback.format_exc(limit=5)
+        if job['attempts'] >= MAX_ATTEMPTS:
+            db.execute("UPDATE jobs SET status='failed', finished_at=?, last_error=? WHERE id=?",
+                       (time.time(), error, job['id']))
+        else:
+            db.execute("UPDATE jobs SET status='queued', run_at=?, last_error=? WHERE id=?",
+                       (time.time() + BACKOFF * 2 ** (job['attempts'] - 1), error, job['id']))
+        db.commit()
+        return False
+    db.execute("UPDATE jobs SET status='done', finished_at=? WHERE id=?", (time.time(), job['id']))
+    db.commit()
+    return True
+
+
+def _schedule(db):
+    now = time.time()
+    for kind, interval in PERIODIC.items():
+        if not db.execute('SELECT 1 FROM jobs WHERE kind=? AND created_at > ?',
+                          (kind, now - interval)).fetchone():
+            enqueue(db, kind)
+    db.commit()
+
+
+def work(db, once=False, log=print):
+    """Process jobs until interrupted (or until the queue is drained with once=True)."""
+    last_housekeeping = 0
+    while True:
+        if time.time() - last_housekeeping > 60:
+            _schedule(db)
+            prune(db)
+            last_housekeeping = time.time()
+        job = claim(db)
+        if job is None:
+            if once:
+                return
+            time.sleep(POLL_INTERVAL)
+            continue
+        started = time.perf_counter()
+        ok = run(db, job)
+        log(f"job {job['id']} {job['kind']} {'ok' if ok else 'failed'} "
+            f"attempt={job['attempts']} {time.perf_counter() - started:.3f}s")
+
+
+def prune(db):
+    db.execute("DELETE FROM jobs WHERE status='done' AND finished_at < ?", (time.time() - KEEP_DONE,))
+    db.commit()
+
+
+def retry_failed(db):
+    count = db.execute("UPDATE jobs SET status='queued', attempts=0, run_at=? WHERE status='failed'",
+                       (time.time(),)).rowcount
+    db.commit()
+    return count
+
+
+def stats(db):
+    """{'queued': n, 'running': n, 'done': n, 'failed': n, 'due': n, 'oldest_due_seconds': s}."""
+    now = time.time()
+    counts = dict.fromkeys(('queued', 'running', 'done', 'failed'), 0)
+    counts.update(db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+    due, oldest = db.execute("SELECT COUNT(*), MIN(run_at) FROM jobs WHERE status='queued' AND run_at <= ?",
+                             (now,)).fetchone()
+    counts['due'] = due
+    counts['oldest_due_seconds'] = round(now - oldest, 1) if oldest else 0
+    return counts
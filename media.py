@@ -1,6 +1,13 @@
+import hashlib
 import os
+import time
 import uuid
+from PIL import Image
 from werkzeug.utils import secure_filename
+import counters
+import dialect
+import images
+import jobs
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static', 'uploads')
 
@@ -22,6 +29,18 @@ SUBFOLDERS = {
     'audio': 'audio',
 }
 
+AVATAR_FOLDER = 'avatars'
+AVATAR_DISPLAY = 96   # width of the variant stored in users.avatar_img
+
+ORIGINAL_GRACE = 3600         # keep a processed upload this long (pages may still link it)
+ORPHAN_GRACE = 24 * 3600      # unreferenced files younger than this are left alone
+CLEANUP_INTERVAL = 24 * 3600  # how often the worker scans for orphaned files
+
+TMP_FOLDER = 'tmp'            # partial uploads, see uploads.py
+COPY_BLOCK = 64 * 1024
+
+UNREADABLE = (OSError, ValueError, Image.DecompressionBombError)
+
 def get_media_type(filename):
     ext = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
     for media_type, exts in ALLOWED.items():
@@ -29,37 +48,358 @@ def get_media_type(filename):
             return media_type
     return None
 
-def save_file(file):
-    """Save a file and return (filename, media_type) or (None, None) on error."""
-    if not file or not file.filename:
-        return None, None
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS blobs (
+        key TEXT PRIMARY KEY,
+        ext TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        variants TEXT DEFAULT '',
+        created_at REAL NOT NULL
+    );
+"""
+
+# ── Content-addressed blobs ────────────────────────
+# Uploads are stored once per content hash as <subfolder>/<sha256>.<ext>
+# (image variants as <subfolder>/<sha256>_<width>.<ext>). The blobs row keyed
+# '<subfolder>/<sha256>' counts the post_media/users rows pointing at it; the
+# files go away only when that count drops to zero (delete_file).
+
+def _key(filename):
+    """'images/<sha>_960.jpg' or 'images/<sha>.png' -> 'images/<sha>'."""
+    subfolder, name = filename.rsplit('/', 1)
+    return f"{subfolder}/{name.split('.', 1)[0].split('_', 1)[0]}"
+
+def _display(key, variants):
+    """The variant stored in post_media.filename / users.avatar_img."""
+    width = images.pick(variants, AVATAR_DISPLAY) if key.startswith(AVATAR_FOLDER + '/') else variants['widths'][-1]
+    return images.variant(key, variants, width)
+
+def _stream_to_tmp(file, media_type):
+    """Copy an upload to tmp while hashing it; returns (tmp_path, sha256, size) or None if too big."""
+    tmp_dir = os.path.join(UPLOAD_FOLDER, TMP_FOLDER)
+    os.makedirs(tmp_dir, exist_ok=True)
+    tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.part")
+    digest, size = hashlib.sha256(), 0
+    with open(tmp_path, 'wb') as out:
+        for block in iter(lambda: file.stream.read(COPY_BLOCK), b''):
+            size += len(block)
+            if size > MAX_SIZE[media_type]:
+                out.close()
+                os.remove(tmp_path)
+                return None
+            digest.update(block)
+            out.write(block)
+    return tmp_path, digest.hexdigest(), size
+
+def acquire(db, subfolder, sha256, ext, size, src):
+    """Take a reference to the blob with this content, storing src if it is new.
+
+    src (a file under tmp) is moved into place or discarded. Returns
+    (filename, variants) for the new post_media/users row. No commit; the
+    caller's write transaction keeps this ordered with blob deletion. The
+    move is not undone by a rollback, so a retry finds the file already in
+    place and src gone.
+    """
+    key = f"{subfolder}/{sha256}"
+    blob = db.execute('''
+        INSERT INTO blobs (key, ext, size, refcount, created_at) VALUES (?,?,?,1,?)
+        ON CONFLICT(key) DO UPDATE SET refcount = refcount + 1
+        RETURNING ext, variants
+    ''', (key, ext, size, time.time())).fetchone()
+    variants = images.load(blob['variants'])
+    path = f"{key}.{blob['ext']}"
+    if variants or os.path.exists(os.path.join(UPLOAD_FOLDER, path)):
+        if os.path.exists(src):
+            os.remove(src)
+    else:
+        os.makedirs(os.path.join(UPLOAD_FOLDER, subfolder), exist_ok=True)
+        os.replace(src, os.path.join(UPLOAD_FOLDER, path))
+        # gc's ORPHAN_GRACE counts from the move, not from when the upload started
+        os.utime(os.path.join(UPLOAD_FOLDER, path))
+    return (_display(key, variants), variants) if variants else (path, None)
+
+def _blob_files(key, ext, variants):
+    files = [f"{key}.{ext}"]
+    if variants:
+        files += images.files(_display(key, variants), variants)
+    return files
 
+def process_upload(relative_path, profile):
+    """Write the variants of an image under UPLOAD_FOLDER; returns (relative_path, variants).
+
+    relative_path is the fallback variant to store, or the upload itself if it
+    is not re-encoded (animated), in which case variants is None. The
+    original is left in place for the caller to delete.
+    """
+    subfolder, name = relative_path.rsplit('/', 1)
+    stem = name.rsplit('.', 1)[0]
+    original = os.path.join(UPLOAD_FOLDER, relative_path)
+    variants = images.process(original, os.path.dirname(original), stem, profile)
+    if variants is None:
+        return relative_path, None
+    width = images.pick(variants, AVATAR_DISPLAY) if profile == 'avatar' else variants['widths'][-1]
+    return images.variant(f"{subfolder}/{stem}", variants, width), variants
+
+def stage_file(file):
+    """Copy a multipart upload to tmp before any database work.
+
+    The body is hashed while it is copied, so size is enforced as it streams.
+    Returns a staged file for save_file(), or None if the type or size is
+    rejected. Call it before taking the writer: a 100 MB video must not hold
+    up every other write in the process.
+    """
+    if not file or not file.filename:
+        return None
     original = secure_filename(file.filename)
     media_type = get_media_type(original)
     if not media_type:
-        return None, None
-
-    # Check size
-    file.seek(0, 2)
-    size = file.tell()
-    file.seek(0)
-    if size > MAX_SIZE[media_type]:
-        return None, None
-
-    ext = original.rsplit('.', 1)[-1].lower()
-    unique_name = f"{uuid.uuid4().hex}.{ext}"
-    subfolder = SUBFOLDERS[media_type]
-    dest_dir = os.path.join(UPLOAD_FOLDER, subfolder)
-    os.makedirs(dest_dir, exist_ok=True)
-
-    file.save(os.path.join(dest_dir, unique_name))
-    relative_path = f"{subfolder}/{unique_name}"
-    return relative_path, media_type
-
-def delete_file(filename):
-    """Delete a file from uploads folder."""
+        return None
+    staged = _stream_to_tmp(file, media_type)
+    if staged is None:
+        return None
+    tmp_path, sha256, size = staged
+    return media_type, original.rsplit('.', 1)[-1].lower(), tmp_path, sha256, size
+
+def save_file(db, staged):
+    """Store a stage_file() result; returns (filename, media_type, variants). No commit.
+
+    A duplicate of an existing blob costs only a refcount. New images get
+    their variants from the process_image job (see enqueue_processing).
+    """
+    media_type, ext, tmp_path, sha256, size = staged
+    filename, variants = acquire(db, SUBFOLDERS[media_type], sha256, ext, size, tmp_path)
+    return filename, media_type, variants
+
+def enqueue_processing(db, media_id, media_type, variants=None):
+    if media_type == 'image' and not variants:
+        jobs.enqueue(db, 'process_image', media_id=media_id)
+
+def _set_variants(db, key, variants):
+    db.execute('UPDATE blobs SET variants=? WHERE key=?', (images.dump(variants), key))
+
+def stage_avatar(file):
+    """Copy and process an avatar upload before any database work.
+
+    Avatars are shown in the header of every page right after the edit, so
+    they are processed inline rather than through the job queue; doing it
+    here keeps the Pillow decode and re-encode out of the writer. Returns a
+    staged avatar for save_avatar(), or None if it is not a readable image.
+    """
+    original = secure_filename(file.filename or '')
+    if get_media_type(original) != 'image':
+        return None
+    staged = _stream_to_tmp(file, 'image')
+    if staged is None:
+        return None
+    tmp_path, sha256, size = staged
+    tmp_base = tmp_path.rsplit('.', 1)[0]
+    try:
+        variants = images.process(tmp_path, os.path.dirname(tmp_path), os.path.basename(tmp_base), 'avatar')
+    except UNREADABLE:
+        os.remove(tmp_path)
+        return None
+    return tmp_path, sha256, original.rsplit('.', 1)[-1].lower(), size, variants
+
+def _staged_variants(tmp_path, key, variants):
+    """(tmp file, stored name) for each variant stage_avatar() wrote."""
+    tmp_base = tmp_path.rsplit('.', 1)[0]
+    return [(images.variant(tmp_base, variants, width, ext), images.variant(key, variants, width, ext))
+            for width in variants['widths'] for ext in variants['formats']]
+
+def save_avatar(db, staged):
+    """Store a stage_avatar() result; returns (avatar_img, variants). No commit."""
+    tmp_path, sha256, ext, size, processed = staged
+    key = f"{AVATAR_FOLDER}/{sha256}"
+    staged_variants = _staged_variants(tmp_path, key, processed) if processed else []
+    avatar_img, variants = acquire(db, AVATAR_FOLDER, sha256, ext, size, tmp_path)
+    if variants or not processed:
+        # Processed by an earlier upload of the same image, or animated and kept as is
+        for tmp, _ in staged_variants:
+            os.remove(tmp)
+        return avatar_img, variants
+    for tmp, name in staged_variants:
+        os.replace(tmp, os.path.join(UPLOAD_FOLDER, name))
+    _set_variants(db, key, processed)
+    _unlink(avatar_img)
+    return _display(key, processed), processed
+
+def _unlink(filename, variants=None):
+    variants = images.load(variants)
+    for name in images.files(filename, variants) if variants else [filename]:
+        path = os.path.join(UPLOAD_FOLDER, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+def delete_file(db, filename, variants=None, delay=0):
+    """Drop one reference to a stored file. No commit.
+
+    Content-addressed blobs are removed by a delete_blob job once their
+    refcount reaches zero; files from before the blob store are queued for
+    deletion directly.
+    """
     if not filename:
         return
-    path = os.path.join(UPLOAD_FOLDER, filename)
-    if os.path.exists(path):
-        os.remove(path)
\ No newline at end of file
+    blob = db.execute('''
+        UPDATE blobs SET refcount = MAX(refcount - 1, 0) WHERE key=? RETURNING refcount
+    ''', (_key(filename),)).fetchone()
+    if blob is None:
+        jobs.enqueue(db, 'delete_files', delay=delay, files=[[filename, images.dump(images.load(variants))]])
+    elif blob['refcount'] == 0:
+        jobs.enqueue(db, 'delete_blob', delay=delay, key=_key(filename))
+
+def process_existing(db):
+    """Queue variant generation for images uploaded before the pipeline existed. Returns the count."""
+    rows = db.execute("SELECT id FROM post_media WHERE media_type='image' AND COALESCE(variants,'')=''").fetchall()
+    for row in rows:
+        jobs.enqueue(db, 'process_image', media_id=row['id'])
+    users = db.execute("SELECT id FROM users WHERE COALESCE(avatar_img,'')!='' AND COALESCE(avatar_variants,'')=''").fetchall()
+    for row in users:
+        jobs.enqueue(db, 'process_avatar', user_id=row['id'])
+    db.commit()
+    return len(rows) + len(users)
+
+def gc(db, dry_run=False):
+    """Reconcile blobs and the uploads folder with post_media and users.avatar_img.
+
+    Refcounts are recomputed from the referencing rows, blobs nobody refers
+    to are deleted, and files that belong to no row or blob are removed once
+    older than ORPHAN_GRACE. Returns counters; commits unless dry_run.
+
+    The reconciliation holds the write lock from its first read, so an
+    acquire() cannot land between counting and rewriting. Files are removed
+    only after that commit, under the lock again, and only while their blob
+    is still unreferenced: the same content may have been uploaded since.
+    """
+    stats = {'refcounts_fixed': 0, 'blobs_removed': 0, 'files_removed': 0, 'bytes_freed': 0}
+    if not dry_run:
+        dialect.of(db).lock_for_write(db, 'blobs')
+    refs, referenced = {}, set()
+    for filename, variants in db.execute('''
+            SELECT filename, variants FROM post_media
+            UNION ALL
+            SELECT avatar_img, avatar_variants FROM users WHERE COALESCE(avatar_img,'') != ''
+    '''):
+        refs[_key(filename)] = refs.get(_key(filename), 0) + 1
+        referenced.add(filename)
+        if variants:
+            referenced.update(images.files(filename, images.load(variants)))
+
+    for blob in db.execute('SELECT key, ext, refcount, variants FROM blobs').fetchall():
+        actual = refs.get(blob['key'], 0)
+        if actual:
+            referenced.update(_blob_files(blob['key'], blob['ext'], images.load(blob['variants'])))
+            if actual != blob['refcount']:
+                stats['refcounts_fixed'] += 1
+                if not dry_run:
+                    db.execute('UPDATE blobs SET refcount=? WHERE key=?', (actual, blob['key']))
+        else:
+            stats['blobs_removed'] += 1
+            if not dry_run:
+                db.execute('DELETE FROM blobs WHERE key=?', (blob['key'],))
+    if not dry_run:
+        db.commit()
+
+    orphans = []
+    cutoff = time.time() - ORPHAN_GRACE
+    for subfolder in (*SUBFOLDERS.values(), AVATAR_FOLDER):
+        folder = os.path.join(UPLOAD_FOLDER, subfolder)
+        if not os.path.isdir(folder):
+            continue
+        for entry in os.scandir(folder):
+            if not entry.is_file() or f"{subfolder}/{entry.name}" in referenced:
+                continue
+            info = entry.stat()
+            if info.st_mtime < cutoff:
+                orphans.append((f"{subfolder}/{entry.name}", info.st_size))
+    if dry_run:
+        stats['files_removed'], stats['bytes_freed'] = len(orphans), sum(size for _, size in orphans)
+        return stats
+
+    dialect.of(db).lock_for_write(db, 'blobs')
+    try:
+        for name, size in orphans:
+            blob = db.execute('SELECT refcount FROM blobs WHERE key=?', (_key(name),)).fetchone()
+            if blob and blob['refcount'] > 0:
+                continue
+            _unlink(name)
+            stats['files_removed'] += 1
+            stats['bytes_freed'] += size
+    finally:
+        db.rollback()       # nothing was written; this only releases the lock
+    return stats
+
+# ── Jobs (run by `flask worker`) ───────────────────
+
+@jobs.handler('process_image')
+def _process_image_job(db, media_id):
+    m = db.execute('SELECT filename, variants FROM post_media WHERE id=?', (media_id,)).fetchone()
+    if not m or m['variants']:
+        return  # post deleted or already processed
+    key = _key(m['filename'])
+    blob = db.execute('SELECT variants FROM blobs WHERE key=?', (key,)).fetchone()
+    if blob and blob['variants']:  # a duplicate finished first
+        variants = images.load(blob['variants'])
+        db.execute('UPDATE post_media SET filename=?, variants=? WHERE id=?',
+                   (_display(key, variants), blob['variants'], media_id))
+        counters.touch_posts(db, 'SELECT post_id FROM post_media WHERE id=?', (media_id,))
+        return
+    if not os.path.exists(os.path.join(UPLOAD_FOLDER, m['filename'])):
+        return
+    try:
+        filename, variants = process_upload(m['filename'], 'post')
+    except UNREADABLE:
+        counters.touch_posts(db, 'SELECT post_id FROM post_media WHERE id=?', (media_id,))
+        db.execute('DELETE FROM post_media WHERE id=?', (media_id,))
+        delete_file(db, m['filename'])
+        return
+    if variants:
+        # Every post still pointing at this original (duplicates queued meanwhile) switches over
+        counters.touch_posts(db, 'SELECT post_id FROM post_media WHERE filename=?', (m['filename'],))
+        db.execute('UPDATE post_media SET filename=?, variants=? WHERE filename=?',
+                   (filename, images.dump(variants), m['filename']))
+        _set_variants(db, key, variants)
+        jobs.enqueue(db, 'delete_original', delay=ORIGINAL_GRACE, filename=m['filename'])
+
+@jobs.handler('process_avatar')
+def _process_avatar_job(db, user_id):
+    u = db.execute('SELECT avatar_img, avatar_variants FROM users WHERE id=?', (user_id,)).fetchone()
+    if not u or u['avatar_variants'] or not os.path.exists(os.path.join(UPLOAD_FOLDER, u['avatar_img'] or '')):
+        return
+    try:
+        avatar_img, variants = process_upload(u['avatar_img'], 'avatar')
+    except UNREADABLE:
+        return  # keep whatever the user uploaded
+    if variants:
+        db.execute('UPDATE users SET avatar_img=?, avatar_variants=? WHERE id=?',
+                   (avatar_img, images.dump(variants), user_id))
+        _set_variants(db, _key(u['avatar_img']), variants)
+        jobs.enqueue(db, 'delete_original', delay=ORIGINAL_GRACE, filename=u['avatar_img'])
+
+@jobs.handler('delete_files')
+def _delete_files_job(db, files):
+    for filename, variants in files:
+        _unlink(filename, variants)
+
+@jobs.handler('delete_original')
+def _delete_original_job(db, filename):
+    # Skip if the blob was freed and re-uploaded since: its original is unprocessed again
+    blob = db.execute('SELECT variants FROM blobs WHERE key=?', (_key(filename),)).fetchone()
+    if blob is None or blob['variants']:
+        _unlink(filename)
+
+@jobs.handler('delete_blob')
+def _delete_blob_job(db, key):
+    # Deleting the row first takes the write lock, so an acquire() of the same
+    # content either happened before (refcount > 0, nothing to do) or waits.
+    blob = db.execute('DELETE FROM blobs WHERE key=? AND refcount=0 RETURNING ext, variants',
+                      (key,)).fetchone()
+    if blob:
+        for name in _blob_files(key, blob['ext'], images.load(blob['variants'])):
+            _unlink(name)
+
+@jobs.handler('cleanup_uploads')
+def _cleanup_uploads_job(db):
+    gc(db)
+
+jobs.periodic('cleanup_uploads', CLEANUP_INTERVAL)
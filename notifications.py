@@ -0,0 +1,146 @@
+"""Grouped notifications with a maintained unread counter.
+
+Likes and comments on one post, and new followers, collapse into a single
+unread row per (recipient, group_key) that is updated in place: the latest
+actor, actor_count and created_at move forward ("X and 41 others liked your
+post"). Once the group has been read, the next event opens a new one.
+notification_actors remembers who already triggered each group key, so
+unlike/re-like or unfollow/re-follow does not notify again.
+user_stats.unread_notifications counts unread rows, so the badge is a
+primary-key lookup. Only the rows a page actually displayed are marked
+read, and compact() (a daily job) applies the retention policy.
+"""
+import counters
+import jobs
+
+PAGE = 50                    # groups shown on /notifications
+REPEATABLE = {'comment'}     # kinds that re-surface a group for an actor already in it
+READ_RETENTION = 30          # days read notifications are kept
+UNREAD_RETENTION = 90        # days unread ones are kept
+COMPACT_INTERVAL = 24 * 3600
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS notification_actors (
+        user_id INTEGER NOT NULL,
+        group_key TEXT NOT NULL,
+        actor_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, group_key, actor_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_notification_actors_created ON notification_actors(created_at);
+    CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_notifications_created ON notifications(created_at);
+"""
+# At most one open (unread) group per key; created after merge_existing() has folded duplicates
+GROUP_INDEX = """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_open_group
+        ON notifications(user_id, group_key) WHERE is_read = 0;
+"""
+
+
+def group_key(kind, post_id=None):
+    return f'{kind}:{post_id}' if post_id else kind
+
+
+def notify(db, user_id, kind, actor_id, post_id=None):
+    """Record kind ('like', 'comment', 'follow') by actor_id for user_id. No commit.
+
+    Returns True if the recipient has something new to be pushed.
+    """
+    if user_id == actor_id:
+        return False
+    key = group_key(kind, post_id)
+    new_actor = db.execute('''INSERT OR IGNORE INTO notification_actors (user_id, group_key, actor_id)
+                              VALUES (?,?,?)''', (user_id, key, actor_id)).rowcount
+    if not new_actor and kind not in REPEATABLE:
+        return False
+    if not db.execute('''
+        UPDATE notifications SET from_user_id=?, actor_count=actor_count + ?, created_at=CURRENT_TIMESTAMP
+        WHERE user_id=? AND group_key=? AND is_read=0
+    ''', (actor_id, new_actor, user_id, key)).rowcount:
+        db.execute('''INSERT INTO notifications (user_id, from_user_id, type, post_id, group_key, actor_count)
+                      VALUES (?,?,?,?,?,1)''', (user_id, actor_id, kind, post_id, key))
+        counters.bump_user(db, user_id, 'unread_notifications', 1)
+    return True
+
+
+def unread_count(db, user_id):
+    row = db.execute('SELECT unread_notifications FROM user_stats WHERE user_id=?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def page(db, user_id, limit=PAGE):
+    return db.execute('''
+        SELECT n.*, u.username, u.avatar_color
+        FROM notifications n
+        JOIN users u ON n.from_user_id = u.id
+        WHERE n.user_id = ?
+        ORDER BY n.created_at DESC
+        LIMIT ?
+    ''', (user_id, limit)).fetchall()
+
+
+def mark_read(db, user_id, ids):
+    """Mark the given (displayed) notifications read. Returns how many changed. No commit."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    changed = db.execute(f'''UPDATE notifications SET is_read=1
+                             WHERE id IN ({','.join('?' * len(ids))}) AND user_id=? AND is_read=0''',
+                         (*ids, user_id)).rowcount
+    if changed:
+        counters.bump_user(db, user_id, 'unread_notifications', -changed)
+    return changed
+
+
+def _delete(db, where, params=()):
+    """Delete notifications matching where, keeping unread counters right."""
+    for user_id, unread in db.execute(f'''SELECT user_id, COUNT(*) FROM notifications
+                                          WHERE ({where}) AND is_read=0 GROUP BY user_id''', params).fetchall():
+        counters.bump_user(db, user_id, 'unread_notifications', -unread)
+    return db.execute(f'DELETE FROM notifications WHERE {where}', params).rowcount
+
+
+def compact(db):
+    """Apply retention: drop old read/unread groups, groups for deleted posts and
+    stale actor records. Returns the number of notifications removed. No commit."""
+    removed = _delete(db, "is_read=1 AND created_at < datetime('now', ?)", (f'-{READ_RETENTION} days',))
+    removed += _delete(db, "created_at < datetime('now', ?)", (f'-{UNREAD_RETENTION} days',))
+    removed += _delete(db, 'post_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM posts WHERE posts.id = notifications.post_id)')
+    db.execute("DELETE FROM notification_actors WHERE created_at < datetime('now', ?)",
+               (f'-{UNREAD_RETENTION} days',))
+    return removed
+
+
+def merge_existing(db):
+    """Fold ungrouped rows into groups (the migration, bulk loads). No commit.
+
+    GROUP_INDEX must not exist yet, or be dropped first.
+    """
+    db.execute("UPDATE notifications SET group_key = type || COALESCE(':' || post_id, '')")
+    db.execute('CREATE INDEX IF NOT EXISTS idx_notifications_merge ON notifications(user_id, group_key, is_read)')
+    db.execute('''
+        INSERT OR IGNORE INTO notification_actors (user_id, group_key, actor_id, created_at)
+        SELECT user_id, group_key, from_user_id, MIN(created_at) FROM notifications
+        GROUP BY user_id, group_key, from_user_id
+    ''')
+    # Keep the newest unread row of each group, counting the distinct actors it absorbs
+    db.execute('''
+        UPDATE notifications SET actor_count = (
+            SELECT COUNT(DISTINCT o.from_user_id) FROM notifications o
+            WHERE o.user_id = notifications.user_id AND o.group_key = notifications.group_key AND o.is_read = 0)
+        WHERE is_read = 0
+    ''')
+    db.execute('''
+        DELETE FROM notifications WHERE is_read = 0 AND id < (
+            SELECT MAX(o.id) FROM notifications o
+            WHERE o.user_id = notifications.user_id AND o.group_key = notifications.group_key AND o.is_read = 0)
+    ''')
+    db.execute('DROP INDEX idx_notifications_merge')
+
+
+@jobs.handler('compact_notifications')
+def _compact_notifications_job(db):
+    compact(db)
+
+jobs.periodic('compact_notifications', COMPACT_INTERVAL)
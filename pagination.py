@@ -0,0 +1,52 @@
+"""Keyset (cursor) pagination on (created_at, id).
+
+A cursor is an opaque url-safe token wrapping the sort key of the last row
+of the previous page. Each page is a range scan that starts right after that
+key, so page N costs the same as page 1.
+"""
+import base64
+import json
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return (created_at, id) or None for a missing/garbled token."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, row_id = json.loads(raw)
+        return str(created_at), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def page_size(value, default=PAGE_SIZE):
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def after(created_col, id_col, cursor, desc=True):
+    """SQL condition + params selecting rows strictly past the cursor."""
+    if cursor is None:
+        return 'TRUE', ()
+    op = '<' if desc else '>'
+    return f'({created_col}, {id_col}) {op} (?, ?)', cursor
+
+
+def split_page(rows, limit, id_key='id'):
+    """Given up to limit+1 rows, return (page, next_cursor)."""
+    page = rows[:limit]
+    if len(rows) <= limit or not page:
+        return page, None
+    last = page[-1]
+    return page, encode_cursor(last['created_at'], last[id_key])
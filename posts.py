@@ -0,0 +1,70 @@
+"""Post listing helpers shared by feed, profile and other listings."""
+from pagination import PAGE_SIZE, after, split_page
+import images
+import timeline
+
+# Keep IN (...) lists under SQLite's bound-parameter limit on older builds
+MEDIA_BATCH = 500
+
+
+def hydrate(db, posts):
+    """Turn post rows into [{'post': dict, 'media': [dict, ...]}, ...].
+
+    Media for the whole page is fetched with one query per MEDIA_BATCH posts
+    and grouped in memory, so the cost does not grow with the page size.
+    """
+    rows = [{'post': dict(p), 'media': []} for p in posts]
+    by_id = {row['post']['id']: row['media'] for row in rows}
+    ids = list(by_id)
+    for start in range(0, len(ids), MEDIA_BATCH):
+        chunk = ids[start:start + MEDIA_BATCH]
+        media = db.execute(f'''
+            SELECT * FROM post_media
+            WHERE post_id IN ({','.join('?' * len(chunk))})
+            ORDER BY post_id, position ASC
+        ''', chunk).fetchall()
+        for m in media:
+            by_id[m['post_id']].append(dict(m, variants=images.load(m['variants'])))
+    return rows
+
+
+def get_posts_with_media(db, uid, where_clause, params, cursor=None, limit=PAGE_SIZE):
+    """Return (post_rows, next_cursor) for one page, newest first."""
+    page_clause, page_params = after('p.created_at', 'p.id', cursor)
+    posts = db.execute(f'''
+        SELECT p.*, u.username, u.avatar_color, u.accent_color,
+               COALESCE(u.avatar_img, '') as avatar_img,
+               COALESCE(ps.like_count, 0) as like_count,
+               COALESCE(ps.comment_count, 0) as comment_count,
+               COALESCE(ps.version, 0) as version,
+               EXISTS(SELECT 1 FROM likes WHERE post_id = p.id AND user_id = ?) as user_liked
+        FROM posts p
+        JOIN users u ON p.user_id = u.id
+        LEFT JOIN post_stats ps ON ps.post_id = p.id
+        WHERE ({where_clause}) AND {page_clause}
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT ?
+    ''', (uid, *params, *page_params, limit + 1)).fetchall()
+    posts, next_cursor = split_page(posts, limit)
+    return hydrate(db, posts), next_cursor
+
+
+def home_feed(db, uid, cursor=None, limit=PAGE_SIZE):
+    if timeline.ENABLED:
+        ids = timeline.page_ids(db, uid, cursor, limit)
+        if not ids:
+            return [], None
+        return get_posts_with_media(db, uid, f"p.id IN ({','.join('?' * len(ids))})", ids, None, limit)
+    return get_posts_with_media(db, uid,
+        'p.user_id IN (SELECT following_id FROM followers WHERE follower_id = ? UNION SELECT ?)',
+        (uid, uid), cursor, limit)
+
+
+def user_posts(db, uid, author_id, cursor=None, limit=PAGE_SIZE):
+    return get_posts_with_media(db, uid, 'p.user_id = ?', (author_id,), cursor, limit)
+
+
+def to_json(post_rows):
+    """Flatten hydrated rows into the shape buildPostHTML() in main.js expects."""
+    return [dict(row['post'], user_liked=bool(row['post']['user_liked']), media=row['media'])
+            for row in post_rows]
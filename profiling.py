@@ -0,0 +1,315 @@
+"""Opt-in request profiling and SQL instrumentation.
+
+With PROFILING=1 every SQLite connection is opened with the Connection class
+below, which times each statement and counts the rows fetched from it, and
+each request records its wall time, statement count and template render
+time. Aggregates per endpoint and per normalized statement (literals and
+IN lists collapsed to ?) are served at /metrics in the Prometheus text
+format, together with pool, job queue and fragment cache gauges. Numbers
+are per process; scrape every worker.
+
+    PROFILING=1            enable (off by default: nothing is wrapped)
+    SLOW_REQUEST_MS=500    log requests slower than this with their query breakdown
+    METRICS_TOKEN=...      require "Authorization: Bearer <token>" on /metrics
+
+Every response also carries a Server-Timing header, so the browser's network
+panel shows the SQL/template split of a single page.
+"""
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import Response, abort, before_render_template, current_app, g, has_request_context
+from flask import request, template_rendered
+
+import coalesce
+import database
+import fragments
+import jobs
+import users
+
+ENABLED = os.environ.get('PROFILING', '0') == '1'
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+MAX_QUERIES = 500           # distinct normalized statements kept; the rest count as 'other'
+REPEAT_WARNING = 10         # a statement run this often in one request is logged as a likely N+1
+SLOW_LOG_QUERIES = 15       # statements listed per slow request
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize(sql):
+    """Statement text with whitespace squeezed and literals replaced by ?."""
+    return _IN_LIST.sub('(?, ...)', _LITERAL.sub('?', ' '.join(sql.split())))
+
+
+# ── Per-request recording ────────────────────────
+
+def _stat(sql, seconds):
+    """Add one execution to the current request; returns its [count, seconds, rows] entry."""
+    if not has_request_context():
+        return None
+    profile = g.get('_profile')
+    if profile is None:
+        return None
+    stat = profile['queries'].setdefault(normalize(sql), [0, 0.0, 0])
+    stat[0] += 1
+    stat[1] += seconds
+    return stat
+
+
+def _fetched(stat, seconds, rows):
+    if stat is not None:
+        stat[1] += seconds
+        stat[2] += rows
+
+
+class Cursor(sqlite3.Cursor):
+    _entry = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._entry = _stat(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._entry = _stat(sql, time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        _fetched(self._entry, time.perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        _fetched(self._entry, time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        _fetched(self._entry, time.perf_counter() - started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            _fetched(self._entry, time.perf_counter() - started, 0)
+            raise
+        _fetched(self._entry, time.perf_counter() - started, 1)
+        return row
+
+
+class Connection(sqlite3.Connection):
+    """sqlite3 connection whose statements are timed (database._connect factory)."""
+    cursor_class = Cursor
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or self.cursor_class)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _start():
+    g._profile = {'started': time.perf_counter(), 'queries': {}, 'template_seconds': 0.0}
+
+
+def _template_started(sender, template, context, **extra):
+    if g.get('_profile') is not None:
+        g._profile['template_started'] = time.perf_counter()
+
+
+def _template_finished(sender, template, context, **extra):
+    profile = g.get('_profile')
+    if profile is not None and 'template_started' in profile:
+        profile['template_seconds'] += time.perf_counter() - profile.pop('template_started')
+
+
+# ── Aggregation ──────────────────────────────────
+
+_lock = threading.Lock()
+_requests = {}      # (endpoint, method, status) -> count
+_endpoints = {}     # endpoint -> {'buckets': [...], 'seconds', 'count', 'statements', 'sql_seconds', 'template_seconds'}
+_queries = {}       # normalized statement -> [count, seconds, rows]
+
+
+def _finish(response):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return response
+    elapsed = time.perf_counter() - profile['started']
+    queries = profile['queries']
+    statements = sum(stat[0] for stat in queries.values())
+    sql_seconds = sum(stat[1] for stat in queries.values())
+    endpoint = request.endpoint or 'unmatched'
+
+    with _lock:
+        key = (endpoint, request.method, response.status_code)
+        _requests[key] = _requests.get(key, 0) + 1
+        agg = _endpoints.setdefault(endpoint, {
+            'buckets': [0] * len(DURATION_BUCKETS), 'seconds': 0.0, 'count': 0,
+            'statements': 0, 'sql_seconds': 0.0, 'template_seconds': 0.0})
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if elapsed <= bound:
+                agg['buckets'][i] += 1
+        agg['seconds'] += elapsed
+        agg['count'] += 1
+        agg['statements'] += statements
+        agg['sql_seconds'] += sql_seconds
+        agg['template_seconds'] += profile['template_seconds']
+        for sql, (count, seconds, rows) in queries.items():
+            if sql not in _queries and len(_queries) >= MAX_QUERIES:
+                sql = 'other'
+            total = _queries.setdefault(sql, [0, 0.0, 0])
+            total[0] += count
+            total[1] += seconds
+            total[2] += rows
+
+    response.headers['Server-Timing'] = (
+        f'sql;dur={sql_seconds * 1000:.1f};desc="{statements} queries", '
+        f'tpl;dur={profile["template_seconds"] * 1000:.1f}, total;dur={elapsed * 1000:.1f}')
+
+    repeated = any(stat[0] >= REPEAT_WARNING for stat in queries.values())
+    if elapsed * 1000 >= SLOW_REQUEST_MS or repeated:
+        _log_slow(endpoint, elapsed, profile['template_seconds'], queries)
+    return response
+
+
+def _log_slow(endpoint, elapsed, template_seconds, queries):
+    lines = [f'{"slow" if elapsed * 1000 >= SLOW_REQUEST_MS else "repeated queries"}: '
+             f'{request.method} {request.full_path.rstrip("?")} ({endpoint}) {elapsed * 1000:.1f}ms, '
+             f'{sum(s[0] for s in queries.values())} queries, template {template_seconds * 1000:.1f}ms']
+    ranked = sorted(queries.items(), key=lambda item: item[1][1], reverse=True)
+    for sql, (count, seconds, rows) in ranked[:SLOW_LOG_QUERIES]:
+        flag = '  N+1?' if count >= REPEAT_WARNING else ''
+        lines.append(f'  {seconds * 1000:8.1f}ms x{count:<4} rows={rows:<6}{flag} {sql}')
+    current_app.logger.warning('\n'.join(lines))
+
+
+def snapshot():
+    """Copy of the aggregates: (requests, endpoints, queries)."""
+    with _lock:
+        return (dict(_requests), {k: dict(v, buckets=list(v['buckets'])) for k, v in _endpoints.items()},
+                {k: list(v) for k, v in _queries.items()})
+
+
+def reset():
+    with _lock:
+        _requests.clear()
+        _endpoints.clear()
+        _queries.clear()
+
+
+# ── Prometheus exposition ────────────────────────
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_label(v)}"' for k, v in labels.items()) + '}'
+
+
+def _number(value):
+    return f'{value:.6f}' if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    requests, endpoints, queries = snapshot()
+    out = []
+
+    def family(name, kind, help_text):
+        out.append(f'# HELP {name} {help_text}')
+        out.append(f'# TYPE {name} {kind}')
+
+    family('app_requests_total', 'counter', 'Requests by endpoint, method and status.')
+    for (endpoint, method, status), count in sorted(requests.items()):
+        out.append(f'app_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+    family('app_request_duration_seconds', 'histogram', 'Request wall time.')
+    for endpoint, agg in sorted(endpoints.items()):
+        for bound, count in zip(DURATION_BUCKETS, agg['buckets']):
+            out.append(f'app_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=bound)} {count}')
+        out.append(f'app_request_duration_seconds_bucket{_labels(endpoint=endpoint, le="+Inf")} {agg["count"]}')
+        out.append(f'app_request_duration_seconds_sum{_labels(endpoint=endpoint)} {_number(agg["seconds"])}')
+        out.append(f'app_request_duration_seconds_count{_labels(endpoint=endpoint)} {agg["count"]}')
+
+    for name, key, help_text in (
+        ('app_request_sql_statements_total', 'statements', 'SQL statements issued, by endpoint.'),
+        ('app_request_sql_seconds_total', 'sql_seconds', 'Time spent in SQL, by endpoint.'),
+        ('app_request_template_seconds_total', 'template_seconds', 'Time spent rendering templates, by endpoint.'),
+    ):
+        family(name, 'counter', help_text)
+        for endpoint, agg in sorted(endpoints.items()):
+            out.append(f'{name}{_labels(endpoint=endpoint)} {_number(agg[key])}')
+
+    for name, index, help_text in (
+        ('app_sql_executions_total', 0, 'Executions per normalized statement.'),
+        ('app_sql_seconds_total', 1, 'Execute and fetch time per normalized statement.'),
+        ('app_sql_rows_total', 2, 'Rows fetched per normalized statement.'),
+    ):
+        family(name, 'counter', help_text)
+        for sql, stat in sorted(queries.items()):
+            out.append(f'{name}{_labels(query=sql)} {_number(stat[index])}')
+
+    family('app_db_pool', 'gauge', 'Connection pool counters (database.pool_stats).')
+    for key, value in sorted(database.pool_stats().items()):
+        out.append(f'app_db_pool{_labels(stat=key)} {value}')
+
+    family('app_fragment_cache', 'gauge', 'Rendered fragment cache state (fragments.stats).')
+    for cache, stats in sorted(fragments.stats().items()):
+        for key, value in sorted(stats.items()):
+            out.append(f'app_fragment_cache{_labels(cache=cache, stat=key)} {value}')
+
+    family('app_user_cache', 'gauge', 'Cached user profile rows (users.stats).')
+    for key, value in sorted(users.stats().items()):
+        out.append(f'app_user_cache{_labels(stat=key)} {value}')
+
+    family('app_write_coalescing', 'gauge', 'Batched like/follow writes (coalesce.stats).')
+    for key, value in sorted(coalesce.stats().items()):
+        out.append(f'app_write_coalescing{_labels(stat=key)} {_number(value)}')
+
+    family('app_jobs', 'gauge', 'Background job queue (jobs.stats).')
+    for key, value in jobs.stats(database.get_read_db()).items():
+        out.append(f'app_jobs{_labels(stat=key)} {value}')
+
+    return '\n'.join(out) + '\n'
+
+
+def metrics():
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        abort(401)
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Install the hooks and /metrics; does nothing unless PROFILING=1."""
+    if not ENABLED:
+        return
+    app.before_request(_start)
+    app.after_request(_finish)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics)
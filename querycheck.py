@@ -0,0 +1,94 @@
+"""EXPLAIN QUERY PLAN regression check for the SQL the routes actually run.
+
+Drives the app through its hot endpoints with a test client against a
+scratch database, records every statement via database.trace_callback and
+reports the ones whose plan falls back to a full table scan.
+"""
+import os
+import re
+import shutil
+import tempfile
+
+import coalesce
+import database
+
+# Known full scans: substring of the statement -> reason it is accepted
+ALLOWED_SCANS = {}
+
+# "SCAN t" is a full scan; "SCAN t USING [COVERING] INDEX ..." walks an index
+FULL_SCAN = re.compile(r'^SCAN (?!CONSTANT ROW)(\S+)$')
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+# Statements FTS5 issues against its own shadow tables, e.g. FROM 'main'.'posts_fts_config'
+INTERNAL = re.compile(r"'main'\.'\w+_fts_\w+'")
+
+
+def _exercise(client_factory, db):
+    alice, bobby = client_factory('alice'), client_factory('bobby')
+    ids = {r['username']: r['id'] for r in db.execute('SELECT id, username FROM users')}
+    post_id = alice.post('/post', data={'content': 'hello'}).get_json()['post']['id']
+    bobby.post(f'/api/posts/{post_id}/like', json={})
+    bobby.post(f'/like/{post_id}')
+    comment = bobby.post(f'/api/comments/{post_id}', json={'content': 'hi'}).get_json()
+    bobby.post(f"/follow/{ids['alice']}")
+    bobby.post('/story/create', data={'content': 'story'})
+    story_id = db.execute('SELECT MAX(id) FROM stories').fetchone()[0]
+
+    cursor = bobby.get('/api/feed?limit=1').get_json()['next_cursor']
+    for path in (
+        '/', f'/api/feed?cursor={cursor}', '/profile/alice', f"/api/users/{ids['alice']}/posts",
+        '/search', '/search?q=ali', '/search?q=hel', '/notifications/count', '/notifications',
+        f'/api/comments/{post_id}', f"/api/users/{ids['alice']}/followers",
+        f"/api/users/{ids['bobby']}/following", f'/story/{story_id}',
+        f"/api/batch?posts={post_id},{post_id + 1}&users={ids['alice']},{ids['bobby']}",
+    ):
+        bobby.get(path)
+    bobby.post(f"/api/comments/{comment['id']}/delete")
+    alice.post(f'/api/posts/{post_id}/delete')
+
+
+def full_scans(db, statements):
+    """Return [(sql, plan_detail)] for statements that scan a whole table."""
+    found = []
+    for sql in dict.fromkeys(' '.join(s.split()) for s in statements):
+        if not sql.upper().startswith(EXPLAINABLE) or INTERNAL.search(sql):
+            continue
+        if any(marker in sql for marker in ALLOWED_SCANS):
+            continue
+        plan = [row[3] for row in db.execute(f'EXPLAIN QUERY PLAN {sql}')]
+        # Scanning a LIMITed subquery's result is not a table scan
+        subqueries = {d.split()[-1] for d in plan if d.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+        for detail in plan:
+            scan = FULL_SCAN.match(detail)
+            if scan and scan.group(1) not in subqueries:
+                found.append((sql, detail))
+    return found
+
+
+def check(app):
+    """Run the scripted traffic against a throwaway DB and return its full scans."""
+    statements = []
+    workdir = tempfile.mkdtemp()
+    saved_db, saved_trace, saved_coalescing = database.DATABASE, database.trace_callback, coalesce.ENABLED
+    database.DATABASE = os.path.join(workdir, 'social.db')
+    # Toggles run the same statements inline, while the trace callback is installed
+    coalesce.ENABLED = False
+    try:
+        database.init_db()
+        database.migrate_db()
+
+        def client_factory(name):
+            client = app.test_client()
+            client.post('/register', data={'username': name, 'password': 'secret1'})
+            client.post('/login', data={'username': name, 'password': 'secret1'})
+            return client
+
+        database.trace_callback = statements.append
+        with app.app_context():
+            db = database.get_db()
+            _exercise(client_factory, db)
+            database.trace_callback = None
+            db.set_trace_callback(None)
+            return full_scans(db, statements)
+    finally:
+        database.DATABASE, database.trace_callback, coalesce.ENABLED = saved_db, saved_trace, saved_coalescing
+        shutil.rmtree(workdir, ignore_errors=True)
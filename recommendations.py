@@ -0,0 +1,131 @@
+"""Precomputed "who to follow" suggestions.
+
+A periodic job (or `flask refresh-recommendations`) scores friends-of-friends
+candidates for each user, blends in popularity and stores the top TOP_N.
+The feed serves them with one indexed lookup; while a user's list is
+missing or older than TTL it falls back to the most-followed accounts.
+"""
+import math
+import time
+
+import jobs
+
+TOP_N = 20          # candidates stored per user
+SHOW = 5            # candidates shown in the feed sidebar
+TTL = 6 * 3600      # seconds before a stored list is considered stale
+MUTUAL_WEIGHT = 3.0 # score per followed account that also follows the candidate
+REFRESH_INTERVAL = 300  # seconds between refresh jobs; invalidated lists go first
+REFRESH_BATCH = 1000    # users recomputed per job, so one run stays short
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS recommendations (
+        user_id INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        candidate_id INTEGER NOT NULL,
+        score REAL NOT NULL,
+        mutual_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, rank),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (candidate_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+    CREATE TABLE IF NOT EXISTS recommendation_state (
+        user_id INTEGER PRIMARY KEY,
+        computed_at REAL NOT NULL,
+        dirty INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_user_stats_followers ON user_stats(followers_count);
+"""
+
+
+def compute(db, uid):
+    """Score candidates for one user and replace their stored list. No commit."""
+    candidates = {}
+    rows = db.execute('''
+        SELECT f2.following_id AS candidate_id, COUNT(*) AS mutual_count,
+               COALESCE(us.followers_count, 0) AS followers_count
+        FROM followers f1
+        JOIN followers f2 ON f2.follower_id = f1.following_id
+        LEFT JOIN user_stats us ON us.user_id = f2.following_id
+        WHERE f1.follower_id = ?
+          AND f2.following_id != ?
+          AND f2.following_id NOT IN (SELECT following_id FROM followers WHERE follower_id = ?)
+        GROUP BY f2.following_id, us.followers_count
+    ''', (uid, uid, uid)).fetchall()
+    for r in rows:
+        candidates[r['candidate_id']] = (
+            MUTUAL_WEIGHT * r['mutual_count'] + math.log1p(r['followers_count']), r['mutual_count'])
+
+    if len(candidates) < TOP_N:
+        for r in _popular(db, uid, TOP_N + len(candidates)):
+            candidates.setdefault(r['id'], (math.log1p(r['followers_count']), 0))
+
+    ranked = sorted(candidates.items(), key=lambda item: item[1][0], reverse=True)[:TOP_N]
+    db.execute('DELETE FROM recommendations WHERE user_id=?', (uid,))
+    db.executemany(
+        'INSERT INTO recommendations (user_id, rank, candidate_id, score, mutual_count) VALUES (?,?,?,?,?)',
+        [(uid, rank, cid, score, mutual) for rank, (cid, (score, mutual)) in enumerate(ranked)])
+    db.execute('''
+        INSERT INTO recommendation_state (user_id, computed_at, dirty) VALUES (?, ?, 0)
+        ON CONFLICT(user_id) DO UPDATE SET computed_at = excluded.computed_at, dirty = 0
+    ''', (uid, time.time()))
+
+
+def refresh(db, limit=None):
+    """Recompute lists that are missing, stale or invalidated. Returns the number refreshed."""
+    stale = db.execute(f'''
+        SELECT u.id FROM users u
+        LEFT JOIN recommendation_state rs ON rs.user_id = u.id
+        WHERE rs.computed_at IS NULL OR rs.computed_at < ? OR rs.dirty = 1
+        ORDER BY rs.dirty DESC, COALESCE(rs.computed_at, 0)
+        {'' if limit is None else 'LIMIT ?'}
+    ''', (time.time() - TTL, *(() if limit is None else (limit,)))).fetchall()
+    for row in stale:
+        compute(db, row['id'])
+        db.commit()
+    return len(stale)
+
+
+def invalidate(db, uid, followed_id=None):
+    """Called on follow/unfollow: drop the followed account and queue a recompute. No commit.
+
+    The rest of the stored list keeps being served until the batch job runs.
+    """
+    if followed_id is not None:
+        db.execute('DELETE FROM recommendations WHERE user_id=? AND candidate_id=?', (uid, followed_id))
+    db.execute('UPDATE recommendation_state SET dirty = 1 WHERE user_id=?', (uid,))
+
+
+def _popular(db, uid, limit):
+    return db.execute('''
+        SELECT u.*, COALESCE(u.avatar_img,'') as avatar_img, us.followers_count
+        FROM user_stats us
+        JOIN users u ON u.id = us.user_id
+        WHERE us.user_id != ?
+          AND us.user_id NOT IN (SELECT following_id FROM followers WHERE follower_id = ?)
+        ORDER BY us.followers_count DESC
+        LIMIT ?
+    ''', (uid, uid, limit)).fetchall()
+
+
+def for_user(db, uid, limit=SHOW):
+    """Suggestions for the feed sidebar: the stored list if fresh, else popular accounts."""
+    rows = db.execute('''
+        SELECT u.*, COALESCE(u.avatar_img,'') as avatar_img,
+               COALESCE(us.followers_count, 0) as followers_count, r.mutual_count
+        FROM recommendation_state rs
+        JOIN recommendations r ON r.user_id = rs.user_id
+        JOIN users u ON u.id = r.candidate_id
+        LEFT JOIN user_stats us ON us.user_id = u.id
+        WHERE rs.user_id = ? AND rs.computed_at >= ?
+        ORDER BY r.rank
+        LIMIT ?
+    ''', (uid, time.time() - TTL, limit)).fetchall()
+    return rows or _popular(db, uid, limit)
+
+
+@jobs.handler('refresh_recommendations')
+def _refresh_recommendations_job(db):
+    refresh(db, REFRESH_BATCH)
+
+jobs.periodic('refresh_recommendations', REFRESH_INTERVAL)
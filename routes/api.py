@@ -1,6 +1,17 @@
 from flask import Blueprint, request, session, jsonify
-from database import get_db
+from database import get_db, get_read_db
 from media import delete_file
+from counters import bump_post, bump_user
+from pagination import decode_cursor, page_size, after, split_page
+from posts import home_feed, user_posts, to_json
+import batch
+import coalesce
+import events
+import stories
+import fragments
+import notifications
+import trending
+import uploads
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -13,18 +24,56 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated
 
+def page_args():
+    return decode_cursor(request.args.get('cursor')), page_size(request.args.get('limit'))
+
+# ── FEED ──────────────────────────────────────────
+@api_bp.route('/feed')
+@login_required
+def get_feed():
+    cursor, limit = page_args()
+    post_rows, next_cursor = home_feed(get_read_db(), session['user_id'], cursor, limit)
+    return jsonify({'items': to_json(post_rows), 'next_cursor': next_cursor})
+
+@api_bp.route('/users/<int:user_id>/posts')
+@login_required
+def get_user_posts(user_id):
+    cursor, limit = page_args()
+    post_rows, next_cursor = user_posts(get_read_db(), session['user_id'], user_id, cursor, limit)
+    return jsonify({'items': to_json(post_rows), 'next_cursor': next_cursor})
+
+# ── BATCH ─────────────────────────────────────────
+@api_bp.route('/batch')
+@login_required
+def get_batch():
+    """?posts=1,2,3&users=4,5&comments=2 -> counts, liked/following state and
+    comment previews for every id in one response."""
+    post_ids = batch.parse_ids(request.args.get('posts'))
+    user_ids = batch.parse_ids(request.args.get('users'))
+    if len(post_ids) > batch.MAX_IDS or len(user_ids) > batch.MAX_IDS:
+        return jsonify({'error': f'At most {batch.MAX_IDS} ids per list'}), 400
+    preview = max(0, min(request.args.get('comments', batch.PREVIEW, type=int), batch.MAX_PREVIEW))
+    db = get_read_db()
+    uid = session['user_id']
+    return jsonify({'posts': batch.post_states(db, uid, post_ids, preview),
+                    'users': batch.user_states(db, uid, user_ids)})
+
 # ── COMMENTS ──────────────────────────────────────
 @api_bp.route('/comments/<int:post_id>', methods=['GET'])
 @login_required
 def get_comments(post_id):
-    db = get_db()
-    uid = session['user_id']
-    comments = db.execute('''
+    db = get_read_db()
+    cursor, limit = page_args()
+    page_clause, page_params = after('c.created_at', 'c.id', cursor, desc=False)
+    comments = db.execute(f'''
         SELECT c.*, u.username, u.avatar_color, COALESCE(u.avatar_img,'') as avatar_img
         FROM comments c JOIN users u ON c.user_id = u.id
-        WHERE c.post_id = ? ORDER BY c.created_at ASC
-    ''', (post_id,)).fetchall()
-    return jsonify([dict(c) for c in comments])
+        WHERE c.post_id = ? AND {page_clause}
+        ORDER BY c.created_at ASC, c.id ASC
+        LIMIT ?
+    ''', (post_id, *page_params, limit + 1)).fetchall()
+    comments, next_cursor = split_page(comments, limit)
+    return jsonify({'items': [dict(c) for c in comments], 'next_cursor': next_cursor})
 
 @api_bp.route('/comments/<int:post_id>', methods=['POST'])
 @login_required
@@ -34,14 +83,17 @@ def add_comment(post_id):
         return jsonify({'error': 'Empty'}), 400
     db = get_db()
     uid = session['user_id']
-    db.execute('INSERT INTO comments (post_id, user_id, content) VALUES (?,?,?)', (post_id, uid, content))
+    cursor = db.execute('INSERT INTO comments (post_id, user_id, content) VALUES (?,?,?)', (post_id, uid, content))
+    comment_id = cursor.lastrowid
+    bump_post(db, post_id, 'comment_count', 1)
+    trending.record(db, post_id, 'comment')
     post = db.execute('SELECT user_id FROM posts WHERE id=?', (post_id,)).fetchone()
-    if post and post['user_id'] != uid:
-        db.execute('INSERT INTO notifications (user_id, from_user_id, type, post_id) VALUES (?,?,?,?)',
-                   (post['user_id'], uid, 'comment', post_id))
+    notify = post and notifications.notify(db, post['user_id'], 'comment', uid, post_id)
     db.commit()
+    if notify:
+        events.publish_notification(db, post['user_id'], 'comment', uid, post_id)
     c = db.execute('''SELECT c.*, u.username, u.avatar_color, COALESCE(u.avatar_img,'') as avatar_img
-        FROM comments c JOIN users u ON c.user_id=u.id WHERE c.id=last_insert_rowid()''').fetchone()
+        FROM comments c JOIN users u ON c.user_id=u.id WHERE c.id=?''', (comment_id,)).fetchone()
     return jsonify(dict(c))
 
 @api_bp.route('/comments/<int:comment_id>/delete', methods=['POST'])
@@ -57,6 +109,8 @@ def delete_comment(comment_id):
     if comment['user_id'] != uid and (not post or post['user_id'] != uid):
         return jsonify({'error': 'Forbidden'}), 403
     db.execute('DELETE FROM comments WHERE id=?', (comment_id,))
+    bump_post(db, comment['post_id'], 'comment_count', -1)
+    trending.record(db, comment['post_id'], 'comment', -1)
     db.commit()
     return jsonify({'deleted': True})
 
@@ -64,22 +118,8 @@ def delete_comment(comment_id):
 @api_bp.route('/posts/<int:post_id>/like', methods=['POST'])
 @login_required
 def toggle_like(post_id):
-    db = get_db()
-    uid = session['user_id']
-    emoji = request.json.get('emoji', '❤️') if request.is_json else '❤️'
-    like = db.execute('SELECT 1 FROM likes WHERE user_id=? AND post_id=?', (uid, post_id)).fetchone()
-    if like:
-        db.execute('DELETE FROM likes WHERE user_id=? AND post_id=?', (uid, post_id))
-        liked = False
-    else:
-        db.execute('INSERT INTO likes (user_id, post_id) VALUES (?,?)', (uid, post_id))
-        post = db.execute('SELECT user_id FROM posts WHERE id=?', (post_id,)).fetchone()
-        if post and post['user_id'] != uid:
-            db.execute('INSERT OR IGNORE INTO notifications (user_id, from_user_id, type, post_id) VALUES (?,?,?,?)',
-                       (post['user_id'], uid, 'like', post_id))
-        liked = True
-    db.commit()
-    count = db.execute('SELECT COUNT(*) FROM likes WHERE post_id=?', (post_id,)).fetchone()[0]
+    # Applied by coalesce.py's flusher in a batched transaction; the answer is optimistic
+    liked, count = coalesce.toggle_like(session['user_id'], post_id)
     return jsonify({'liked': liked, 'count': count})
 
 @api_bp.route('/posts/<int:post_id>/delete', methods=['POST'])
@@ -92,14 +132,47 @@ def delete_post(post_id):
         return jsonify({'error': 'Not found'}), 404
     if post['user_id'] != uid:
         return jsonify({'error': 'Forbidden'}), 403
-    # Delete media files
-    media = db.execute('SELECT filename FROM post_media WHERE post_id=?', (post_id,)).fetchall()
+    # Files are shared between identical uploads; the worker removes them at refcount zero
+    media = db.execute('SELECT filename, variants FROM post_media WHERE post_id=?', (post_id,)).fetchall()
     for m in media:
-        delete_file(m['filename'])
+        delete_file(db, m['filename'], m['variants'])
     db.execute('DELETE FROM posts WHERE id=?', (post_id,))
+    bump_user(db, uid, 'post_count', -1)
     db.commit()
+    fragments.forget(post_id)
     return jsonify({'deleted': True})
 
+# ── UPLOADS (chunked, resumable) ──────────────────
+@api_bp.errorhandler(uploads.UploadError)
+def upload_error(e):
+    return jsonify({'error': str(e), **e.extra}), e.status
+
+@api_bp.route('/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    return jsonify(uploads.create(get_db(), session['user_id'], data.get('filename'),
+                                  data.get('size'), data.get('sha256'))), 201
+
+@api_bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_upload(upload_id):
+    return jsonify(uploads.status(get_read_db(), session['user_id'], upload_id))
+
+@api_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def put_upload_chunk(upload_id):
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'offset required'}), 400
+    return jsonify(uploads.receive(get_read_db(), get_db, session['user_id'], upload_id,
+                                   offset, request.stream, request.content_length))
+
+@api_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    return jsonify(uploads.complete(get_read_db(), get_db, session['user_id'], upload_id))
+
 # ── STORIES ───────────────────────────────────────
 @api_bp.route('/stories/<int:story_id>/delete', methods=['POST'])
 @login_required
@@ -111,7 +184,7 @@ def delete_story(story_id):
         return jsonify({'error': 'Not found'}), 404
     if story['user_id'] != uid:
         return jsonify({'error': 'Forbidden'}), 403
-    db.execute('DELETE FROM stories WHERE id=?', (story_id,))
+    stories.delete(db, story_id)
     db.commit()
     return jsonify({'deleted': True})
 
@@ -119,25 +192,37 @@ def delete_story(story_id):
 @api_bp.route('/users/<int:user_id>/followers')
 @login_required
 def get_followers(user_id):
-    db = get_db()
+    db = get_read_db()
     uid = session['user_id']
-    users = db.execute('''
+    cursor, limit = page_args()
+    page_clause, page_params = after('f.created_at', 'f.follower_id', cursor)
+    users = db.execute(f'''
         SELECT u.id, u.username, u.avatar_color, COALESCE(u.avatar_img,'') as avatar_img,
+               f.created_at,
                EXISTS(SELECT 1 FROM followers WHERE follower_id=? AND following_id=u.id) as is_following
         FROM followers f JOIN users u ON f.follower_id = u.id
-        WHERE f.following_id=? ORDER BY f.created_at DESC
-    ''', (uid, user_id)).fetchall()
-    return jsonify([dict(u) for u in users])
+        WHERE f.following_id=? AND {page_clause}
+        ORDER BY f.created_at DESC, f.follower_id DESC
+        LIMIT ?
+    ''', (uid, user_id, *page_params, limit + 1)).fetchall()
+    users, next_cursor = split_page(users, limit)
+    return jsonify({'items': [dict(u) for u in users], 'next_cursor': next_cursor})
 
 @api_bp.route('/users/<int:user_id>/following')
 @login_required
 def get_following(user_id):
-    db = get_db()
+    db = get_read_db()
     uid = session['user_id']
-    users = db.execute('''
+    cursor, limit = page_args()
+    page_clause, page_params = after('f.created_at', 'f.following_id', cursor)
+    users = db.execute(f'''
         SELECT u.id, u.username, u.avatar_color, COALESCE(u.avatar_img,'') as avatar_img,
+               f.created_at,
                EXISTS(SELECT 1 FROM followers WHERE follower_id=? AND following_id=u.id) as is_following
         FROM followers f JOIN users u ON f.following_id = u.id
-        WHERE f.follower_id=? ORDER BY f.created_at DESC
-    ''', (uid, user_id)).fetchall()
-    return jsonify([dict(u) for u in users])
\ No newline at end of file
+        WHERE f.follower_id=? AND {page_clause}
+        ORDER BY f.created_at DESC, f.following_id DESC
+        LIMIT ?
+    ''', (uid, user_id, *page_params, limit + 1)).fetchall()
+    users, next_cursor = split_page(users, limit)
+    return jsonify({'items': [dict(u) for u in users], 'next_cursor': next_cursor})
\ No newline at end of file
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, session, redirect, url_for, render_template, flash
 from werkzeug.security import generate_password_hash, check_password_hash
-from database import get_db
+from database import get_db, get_read_db
+import cooperative
 import sqlite3
 
 auth_bp = Blueprint('auth', __name__)
@@ -15,10 +16,12 @@ def register():
         elif len(password) < 6:
             flash('Пароль має бути мінімум 6 символів', 'error')
         else:
+            # Hash before taking the writer: PBKDF2 is deliberately slow
+            password_hash = cooperative.blocking(generate_password_hash, password)
             db = get_db()
             try:
                 db.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)',
-                           (username, generate_password_hash(password)))
+                           (username, password_hash))
                 db.commit()
                 flash('Акаунт створено!', 'success')
                 return redirect(url_for('auth.login'))
@@ -31,15 +34,11 @@ def login():
     if request.method == 'POST':
         username = request.form['username'].strip()
         password = request.form['password']
-        db = get_db()
+        db = get_read_db()
         user = db.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        if user and check_password_hash(user['password_hash'], password):
-            user = dict(user)
+        if user and cooperative.blocking(check_password_hash, user['password_hash'], password):
+            # Profile fields come from users.current(); a new user_id gets a new session id
             session['user_id'] = user['id']
-            session['username'] = user['username']
-            session['theme'] = user.get('theme') or 'light'
-            session['accent'] = user.get('accent_color') or '#6366f1'
-            session['avatar_img'] = user.get('avatar_img') or ''
             return redirect(url_for('feed.index'))
         flash('Неправильний логін або пароль', 'error')
     return render_template('auth.html', mode='login')
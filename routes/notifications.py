@@ -1,8 +1,16 @@
-from flask import Blueprint, request, session, redirect, url_for, render_template, jsonify
-from database import get_db
+from flask import Blueprint, request, session, redirect, url_for, render_template, jsonify, Response
+from database import get_db, get_read_db, release_db
+import events
+import notifications
+import json
+import queue
+import time
 
 notif_bp = Blueprint('notifications', __name__)
 
+STREAM_SECONDS = 300   # close the stream periodically; EventSource reconnects
+HEARTBEAT = 20         # comment line keeps proxies from timing out idle streams
+
 def login_required(f):
     from functools import wraps
     @wraps(f)
@@ -14,25 +22,53 @@ def login_required(f):
 
 @notif_bp.route('/notifications')
 @login_required
-def notifications():
-    db = get_db()
+def index():
     uid = session['user_id']
-    notifs = db.execute('''
-        SELECT n.*, u.username, u.avatar_color
-        FROM notifications n
-        JOIN users u ON n.from_user_id = u.id
-        WHERE n.user_id = ?
-        ORDER BY n.created_at DESC
-        LIMIT 50
-    ''', (uid,)).fetchall()
-    db.execute('UPDATE notifications SET is_read=1 WHERE user_id=?', (uid,))
-    db.commit()
+    notifs = notifications.page(get_read_db(), uid)
+    # Only what this page shows becomes read; older unread groups keep the badge
+    unread = [n['id'] for n in notifs if not n['is_read']]
+    if unread:
+        db = get_db()
+        changed = notifications.mark_read(db, uid, unread)
+        db.commit()
+        # The process has one writer: don't keep it through the render
+        release_db()
+        if changed:
+            events.publish_count(get_read_db(), uid)
     return render_template('notifications.html', notifications=notifs)
 
 @notif_bp.route('/notifications/count')
 @login_required
 def notif_count():
-    db = get_db()
-    count = db.execute('SELECT COUNT(*) FROM notifications WHERE user_id=? AND is_read=0',
-                       (session['user_id'],)).fetchone()[0]
-    return jsonify({'count': count})
\ No newline at end of file
+    return jsonify({'count': notifications.unread_count(get_read_db(), session['user_id'])})
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+@notif_bp.route('/notifications/stream')
+@login_required
+def notif_stream():
+    uid = session['user_id']
+    # Read the starting count now: the connection goes back to the pool before streaming
+    count = events.unread_count(get_read_db(), uid)
+
+    def stream():
+        q = events.broker.subscribe(uid)
+        try:
+            yield 'retry: 5000\n\n'
+            yield sse('count', {'count': count})
+            deadline = time.monotonic() + STREAM_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    message = q.get(timeout=HEARTBEAT)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                yield sse(message['event'], message['data'])
+        finally:
+            events.broker.unsubscribe(uid, q)
+
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
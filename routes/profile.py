@@ -1,14 +1,15 @@
 from flask import Blueprint, request, session, redirect, url_for, render_template, flash, jsonify
-from database import get_db
-from media import save_file
-import os, uuid
-from werkzeug.utils import secure_filename
+from database import get_db, get_read_db
+from media import stage_avatar, save_avatar, delete_file
+from counters import get_user_counts
+from posts import user_posts
+import images
+import media
+import users
+import coalesce
 
 profile_bp = Blueprint('profile', __name__)
 
-AVATAR_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static', 'uploads', 'avatars')
-ALLOWED_AVATAR = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
-
 def login_required(f):
     from functools import wraps
     @wraps(f)
@@ -21,66 +22,38 @@ def login_required(f):
 @profile_bp.route('/profile/<username>')
 @login_required
 def profile(username):
-    db = get_db()
-    user = db.execute('SELECT * FROM users WHERE username=?', (username,)).fetchone()
+    db = get_read_db()
+    user = users.by_username(db, username)
     if not user:
         return render_template('404.html'), 404
-    user = dict(user)
     uid = session['user_id']
 
-    posts = db.execute('''
-        SELECT p.*,
-               (SELECT COUNT(*) FROM likes WHERE post_id=p.id) as like_count,
-               (SELECT COUNT(*) FROM comments WHERE post_id=p.id) as comment_count,
-               EXISTS(SELECT 1 FROM likes WHERE post_id=p.id AND user_id=?) as user_liked
-        FROM posts p WHERE p.user_id=?
-        ORDER BY p.created_at DESC
-    ''', (uid, user['id'])).fetchall()
-
-    post_rows = []
-    for post in posts:
-        media = db.execute('SELECT * FROM post_media WHERE post_id=? ORDER BY position', (post['id'],)).fetchall()
-        post_rows.append({'post': dict(post), 'media': [dict(m) for m in media]})
+    post_rows, next_cursor = user_posts(db, uid, user['id'])
 
-    followers_count = db.execute('SELECT COUNT(*) FROM followers WHERE following_id=?', (user['id'],)).fetchone()[0]
-    following_count = db.execute('SELECT COUNT(*) FROM followers WHERE follower_id=?', (user['id'],)).fetchone()[0]
+    counts = get_user_counts(db, user['id'])
     is_following = db.execute('SELECT 1 FROM followers WHERE follower_id=? AND following_id=?',
                               (uid, user['id'])).fetchone() is not None
 
     return render_template('profile.html', user=user, post_rows=post_rows,
-                           followers_count=followers_count,
-                           following_count=following_count,
+                           next_cursor=next_cursor, counts=counts,
                            is_following=is_following)
 
 @profile_bp.route('/follow/<int:user_id>', methods=['POST'])
 @login_required
 def follow(user_id):
-    db = get_db()
     uid = session['user_id']
     if uid == user_id:
         return jsonify({'error': 'cannot follow self'}), 400
-    existing = db.execute('SELECT 1 FROM followers WHERE follower_id=? AND following_id=?', (uid, user_id)).fetchone()
-    if existing:
-        db.execute('DELETE FROM followers WHERE follower_id=? AND following_id=?', (uid, user_id))
-        following = False
-    else:
-        db.execute('INSERT INTO followers (follower_id, following_id) VALUES (?,?)', (uid, user_id))
-        db.execute('INSERT INTO notifications (user_id, from_user_id, type) VALUES (?,?,?)',
-                   (user_id, uid, 'follow'))
-        following = True
-    db.commit()
-    return jsonify({'following': following})
+    return jsonify({'following': coalesce.toggle_follow(uid, user_id)})
 
 @profile_bp.route('/profile/<username>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_profile(username):
-    if session['username'] != username:
-        return redirect(url_for('profile.profile', username=username))
-    db = get_db()
-    user = db.execute('SELECT * FROM users WHERE username=?', (username,)).fetchone()
+    user = users.current()
     if not user:
         return redirect(url_for('feed.index'))
-    user = dict(user)  # конвертуємо sqlite3.Row у звичайний dict
+    if user['username'] != username:
+        return redirect(url_for('profile.profile', username=username))
 
     if request.method == 'POST':
         bio = request.form.get('bio', '').strip()[:200]
@@ -88,26 +61,22 @@ def edit_profile(username):
         accent_color = request.form.get('accent_color', '#6366f1')
         theme = request.form.get('theme', 'light')
 
-        avatar_img = user.get('avatar_img') or ''
         avatar_file = request.files.get('avatar_file')
-        if avatar_file and avatar_file.filename:
-            ext = secure_filename(avatar_file.filename).rsplit('.', 1)[-1].lower()
-            if ext in ALLOWED_AVATAR:
-                os.makedirs(AVATAR_FOLDER, exist_ok=True)
-                new_name = f"{uuid.uuid4().hex}.{ext}"
-                avatar_file.save(os.path.join(AVATAR_FOLDER, new_name))
-                if avatar_img:
-                    old_path = os.path.join(AVATAR_FOLDER, os.path.basename(avatar_img))
-                    if os.path.exists(old_path):
-                        os.remove(old_path)
-                avatar_img = f'avatars/{new_name}'
+        # Copy and resize the avatar before taking the writer
+        staged = stage_avatar(avatar_file) if avatar_file and avatar_file.filename else None
+
+        db = get_db()
+        avatar_img = user.get('avatar_img') or ''
+        avatar_variants = user.get('avatar_variants') or ''
+        if staged:
+            new_img, new_variants = save_avatar(db, staged)
+            delete_file(db, avatar_img, avatar_variants, delay=media.ORIGINAL_GRACE)
+            avatar_img, avatar_variants = new_img, images.dump(new_variants)
 
-        db.execute('UPDATE users SET bio=?, avatar_color=?, accent_color=?, theme=?, avatar_img=? WHERE id=?',
-                   (bio, avatar_color, accent_color, theme, avatar_img, session['user_id']))
+        db.execute('UPDATE users SET bio=?, avatar_color=?, accent_color=?, theme=?, avatar_img=?, avatar_variants=? WHERE id=?',
+                   (bio, avatar_color, accent_color, theme, avatar_img, avatar_variants, session['user_id']))
+        users.changed(db, session['user_id'])
         db.commit()
-        session['theme'] = theme
-        session['accent'] = accent_color
-        session['avatar_img'] = avatar_img
         flash('Профіль оновлено!', 'success')
         return redirect(url_for('profile.profile', username=username))
 
@@ -1,5 +1,7 @@
 from flask import Blueprint, request, session, redirect, url_for, render_template, jsonify
-from database import get_db
+from database import get_read_db
+import fulltext
+from trending import top_posts
 
 search_bp = Blueprint('search', __name__)
 
@@ -16,41 +18,31 @@ def login_required(f):
 @login_required
 def search():
     q = request.args.get('q', '').strip()
-    db = get_db()
+    db = get_read_db()
     uid = session['user_id']
-    users = []
-    if q:
-        users = db.execute('''
-            SELECT u.*,
-                   (SELECT COUNT(*) FROM followers WHERE following_id=u.id) as followers_count,
-                   EXISTS(SELECT 1 FROM followers WHERE follower_id=? AND following_id=u.id) as is_following
-            FROM users u
-            WHERE u.username LIKE ? AND u.id != ?
-            ORDER BY followers_count DESC
-            LIMIT 20
-        ''', (uid, f'%{q}%', uid)).fetchall()
-
-    # Trending posts (most liked in last 7 days)
-    trending = db.execute('''
-        SELECT p.*, u.username, u.avatar_color,
-               COUNT(l.user_id) as like_count,
-               (SELECT COUNT(*) FROM comments WHERE post_id=p.id) as comment_count,
-               EXISTS(SELECT 1 FROM likes WHERE post_id=p.id AND user_id=?) as user_liked
-        FROM posts p
-        JOIN users u ON p.user_id = u.id
-        LEFT JOIN likes l ON l.post_id = p.id
-        WHERE datetime(p.created_at) > datetime('now', '-7 days')
-        GROUP BY p.id
-        ORDER BY like_count DESC
-        LIMIT 12
-    ''', (uid,)).fetchall()
+    users, posts, comments = [], [], []
+    match = fulltext.match_query(q)
+    if match:
+        users = fulltext.search_users(db, uid, match)
+        posts = fulltext.search_posts(db, match)
+        comments = fulltext.search_comments(db, match)
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify([{
-            'id': u['id'], 'username': u['username'],
-            'avatar_color': u['avatar_color'],
-            'followers_count': u['followers_count'],
-            'is_following': bool(u['is_following'])
-        } for u in users])
+        return jsonify({'query': q, 'results': [
+            *({'type': 'user', 'id': u['id'], 'username': u['username'],
+               'avatar_color': u['avatar_color'],
+               'followers_count': u['followers_count'],
+               'is_following': bool(u['is_following'])} for u in users),
+            *({'type': 'post', 'id': p['id'], 'user_id': p['user_id'], 'username': p['username'],
+               'content': p['content'], 'created_at': p['created_at'],
+               'like_count': p['like_count'], 'comment_count': p['comment_count']} for p in posts),
+            *({'type': 'comment', 'id': c['id'], 'post_id': c['post_id'], 'user_id': c['user_id'],
+               'username': c['username'], 'content': c['content'],
+               'created_at': c['created_at']} for c in comments),
+        ]})
+
+    # Trending posts (time-decayed engagement), only shown without a query
+    trending = top_posts(db, uid) if not q else []
 
-    return render_template('search.html', users=users, trending=trending, q=q)
\ No newline at end of file
+    return render_template('search.html', users=users, posts=posts, comments=comments,
+                           trending=trending, q=q)
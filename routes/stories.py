@@ -1,5 +1,6 @@
 from flask import Blueprint, request, session, redirect, url_for, render_template, jsonify
-from database import get_db
+from database import get_db, get_read_db, release_db
+import stories
 
 stories_bp = Blueprint('stories', __name__)
 
@@ -27,24 +28,18 @@ def create_story():
 @stories_bp.route('/story/<int:story_id>')
 @login_required
 def view_story(story_id):
-    db = get_db()
+    read_db = get_read_db()
     uid = session['user_id']
-    story = db.execute('''
-        SELECT s.*, u.username, u.avatar_color FROM stories s
-        JOIN users u ON s.user_id = u.id
-        WHERE s.id=? AND datetime(s.expires_at) > datetime('now')
-    ''', (story_id,)).fetchone()
+    story = stories.get(read_db, story_id)
     if not story:
         return redirect(url_for('feed.index'))
-    db.execute('INSERT OR IGNORE INTO story_views (user_id, story_id) VALUES (?,?)', (uid, story_id))
+    db = get_db()
+    stories.mark_seen(db, uid, story_id)
     db.commit()
+    # Only mark_seen writes: free the writer before the ring queries and the render
+    release_db()
 
-    # next story
-    next_story = db.execute('''
-        SELECT id FROM stories
-        WHERE id > ? AND datetime(expires_at) > datetime('now')
-        ORDER BY id ASC LIMIT 1
-    ''', (story_id,)).fetchone()
-
-    return render_template('story_view.html', story=story,
-                           next_id=next_story['id'] if next_story else None)
\ No newline at end of file
+    siblings = stories.author_story_ids(read_db, story['user_id'])
+    prev_id, next_id = stories.neighbours(read_db, uid, story, siblings)
+    return render_template('story_view.html', story=story, siblings=siblings,
+                           prev_id=prev_id, next_id=next_id)
@@ -0,0 +1,136 @@
+"""Server-side sessions stored in SQLite.
+
+The cookie carries only a random session id; the session dict (user_id,
+flashed messages) lives in the sessions table. Profile fields are not
+copied into it: pages read the viewer's row through users.py, whose version
+comes back with the session lookup. Sessions can therefore be revoked
+(logout deletes the row, revoke() every row of a user), and a user's edits
+reach all of their sessions at once.
+
+A new id is issued whenever the signed-in user changes, so an id obtained
+before login is worthless after it. Expiry slides: a session unused for
+LIFETIME seconds (ANONYMOUS_LIFETIME without a user) is gone, and
+expires_at is rewritten at most once per REFRESH so ordinary page views
+never write. The periodic sweep_sessions job deletes expired rows.
+"""
+import os
+import secrets
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
+
+import database
+import jobs
+
+LIFETIME = int(os.environ.get('SESSION_DAYS', 30)) * 24 * 3600
+ANONYMOUS_LIFETIME = 3600   # sessions that only carry a flashed message
+REFRESH = 24 * 3600
+SWEEP_INTERVAL = 3600
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER,
+        data TEXT NOT NULL DEFAULT '{}',
+        created_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions(user_id);
+    CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at);
+"""
+
+serializer = TaggedJSONSerializer()
+
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, data=None, sid=None, user_version=None, expires_at=None, stale=False):
+        super().__init__(data)
+        self.sid = sid
+        self.user_id = (data or {}).get('user_id')   # as loaded; a change means sign-in/out
+        self.user_version = user_version
+        self.expires_at = expires_at
+        self.stale = stale                           # the browser sent an unknown or expired id
+
+
+def _lifetime(user_id):
+    return LIFETIME if user_id else ANONYMOUS_LIFETIME
+
+
+class SQLiteSessionInterface(SessionInterface):
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        # Static files never look at the session
+        if not sid or request.path.startswith(app.static_url_path + '/'):
+            return ServerSession()
+        row = database.get_read_db().execute('''
+            SELECT s.data, s.expires_at, u.version AS user_version
+            FROM sessions s LEFT JOIN users u ON u.id = s.user_id
+            WHERE s.id = ? AND s.expires_at > ?
+        ''', (sid, time.time())).fetchone()
+        if row is None:
+            return ServerSession(stale=True)
+        return ServerSession(serializer.loads(row['data']), sid, row['user_version'], row['expires_at'])
+
+    def save_session(self, app, session, response):
+        if session.accessed:
+            response.vary.add('Cookie')
+        now = time.time()
+        user_id = session.get('user_id')
+        if not (session.modified or session.stale
+                or session.sid and session.expires_at - now < _lifetime(user_id) - REFRESH):
+            return
+        db = database.get_db()
+        # Anything the view left uncommitted is rolled back at teardown anyway
+        if db.in_transaction:
+            db.rollback()
+        name = self.get_cookie_name(app)
+        cookie = dict(domain=self.get_cookie_domain(app), path=self.get_cookie_path(app),
+                      secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+                      httponly=self.get_cookie_httponly(app))
+
+        if not session:
+            if session.sid:
+                db.execute('DELETE FROM sessions WHERE id = ?', (session.sid,))
+                db.commit()
+            if session.sid or session.stale:
+                response.delete_cookie(name, **cookie)
+            return
+
+        expires_at = now + _lifetime(user_id)
+        if not session.modified:
+            db.execute('UPDATE sessions SET expires_at = ? WHERE id = ?', (expires_at, session.sid))
+            db.commit()
+            return
+
+        data = serializer.dumps(dict(session))
+        if session.sid and user_id == session.user_id:
+            db.execute('UPDATE sessions SET data = ?, expires_at = ? WHERE id = ?',
+                       (data, expires_at, session.sid))
+        else:
+            if session.sid:
+                db.execute('DELETE FROM sessions WHERE id = ?', (session.sid,))
+            session.sid = secrets.token_urlsafe(32)
+            db.execute('INSERT INTO sessions (id, user_id, data, created_at, expires_at) VALUES (?,?,?,?,?)',
+                       (session.sid, user_id, data, now, expires_at))
+        db.commit()
+        # A browser-session cookie, as before; the row's expiry is what counts
+        response.set_cookie(name, session.sid, **cookie)
+
+
+def revoke(db, user_id, keep=None):
+    """Sign user_id out everywhere (except the session id keep). Returns the count. No commit."""
+    return db.execute('DELETE FROM sessions WHERE user_id = ? AND id IS NOT ?', (user_id, keep)).rowcount
+
+
+def sweep(db):
+    """Delete expired sessions. No commit."""
+    return db.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)).rowcount
+
+
+@jobs.handler('sweep_sessions')
+def _sweep_sessions_job(db):
+    sweep(db)
+
+jobs.periodic('sweep_sessions', SWEEP_INTERVAL)
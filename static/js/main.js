@@ -79,6 +79,65 @@ function removeFile(i) {
   renderPreview();
 }
 
+// ── Chunked, resumable uploads (/api/uploads) ──
+async function sha256Hex(file) {
+  if (!window.crypto || !crypto.subtle) return '';   // only available on HTTPS/localhost
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function uploadJSON(url, options) {
+  const res = await fetch(url, options);
+  const data = await res.json().catch(() => ({}));
+  if (!res.ok && res.status !== 409) throw new Error(data.error || 'Помилка завантаження');
+  return {status: res.status, data};
+}
+
+// Upload one file in chunks and return its upload id. An interrupted upload of
+// the same file is resumed from the offset the server already has.
+async function uploadChunked(file, onProgress) {
+  const key = `upload:${file.name}:${file.size}:${file.lastModified}`;
+  let state = null;
+  const saved = localStorage.getItem(key);
+  if (saved) {
+    try { state = (await uploadJSON(`/api/uploads/${saved}`)).data; } catch(e) { state = null; }
+    if (state && state.status === 'complete') state = null;   // already used for a post
+  }
+  if (!state) {
+    const sha256 = await sha256Hex(file);
+    state = (await uploadJSON('/api/uploads', {
+      method: 'POST', headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({filename: file.name, size: file.size, sha256}),
+    })).data;
+    localStorage.setItem(key, state.id);
+  }
+
+  let offset = state.received, retries = 0;
+  while (offset < file.size) {
+    onProgress(offset / file.size);
+    try {
+      const {status, data} = await uploadJSON(`/api/uploads/${state.id}?offset=${offset}`, {
+        method: 'PUT', headers: {'Content-Type': 'application/octet-stream'},
+        body: file.slice(offset, offset + state.chunk_size),
+      });
+      if (status === 409 && data.received === undefined) throw new Error(data.error);
+      offset = data.received;   // on 409 the server tells us where to continue
+      retries = 0;
+    } catch(e) {
+      if (e instanceof TypeError && retries++ < 5) {   // network error: back off and resume
+        await new Promise(r => setTimeout(r, 1000 * 2 ** retries));
+        continue;
+      }
+      throw e;
+    }
+  }
+  onProgress(1);
+  const {status, data} = await uploadJSON(`/api/uploads/${state.id}/complete`, {method: 'POST'});
+  if (status !== 200) throw new Error(data.error || 'Помилка завантаження');
+  localStorage.removeItem(key);
+  return state.id;
+}
+
 async function submitPost() {
   const textarea = document.getElementById('compose-text');
   const content = textarea ? textarea.value.trim() : '';
@@ -89,11 +148,20 @@ async function submitPost() {
   if (btn) { btn.disabled=true; btn.textContent='...'; }
   if (progress) progress.style.display='block';
 
-  const fd = new FormData();
-  fd.append('content', content);
-  selectedFiles.forEach(f => fd.append('media', f));
+  const progressText = document.getElementById('post-progress-text');
+  const totalBytes = selectedFiles.reduce((sum, f) => sum + f.size, 0) || 1;
+  let doneBytes = 0;
 
   try {
+    const fd = new FormData();
+    fd.append('content', content);
+    for (const f of selectedFiles) {
+      fd.append('upload_ids', await uploadChunked(f, part => {
+        if (progressText) progressText.textContent = `Завантаження... ${Math.round((doneBytes + part * f.size) / totalBytes * 100)}%`;
+      }));
+      doneBytes += f.size;
+    }
+
     const res = await fetch('/post', { method:'POST', body: fd });
     const data = await res.json();
 
@@ -116,13 +184,34 @@ async function submitPost() {
       showToast(data.error || 'Помилка', 'error');
     }
   } catch(e) {
-    showToast('Помилка завантаження', 'error');
+    showToast(e.message || 'Помилка завантаження', 'error');
   } finally {
     if (btn) { btn.disabled=false; btn.textContent='Опублікувати'; }
     if (progress) progress.style.display='none';
+    if (progressText) progressText.textContent = 'Завантаження...';
   }
 }
 
+// Same sizes as templates/_picture.html
+const FEED_SIZES = '(min-width: 960px) 640px, (max-width: 470px) 100vw, 470px';
+const FEED_HALF_SIZES = '(min-width: 960px) 320px, (max-width: 470px) 50vw, 235px';
+const GRID_SIZES = '(min-width: 960px) 213px, (max-width: 470px) 33vw, 157px';
+
+function srcsetFor(m, ext) {
+  const base = m.filename.slice(0, m.filename.lastIndexOf('_'));
+  return m.variants.widths.map(w => `/static/uploads/${base}_${w}.${ext} ${w}w`).join(', ');
+}
+
+// <picture> with AVIF/WebP sources for processed images, plain <img> otherwise
+function pictureHTML(m, sizes, attrs) {
+  const v = m.variants;
+  if (!v) return `<img src="/static/uploads/${m.filename}" ${attrs}>`;
+  const fallback = v.formats[v.formats.length - 1];
+  const sources = v.formats.slice(0, -1)
+    .map(ext => `<source type="image/${ext}" srcset="${srcsetFor(m, ext)}" sizes="${sizes}">`).join('');
+  return `<picture>${sources}<img src="/static/uploads/${m.filename}" srcset="${srcsetFor(m, fallback)}" sizes="${sizes}" width="${v.width}" height="${v.height}" ${attrs}></picture>`;
+}
+
 function buildPostHTML(post) {
   const avatarHtml = post.avatar_img
     ? `<img src="/static/uploads/${post.avatar_img}" class="avatar avatar-sm" style="object-fit:cover;">`
@@ -132,9 +221,10 @@ function buildPostHTML(post) {
   if (post.media && post.media.length) {
     const count = post.media.length;
     mediaHtml = `<div class="post-media-grid post-media-${count}">`;
-    post.media.forEach(m => {
+    post.media.forEach((m, i) => {
       if (m.media_type === 'image') {
-        mediaHtml += `<div class="post-media-item"><img src="/static/uploads/${m.filename}" loading="lazy"></div>`;
+        const sizes = count === 1 || (count === 3 && i === 0) ? FEED_SIZES : FEED_HALF_SIZES;
+        mediaHtml += `<div class="post-media-item">${pictureHTML(m, sizes, 'alt="фото" loading="lazy"')}</div>`;
       } else if (m.media_type === 'video') {
         mediaHtml += `<div class="post-media-item"><video src="/static/uploads/${m.filename}" controls preload="metadata" playsinline></video></div>`;
       } else if (m.media_type === 'audio') {
@@ -145,13 +235,15 @@ function buildPostHTML(post) {
   }
 
   const textHtml = post.content ? `<div class="post-text-content">${escHtml(post.content)}</div>` : '';
+  const when = /^\d{4}-/.test(post.created_at || '') ? timeAgo(post.created_at) : 'щойно';
+  const likes = post.like_count || 0, comments = post.comment_count || 0;
 
   return `<article class="post-card" id="post-${post.id}">
     <div class="post-header">
       <a href="/profile/${escHtml(post.username)}">${avatarHtml}</a>
       <div class="post-author-info">
         <a href="/profile/${escHtml(post.username)}" class="post-author-name">${escHtml(post.username)}</a>
-        <div class="post-time">щойно</div>
+        <div class="post-time">${when}</div>
       </div>
       <button class="post-menu-btn">···</button>
     </div>
@@ -161,13 +253,13 @@ function buildPostHTML(post) {
       <span class="double-tap-heart">❤️</span>
     </div>
     <div class="post-actions">
-      <button class="post-action-btn like-btn-ajax" data-post-id="${post.id}"><span class="heart-icon">🤍</span></button>
+      <button class="post-action-btn like-btn-ajax ${post.user_liked ? 'liked' : ''}" data-post-id="${post.id}"><span class="heart-icon">${post.user_liked ? '❤️' : '🤍'}</span></button>
       <button class="post-action-btn" style="font-size:1.1rem;" onclick="toggleComments(${post.id})">💬</button>
       <button class="post-action-btn" style="font-size:1.1rem;">📤</button>
       <button class="post-action-btn post-save-btn" style="font-size:1.1rem;">🔖</button>
     </div>
-    <div class="post-likes" id="likes-${post.id}" style="display:none;"></div>
-    <button class="view-comments-btn" onclick="toggleComments(${post.id})"><span style="color:var(--text-3);">Додати коментар</span></button>
+    <div class="post-likes" id="likes-${post.id}" ${likes ? '' : 'style="display:none;"'}>${likes ? `${likes} ${likes===1?'вподобання':'вподобань'}` : ''}</div>
+    <button class="view-comments-btn" onclick="toggleComments(${post.id})">${comments ? `Переглянути всі коментарі (${comments})` : '<span style="color:var(--text-3);">Додати коментар</span>'}</button>
     <div class="comments-section" id="comments-${post.id}">
       <div class="comments-list"></div>
       <div class="comment-input-row" data-post-id="${post.id}">
@@ -256,7 +348,7 @@ async function toggleComments(postId) {
 
   try {
     const res = await fetch(`/api/comments/${postId}`);
-    const comments = await res.json();
+    const {items: comments} = await res.json();
     const list = section.querySelector('.comments-list');
     list.innerHTML = comments.length
       ? comments.map(c => `
@@ -329,19 +421,124 @@ document.addEventListener('click', async e => {
   } catch(e) {}
 });
 
+// ═══════════════════════════════════════
+// SCREEN REFRESH — every visible post and follow button in one /api/batch call
+// ═══════════════════════════════════════
+const BATCH_MAX_IDS = 200;
+const REFRESH_INTERVAL = 60000;
+
+function setLikeCount(card, count) {
+  let likesEl = card.querySelector('.post-likes');
+  if (!likesEl && count > 0) {
+    likesEl = document.createElement('div');
+    likesEl.className = 'post-likes';
+    card.querySelector('.post-actions')?.after(likesEl);
+  }
+  if (!likesEl) return;
+  likesEl.style.display = count > 0 ? '' : 'none';
+  likesEl.textContent = count > 0 ? `${count} ${count===1?'вподобання':'вподобань'}` : '';
+}
+
+async function refreshScreen() {
+  const likeBtns = Array.from(document.querySelectorAll('.like-btn-ajax[data-post-id]'));
+  const followBtns = Array.from(document.querySelectorAll('.follow-btn-ajax[data-user-id]'));
+  const postIds = [...new Set(likeBtns.map(b => b.dataset.postId))].slice(-BATCH_MAX_IDS);
+  const userIds = [...new Set(followBtns.map(b => b.dataset.userId))].slice(-BATCH_MAX_IDS);
+  if (!postIds.length && !userIds.length) return;
+  const res = await fetch(`/api/batch?posts=${postIds.join(',')}&users=${userIds.join(',')}&comments=0`);
+  if (!res.ok) return;
+  const {posts, users} = await res.json();
+  likeBtns.forEach(btn => {
+    const card = btn.closest('.post-card');
+    const state = posts[btn.dataset.postId];
+    if (!card || !postIds.includes(btn.dataset.postId)) return;
+    if (!state) { card.remove(); return; }   // deleted since the page was rendered
+    btn.classList.toggle('liked', state.user_liked);
+    const heartEl = btn.querySelector('.heart-icon');
+    if (heartEl && !state.user_liked) heartEl.textContent = '🤍';
+    else if (heartEl && heartEl.textContent === '🤍') heartEl.textContent = '❤️';
+    setLikeCount(card, state.like_count);
+    const viewBtn = card.querySelector('.view-comments-btn:not(.post-action-btn)');
+    if (viewBtn && state.comment_count > 0) viewBtn.textContent = `Переглянути всі коментарі (${state.comment_count})`;
+  });
+  followBtns.forEach(btn => {
+    const state = users[btn.dataset.userId];
+    if (!state) return;
+    btn.classList.toggle('following', state.is_following);
+    btn.textContent = state.is_following ? 'Підписаний' : 'Підписатись';
+  });
+}
+
+document.addEventListener('visibilitychange', () => {
+  if (document.visibilityState === 'visible') refreshScreen().catch(() => {});
+});
+setInterval(() => {
+  if (document.visibilityState === 'visible') refreshScreen().catch(() => {});
+}, REFRESH_INTERVAL);
+
 // ═══════════════════════════════════════
 // NOTIFICATIONS COUNT
 // ═══════════════════════════════════════
+function setNotifBadge(count) {
+  document.querySelectorAll('[data-notif]').forEach(el => el.classList.toggle('show', count > 0));
+}
 async function checkNotifications() {
   try {
     const res = await fetch('/notifications/count');
     const {count} = await res.json();
-    document.querySelectorAll('[data-notif]').forEach(el => el.classList.toggle('show', count > 0));
+    setNotifBadge(count);
   } catch(e) {}
 }
-document.addEventListener('DOMContentLoaded', () => {
+let notifPolling = null;
+function startNotifPolling() {
+  if (notifPolling) return;
   checkNotifications();
-  setInterval(checkNotifications, 30000);
+  notifPolling = setInterval(checkNotifications, 30000);
+}
+// Server-Sent Events push; falls back to polling if the stream keeps failing
+function startNotifStream() {
+  if (!window.EventSource) { startNotifPolling(); return; }
+  const es = new EventSource('/notifications/stream');
+  let failures = 0;
+  es.onopen = () => { failures = 0; };
+  es.onerror = () => {
+    if (++failures >= 3) { es.close(); startNotifPolling(); }
+  };
+  es.addEventListener('count', e => setNotifBadge(JSON.parse(e.data).count));
+  es.addEventListener('notification', e => setNotifBadge(JSON.parse(e.data).count));
+}
+document.addEventListener('DOMContentLoaded', () => {
+  if (document.querySelector('[data-notif]')) startNotifStream();
+});
+
+// ═══════════════════════════════════════
+// INFINITE SCROLL — keyset cursors
+// ═══════════════════════════════════════
+function initInfiniteScroll(container, render) {
+  if (!container.dataset.nextCursor) return;
+  const sentinel = document.createElement('div');
+  sentinel.className = 'scroll-sentinel';
+  container.after(sentinel);
+  let loading = false;
+  const observer = new IntersectionObserver(async entries => {
+    if (!entries[0].isIntersecting || loading) return;
+    const cursor = container.dataset.nextCursor;
+    if (!cursor) { observer.disconnect(); sentinel.remove(); return; }
+    loading = true;
+    try {
+      const res = await fetch(`${container.dataset.pageUrl}?cursor=${encodeURIComponent(cursor)}`);
+      const {items, next_cursor} = await res.json();
+      container.insertAdjacentHTML('beforeend', items.map(render).join(''));
+      container.dataset.nextCursor = next_cursor || '';
+      if (!next_cursor) { observer.disconnect(); sentinel.remove(); }
+    } catch(e) { console.error(e); }
+    finally { loading = false; }
+  }, {rootMargin: '600px'});
+  observer.observe(sentinel);
+}
+document.addEventListener('DOMContentLoaded', () => {
+  const feed = document.getElementById('posts-feed');
+  if (feed && feed.dataset.pageUrl) initInfiniteScroll(feed, buildPostHTML);
 });
 
 // ═══════════════════════════════════════
@@ -393,8 +590,14 @@ function cancelVoiceRecord() {
 // ═══════════════════════════════════════
 const storyBar = document.querySelector('.story-progress-bar');
 if (storyBar) {
-  const nextId = storyBar.dataset.nextId;
-  setTimeout(() => { window.location.href = nextId ? `/story/${nextId}` : '/'; }, 5000);
+  const { nextId, prevId } = storyBar.dataset;
+  const goNext = () => { window.location.href = nextId ? `/story/${nextId}` : '/'; };
+  setTimeout(goNext, 5000);
+  document.addEventListener('keydown', e => {
+    if (e.key === 'ArrowRight') goNext();
+    else if (e.key === 'ArrowLeft' && prevId) window.location.href = `/story/${prevId}`;
+    else if (e.key === 'Escape') window.location.href = '/';
+  });
 }
 
 // ═══════════════════════════════════════
@@ -549,17 +752,8 @@ async function pickReaction(postId, emoji) {
 // ═══════════════════════════════════════
 // Override toggleComments to include delete buttons
 const _origToggleComments = window.toggleComments;
-window.toggleComments = async function(postId) {
-  const section = document.getElementById(`comments-${postId}`);
-  if (!section) return;
-  if (section.classList.contains('open')) { section.classList.remove('open'); return; }
-  try {
-    const res = await fetch(`/api/comments/${postId}`);
-    const comments = await res.json();
-    const list = section.querySelector('.comments-list');
-    const myId = document.body.dataset.userId || 0;
-    list.innerHTML = comments.length
-      ? comments.map(c => `
+function buildCommentHTML(c) {
+  return `
         <div class="comment-item" id="comment-${c.id}">
           <div class="avatar avatar-xs" style="background:${c.avatar_color}">
             ${c.avatar_img ? `<img src="/static/uploads/${c.avatar_img}" style="width:100%;height:100%;border-radius:50%;object-fit:cover;">` : c.username[0].toUpperCase()}
@@ -570,8 +764,37 @@ window.toggleComments = async function(postId) {
             <div class="comment-time">${timeAgo(c.created_at)}</div>
           </div>
           <button class="comment-delete-btn" onclick="deleteComment(${c.id})">✕</button>
-        </div>`).join('')
+        </div>`;
+}
+
+async function loadComments(postId, cursor) {
+  const section = document.getElementById(`comments-${postId}`);
+  const list = section.querySelector('.comments-list');
+  const res = await fetch(`/api/comments/${postId}` + (cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''));
+  const {items: comments, next_cursor} = await res.json();
+  list.querySelector('.comments-more-btn')?.remove();
+  if (!cursor) {
+    list.innerHTML = comments.length
+      ? comments.map(buildCommentHTML).join('')
       : '<p style="color:var(--text-3);font-size:0.8rem;padding:4px 0;">Поки немає коментарів</p>';
+  } else {
+    list.insertAdjacentHTML('beforeend', comments.map(buildCommentHTML).join(''));
+  }
+  if (next_cursor) {
+    const more = document.createElement('button');
+    more.className = 'view-comments-btn comments-more-btn';
+    more.textContent = 'Показати ще';
+    more.onclick = () => loadComments(postId, next_cursor).catch(console.error);
+    list.appendChild(more);
+  }
+}
+
+window.toggleComments = async function(postId) {
+  const section = document.getElementById(`comments-${postId}`);
+  if (!section) return;
+  if (section.classList.contains('open')) { section.classList.remove('open'); return; }
+  try {
+    await loadComments(postId);
     section.classList.add('open');
   } catch(e) { console.error(e); }
 };
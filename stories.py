@@ -0,0 +1,102 @@
+"""Story rings, navigation and expiry.
+
+The feed shows one ring per followed user (and the viewer) with live
+stories, built by a single grouped query over (user_id, expires_at) with the
+viewer's story_views joined in. Rings with unseen stories come first and
+open at the first unseen one. In the viewer, "next" walks the author's
+stories in order and then jumps to the next ring with unseen stories (or,
+once everything is seen, the next ring by recency); "previous" steps back
+the same way through the recency order. Expired stories and their views are
+deleted by the periodic sweep_stories job rather than filtered forever.
+"""
+import jobs
+
+SWEEP_INTERVAL = 10 * 60
+
+SCHEMA = """
+    CREATE INDEX IF NOT EXISTS idx_stories_user_expires ON stories(user_id, expires_at);
+    CREATE INDEX IF NOT EXISTS idx_story_views_story ON story_views(story_id);
+"""
+
+
+def ring(db, viewer_id):
+    """One dict per author with live stories: user fields, story_count, unseen,
+    first_id, last_id, start_id (first unseen, else first) and latest."""
+    rows = db.execute('''
+        SELECT u.id AS user_id, u.username, u.avatar_color, COALESCE(u.avatar_img, '') AS avatar_img,
+               COUNT(*) AS story_count,
+               COUNT(*) - COUNT(sv.story_id) AS unseen,
+               MIN(s.id) AS first_id, MAX(s.id) AS last_id,
+               COALESCE(MIN(CASE WHEN sv.story_id IS NULL THEN s.id END), MIN(s.id)) AS start_id,
+               MAX(s.created_at) AS latest
+        FROM (SELECT following_id AS author_id FROM followers WHERE follower_id = ?
+              UNION SELECT ?) f
+        JOIN stories s ON s.user_id = f.author_id AND s.expires_at > datetime('now')
+        JOIN users u ON u.id = s.user_id
+        LEFT JOIN story_views sv ON sv.user_id = ? AND sv.story_id = s.id
+        GROUP BY u.id
+        ORDER BY COUNT(*) - COUNT(sv.story_id) = 0, latest DESC, u.id
+    ''', (viewer_id, viewer_id, viewer_id)).fetchall()
+    return [dict(r) for r in rows]
+
+
+def get(db, story_id):
+    return db.execute('''
+        SELECT s.*, u.username, u.avatar_color, COALESCE(u.avatar_img, '') AS avatar_img
+        FROM stories s JOIN users u ON s.user_id = u.id
+        WHERE s.id = ? AND s.expires_at > datetime('now')
+    ''', (story_id,)).fetchone()
+
+
+def author_story_ids(db, author_id):
+    return [r['id'] for r in db.execute(
+        "SELECT id FROM stories WHERE user_id = ? AND expires_at > datetime('now') ORDER BY id",
+        (author_id,))]
+
+
+def mark_seen(db, viewer_id, story_id):
+    """No commit."""
+    db.execute('INSERT OR IGNORE INTO story_views (user_id, story_id) VALUES (?,?)', (viewer_id, story_id))
+
+
+def neighbours(db, viewer_id, story, siblings):
+    """(prev_id, next_id) for the viewer; siblings is author_story_ids() of the story's author."""
+    i = siblings.index(story['id'])
+    prev_id = siblings[i - 1] if i > 0 else None
+    next_id = siblings[i + 1] if i + 1 < len(siblings) else None
+    if prev_id and next_id:
+        return prev_id, next_id
+
+    rings = ring(db, viewer_id)
+    by_recency = sorted(rings, key=lambda r: (r['latest'], -r['user_id']), reverse=True)
+    authors = [r['user_id'] for r in by_recency]
+    pos = authors.index(story['user_id']) if story['user_id'] in authors else -1
+    if prev_id is None and pos > 0:
+        prev_id = by_recency[pos - 1]['last_id']
+    if next_id is None:
+        unseen = [r for r in rings if r['unseen'] and r['user_id'] != story['user_id']]
+        if unseen:
+            next_id = unseen[0]['start_id']
+        elif 0 <= pos < len(by_recency) - 1:
+            next_id = by_recency[pos + 1]['first_id']
+    return prev_id, next_id
+
+
+def delete(db, story_id):
+    """No commit."""
+    db.execute('DELETE FROM story_views WHERE story_id = ?', (story_id,))
+    db.execute('DELETE FROM stories WHERE id = ?', (story_id,))
+
+
+def sweep(db):
+    """Delete expired stories and their views. Returns the number of stories removed. No commit."""
+    expired = "SELECT id FROM stories WHERE expires_at <= datetime('now')"
+    db.execute(f'DELETE FROM story_views WHERE story_id IN ({expired})')
+    return db.execute(f'DELETE FROM stories WHERE id IN ({expired})').rowcount
+
+
+@jobs.handler('sweep_stories')
+def _sweep_stories_job(db):
+    sweep(db)
+
+jobs.periodic('sweep_stories', SWEEP_INTERVAL)
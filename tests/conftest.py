@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import coalesce
+import database
+import fragments
+import media
+import users
+from app import app as flask_app
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'postgres: needs TEST_DATABASE_URL, a scratch PostgreSQL database')
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The app on a scratch SQLite database, with toggles applied inline."""
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'social.db'))
+    monkeypatch.setattr(media, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    monkeypatch.setattr(coalesce, 'ENABLED', False)
+    # Ids restart at 1 in every scratch database; don't serve another test's rows
+    for cache in fragments.CACHES:
+        cache.clear()
+    for user_id in list(users._rows):
+        users.forget(user_id)
+    database.init_db()
+    database.migrate_db()
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def login(app):
+    """login(name) -> a test client signed in as a freshly registered user."""
+    def login(name):
+        client = app.test_client()
+        client.post('/register', data={'username': name, 'password': 'secret1'})
+        client.post('/login', data={'username': name, 'password': 'secret1'})
+        return client
+    return login
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    """queries(fn) -> the SQL statements fn() issued, via database.trace_callback."""
+    def queries(fn):
+        statements = []
+        monkeypatch.setattr(database, 'trace_callback', statements.append)
+        try:
+            fn()
+        finally:
+            monkeypatch.setattr(database, 'trace_callback', None)
+        return statements
+    return queries
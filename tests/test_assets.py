@@ -0,0 +1,27 @@
+import os
+
+import media
+
+
+def test_partial_uploads_are_not_served(app, login, tmp_path, monkeypatch):
+    static = tmp_path / 'static'
+    monkeypatch.setattr(app, 'static_folder', str(static))
+    monkeypatch.setattr(media, 'UPLOAD_FOLDER', str(static / 'uploads'))
+    alice = login('alice')
+    upload = alice.post('/api/uploads', json={'filename': 'a.jpg', 'size': 10}).get_json()
+    assert os.path.exists(static / 'uploads' / media.TMP_FOLDER / f"{upload['id']}.part")
+
+    for path in (f"uploads/{media.TMP_FOLDER}/{upload['id']}.part",
+                 f"uploads/./{media.TMP_FOLDER}/{upload['id']}.part"):
+        assert alice.get(f'/static/{path}').status_code == 404
+
+
+def test_uploaded_files_are_served_immutable(app, login, tmp_path, monkeypatch):
+    static = tmp_path / 'static'
+    (static / 'uploads' / 'images').mkdir(parents=True)
+    (static / 'uploads' / 'images' / 'x.jpg').write_bytes(b'jpeg')
+    monkeypatch.setattr(app, 'static_folder', str(static))
+    monkeypatch.setattr(media, 'UPLOAD_FOLDER', str(static / 'uploads'))
+    response = login('alice').get('/static/uploads/images/x.jpg')
+    assert response.status_code == 200
+    assert response.cache_control.immutable
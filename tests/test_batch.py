@@ -0,0 +1,46 @@
+import batch
+
+
+def test_states_for_posts_and_users(app, login):
+    alice, bobby = login('alice'), login('bobby')
+    first = alice.post('/post', data={'content': 'one'}).get_json()['post']['id']
+    second = alice.post('/post', data={'content': 'two'}).get_json()['post']['id']
+    bobby.post(f'/like/{first}')
+    bobby.post('/follow/1')
+    comments = [bobby.post(f'/api/comments/{first}', json={'content': f'c{n}'}).get_json()['id'] for n in range(4)]
+
+    body = bobby.get(f'/api/batch?posts={second},{first},999,{first}&users=1,2,999&comments=3').get_json()
+    assert set(body['posts']) == {str(first), str(second)}          # 999 is gone
+    liked = body['posts'][str(first)]
+    assert (liked['like_count'], liked['comment_count'], liked['user_liked']) == (1, 4, True)
+    # The newest `comments`, oldest first
+    assert [c['id'] for c in liked['comments']] == comments[1:]
+    assert body['posts'][str(second)]['comments'] == []
+    assert set(body['users']) == {'1', '2'}
+    assert (body['users']['1']['is_following'], body['users']['1']['follows_you']) == (True, False)
+    assert body['users']['2']['following_count'] == 1
+
+
+def test_lists_are_capped_at_max_ids(app, login, monkeypatch):
+    monkeypatch.setattr(batch, 'MAX_IDS', 3)
+    alice = login('alice')
+    assert alice.get('/api/batch?posts=1,2,3&users=1,2,3').status_code == 200
+    assert alice.get('/api/batch?posts=1,2,3,3,x').status_code == 200     # duplicates and garbage dropped
+    response = alice.get('/api/batch?users=1,2,3,4')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'At most 3 ids per list'}
+
+
+def test_query_count_does_not_grow_with_the_ids(app, login, queries):
+    alice = login('alice')
+    ids = [alice.post('/post', data={'content': f'post {n}'}).get_json()['post']['id'] for n in range(10)]
+    for post_id in ids:
+        alice.post(f'/api/comments/{post_id}', json={'content': 'hi'})
+    one = queries(lambda: alice.get(f'/api/batch?posts={ids[0]}&users=1'))
+    many = queries(lambda: alice.get(f'/api/batch?posts={",".join(map(str, ids))}&users=1'))
+    assert len(many) == len(one)
+
+
+def test_parse_ids_keeps_the_first_occurrence_in_order():
+    assert batch.parse_ids(' 3, 1,,x,3,-2, 2 ') == [3, 1, 2]
+    assert batch.parse_ids(None) == []
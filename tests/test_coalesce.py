@@ -0,0 +1,110 @@
+import logging
+
+import pytest
+
+import coalesce
+import counters
+import database
+
+
+@pytest.fixture
+def coalescing(app, monkeypatch):
+    """Toggles queue up in coalesce._pending until the test calls flush()."""
+    monkeypatch.setattr(coalesce, 'ENABLED', True)
+    monkeypatch.setattr(coalesce, '_ensure_flusher', lambda: None)
+    return app
+
+
+def _post(login):
+    alice, bobby = login('alice'), login('bobby')
+    post_id = alice.post('/post', data={'content': 'hi'}).get_json()['post']['id']
+    return bobby, post_id
+
+
+def test_a_committed_like_is_not_counted_twice(coalescing, login, monkeypatch):
+    bobby, post_id = _post(login)
+    assert bobby.post(f'/like/{post_id}').get_json() == {'liked': True, 'count': 1}
+
+    seen = []
+    monkeypatch.setattr(coalesce, '_publish', lambda db, pushes: seen.append(coalesce._like_count(db, post_id)))
+    coalesce.flush()
+    assert seen == [1]
+
+
+def test_a_failed_batch_is_logged_and_forgotten(coalescing, login, monkeypatch, caplog):
+    bobby, post_id = _post(login)
+    bobby.post(f'/like/{post_id}')
+
+    def fail(pool, intents):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(coalesce, '_commit_group', fail)
+    with caplog.at_level(logging.ERROR, logger='coalesce'):
+        coalesce.flush()
+    assert 'coalesced batch of 1 lost' in caplog.text
+    assert not coalesce._inflight
+    assert bobby.post(f'/like/{post_id}').get_json() == {'liked': True, 'count': 1}
+
+
+def test_a_replayed_follow_does_not_notify_again(app, login):
+    login('alice')
+    login('bobby')
+    with app.app_context():
+        db = database.get_db()
+        ids = {r['username']: r['id'] for r in db.execute('SELECT id, username FROM users')}
+        key = ('follow', ids['bobby'], ids['alice'])
+        assert coalesce._apply(db, {key: True}) == [(ids['alice'], 'follow', ids['bobby'], None)]
+        # Old notifications get cleaned up; the follow itself stays
+        db.execute('DELETE FROM notification_actors')
+        db.execute('DELETE FROM notifications')
+        assert coalesce._apply(db, {key: True}) == []
+        assert db.execute('SELECT COUNT(*) FROM notifications').fetchone()[0] == 0
+        db.commit()
+
+
+def _state(app, post_id):
+    with app.app_context():
+        db = database.get_read_db()
+        return (db.execute('SELECT COUNT(*) FROM likes WHERE post_id = ?', (post_id,)).fetchone()[0],
+                db.execute('SELECT like_count FROM post_stats WHERE post_id = ?', (post_id,)).fetchone()[0],
+                db.execute("SELECT COUNT(*) FROM notifications WHERE type = 'like'").fetchone()[0])
+
+
+def test_repeated_taps_collapse_into_one_write(coalescing, login):
+    bobby, post_id = _post(login)
+    answers = [bobby.post(f'/like/{post_id}').get_json() for _ in range(3)]
+    assert answers == [{'liked': True, 'count': 1}, {'liked': False, 'count': 0}, {'liked': True, 'count': 1}]
+    assert _state(coalescing, post_id) == (0, 0, 0)
+    coalesce.flush()
+    assert _state(coalescing, post_id) == (1, 1, 1)
+    assert coalesce.stats()['pending'] == 0
+    assert bobby.post(f'/like/{post_id}').get_json() == {'liked': False, 'count': 0}
+    coalesce.flush()
+    assert _state(coalescing, post_id)[:2] == (0, 0)
+
+
+def test_coalesced_follows_keep_counters_and_timelines(coalescing, login):
+    bobby, post_id = _post(login)
+    assert [bobby.post('/follow/1').get_json()['following'] for _ in range(3)] == [True, False, True]
+    coalesce.flush()
+    with coalescing.app_context():
+        db = database.get_read_db()
+        assert [tuple(r) for r in db.execute('SELECT follower_id, following_id FROM followers')] == [(2, 1)]
+        assert [r[0] for r in db.execute('SELECT post_id FROM timeline WHERE user_id = 2')] == [post_id]
+        assert counters.verify(db) == []
+
+
+def test_a_bad_intent_does_not_sink_the_batch(coalescing, login):
+    bobby, post_id = _post(login)
+    failed = coalesce.stats()['failed']
+    bobby.post('/like/999')                     # no such post
+    bobby.post(f'/like/{post_id}')
+    coalesce.flush()
+    assert _state(coalescing, post_id)[:2] == (1, 1)
+    assert coalesce.stats()['failed'] == failed + 1
+
+
+def test_without_coalescing_a_toggle_commits_in_the_request(app, login):
+    bobby, post_id = _post(login)
+    assert bobby.post(f'/like/{post_id}').get_json() == {'liked': True, 'count': 1}
+    assert _state(app, post_id) == (1, 1, 1)
@@ -0,0 +1,90 @@
+import pytest
+
+from dialect import Postgres, SQLite
+
+# (SQLite SQL as the app writes it, what PostgreSQL is sent)
+TRANSLATIONS = [
+    # placeholders, and % for psycopg
+    ('SELECT * FROM posts WHERE user_id=? AND id<?',
+     'SELECT * FROM posts WHERE user_id=%s AND id<%s'),
+    ("SELECT id FROM users WHERE username LIKE ? ESCAPE '\\' AND bio LIKE '%cat%'",
+     "SELECT id FROM users WHERE username LIKE %s ESCAPE '\\' AND bio LIKE '%%cat%%'"),
+    ("UPDATE users SET bio = 'why? because' WHERE id = ?",
+     "UPDATE users SET bio = 'why? because' WHERE id = %s"),
+    ('SELECT "odd?name" FROM t -- what?\nWHERE id = ?',
+     'SELECT "odd?name" FROM t -- what?\nWHERE id = %s'),
+    # INSERT OR IGNORE
+    ('INSERT OR IGNORE INTO likes (user_id, post_id) VALUES (?,?)',
+     'INSERT INTO likes (user_id, post_id) VALUES (%s,%s) ON CONFLICT DO NOTHING'),
+    ('insert or ignore into story_views (user_id, story_id) values (?,?)',
+     'INSERT into story_views (user_id, story_id) values (%s,%s) ON CONFLICT DO NOTHING'),
+    ('INSERT OR IGNORE INTO timeline (user_id, post_id) SELECT ?, id FROM posts WHERE user_id = ? RETURNING post_id',
+     'INSERT INTO timeline (user_id, post_id) SELECT %s, id FROM posts WHERE user_id = %s '
+     'ON CONFLICT DO NOTHING RETURNING post_id'),
+    # datetime()
+    ("SELECT id FROM stories WHERE expires_at > datetime('now')",
+     'SELECT id FROM stories WHERE expires_at > LOCALTIMESTAMP(0)'),
+    ("DELETE FROM notifications WHERE created_at < datetime('now', ?)",
+     'DELETE FROM notifications WHERE created_at < (LOCALTIMESTAMP(0) + CAST(%s AS INTERVAL))'),
+    ("expires_at TIMESTAMP DEFAULT (datetime('now', '+24 hours'))",
+     "expires_at TIMESTAMP DEFAULT ((LOCALTIMESTAMP(0) + CAST('+24 hours' AS INTERVAL)))"),
+    ("SELECT id FROM posts WHERE created_at >= datetime(?, 'unixepoch')",
+     "SELECT id FROM posts WHERE created_at >= CAST(to_timestamp(%s) AT TIME ZONE 'UTC' AS TIMESTAMP(0))"),
+    # MAX/MIN: two arguments are GREATEST/LEAST, one is the aggregate
+    ('UPDATE blobs SET refcount = MAX(refcount - 1, 0) WHERE key=? RETURNING refcount',
+     'UPDATE blobs SET refcount = GREATEST(refcount - 1, 0) WHERE key=%s RETURNING refcount'),
+    ('SELECT MIN(s.id), COALESCE(MIN(CASE WHEN v.id IS NULL THEN s.id END), MIN(s.id)), MAX(id) FROM s',
+     'SELECT MIN(s.id), COALESCE(MIN(CASE WHEN v.id IS NULL THEN s.id END), MIN(s.id)), MAX(id) FROM s'),
+    ('SELECT MIN(MAX(a, ?), b) FROM t',
+     'SELECT LEAST(GREATEST(a, %s), b) FROM t'),
+    # IS ? compares NULLs
+    ('DELETE FROM sessions WHERE user_id = ? AND id IS NOT ?',
+     'DELETE FROM sessions WHERE user_id = %s AND id IS DISTINCT FROM %s'),
+    ('SELECT 1 FROM t WHERE a IS ? AND b IS NULL',
+     'SELECT 1 FROM t WHERE a IS NOT DISTINCT FROM %s AND b IS NULL'),
+    # upserts: bare columns on the right of DO UPDATE SET name the target table
+    ('INSERT INTO post_stats (post_id, like_count) VALUES (?, MAX(?, 0)) '
+     'ON CONFLICT(post_id) DO UPDATE SET like_count = MAX(like_count + ?, 0), version = version + 1',
+     'INSERT INTO post_stats (post_id, like_count) VALUES (%s, GREATEST(%s, 0)) '
+     'ON CONFLICT(post_id) DO UPDATE SET like_count = GREATEST(post_stats.like_count + %s, 0),'
+     ' version = post_stats.version + 1'),
+    ('INSERT INTO blobs (key, size) VALUES (?,?) ON CONFLICT(key) DO UPDATE SET refcount = refcount + 1 '
+     'RETURNING ext, variants',
+     'INSERT INTO blobs (key, size) VALUES (%s,%s) ON CONFLICT(key) DO UPDATE SET refcount = blobs.refcount + 1 '
+     'RETURNING ext, variants'),
+    ('INSERT INTO recs (user_id, computed_at) VALUES (?,?) '
+     'ON CONFLICT(user_id) DO UPDATE SET computed_at = excluded.computed_at, dirty = 0',
+     'INSERT INTO recs (user_id, computed_at) VALUES (%s,%s) '
+     'ON CONFLICT(user_id) DO UPDATE SET computed_at = excluded.computed_at, dirty = 0'),
+    ("INSERT INTO kv (k, v) VALUES (?, ?) ON CONFLICT(k) DO UPDATE SET v = CASE WHEN v IS NULL THEN 'x' ELSE v END",
+     "INSERT INTO kv (k, v) VALUES (%s, %s) ON CONFLICT(k) DO UPDATE SET v = "
+     "CASE WHEN kv.v IS NULL THEN 'x' ELSE kv.v END"),
+    # DDL
+    ('CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, score REAL, data BLOB)',
+     'CREATE TABLE t (id SERIAL PRIMARY KEY, score DOUBLE PRECISION, data BYTEA)'),
+    ('CREATE TABLE pair (a INTEGER, b INTEGER, PRIMARY KEY (a, b)) WITHOUT ROWID',
+     'CREATE TABLE pair (a INTEGER, b INTEGER, PRIMARY KEY (a, b))'),
+]
+
+
+@pytest.mark.parametrize('sql, expected', TRANSLATIONS)
+def test_postgres_translate(sql, expected):
+    assert Postgres.translate(sql) == expected
+
+
+@pytest.mark.parametrize('sql, _', TRANSLATIONS)
+def test_sqlite_runs_the_sql_untouched(sql, _):
+    assert SQLite.translate(sql) == sql
+
+
+def test_translate_script_keeps_placeholders_and_percent_signs():
+    script = "CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, note TEXT DEFAULT '100%');\n" \
+             "CREATE INDEX t_note ON t (note) WHERE note IS NOT NULL;"
+    assert Postgres.translate_script(script) == \
+        "CREATE TABLE t (id SERIAL PRIMARY KEY, note TEXT DEFAULT '100%');\n" \
+        "CREATE INDEX t_note ON t (note) WHERE note IS NOT NULL;"
+
+
+def test_datetime_without_an_equivalent_is_refused():
+    with pytest.raises(ValueError):
+        Postgres.translate("SELECT datetime(created_at, 'localtime') FROM posts")
@@ -0,0 +1,39 @@
+import sqlite3
+
+import database
+import events
+
+
+def test_sqlite_backend_publishes_on_one_connection(app, monkeypatch):
+    monkeypatch.setattr(events, 'POLL_INTERVAL', 0.01)
+    backend = events.SQLiteBackend()
+    opened = []
+    connect = database._connect
+    monkeypatch.setattr(database, '_connect', lambda *a, **kw: opened.append(a) or connect(*a, **kw))
+
+    q = backend.subscribe(7)
+    for n in range(3):
+        backend.publish(7, {'n': n})
+    assert [q.get(timeout=5)['n'] for _ in range(3)] == [0, 1, 2]
+    assert len(opened) == 2             # the poller's and the publisher's, not one per event
+
+
+def test_sqlite_backend_restarts_a_failed_poller(app, monkeypatch):
+    monkeypatch.setattr(events, 'POLL_INTERVAL', 0.01)
+    backend = events.SQLiteBackend()
+    connection = backend._connection
+    failures = [sqlite3.OperationalError('database is locked')]
+
+    def flaky():
+        if failures:
+            raise failures.pop()
+        return connection()
+
+    monkeypatch.setattr(backend, '_connection', flaky)
+    backend.subscribe(7)
+    backend._thread.join(timeout=5)
+    assert backend._pid is None and backend._thread is None
+
+    q = backend.subscribe(7)
+    backend.publish(7, {'n': 1})
+    assert q.get(timeout=5) == {'n': 1}
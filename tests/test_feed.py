@@ -0,0 +1,35 @@
+import io
+
+import database
+import media
+
+
+def test_post_with_only_unresolved_upload_ids_is_rejected(app, login):
+    alice = login('alice')
+    response = alice.post('/post', data={'content': '', 'upload_ids': ['missing', 'also-missing']})
+    assert response.status_code == 400
+    with app.app_context():
+        assert database.get_db().execute('SELECT COUNT(*) FROM posts').fetchone()[0] == 0
+
+
+def test_text_post_with_unresolved_upload_id_keeps_the_text(app, login):
+    alice = login('alice')
+    response = alice.post('/post', data={'content': 'hello', 'upload_ids': ['missing']})
+    assert response.status_code == 200
+    assert response.get_json()['post']['media'] == []
+
+
+def test_files_are_staged_before_the_writer_is_taken(app, login, monkeypatch):
+    alice = login('alice')
+    stream_to_tmp, writer_held = media._stream_to_tmp, []
+
+    def staged(file, media_type):
+        writer_held.append(database.get_pool()._writer_lock.locked())
+        return stream_to_tmp(file, media_type)
+
+    monkeypatch.setattr(media, '_stream_to_tmp', staged)
+    response = alice.post('/post', data={'content': '', 'media': [(io.BytesIO(b'\x00' * 64), 'clip.mp4')]},
+                          content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.get_json()['post']['media'][0]['media_type'] == 'video'
+    assert writer_held == [False]
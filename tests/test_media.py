@@ -0,0 +1,49 @@
+import os
+import time
+
+import database
+import dialect
+import media
+
+SHA = 'ab' * 32
+
+
+def _old_file(name):
+    path = os.path.join(media.UPLOAD_FOLDER, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'jpeg')
+    past = time.time() - media.ORPHAN_GRACE - 60
+    os.utime(path, (past, past))
+    return path
+
+
+def test_gc_removes_old_unreferenced_files(app):
+    orphan = _old_file(f'images/{SHA}.jpg')
+    with app.app_context():
+        stats = media.gc(database.get_db())
+    assert stats['files_removed'] == 1
+    assert not os.path.exists(orphan)
+
+
+def test_gc_keeps_a_file_uploaded_again_before_it_is_removed(app, monkeypatch):
+    orphan = _old_file(f'images/{SHA}.jpg')
+    locks = []
+
+    def lock_for_write(db, table):
+        locks.append(table)
+        if len(locks) == 2:
+            # The same content is uploaded between the reconciliation and the unlink
+            staged = os.path.join(media.UPLOAD_FOLDER, media.TMP_FOLDER, 'again.part')
+            os.makedirs(os.path.dirname(staged), exist_ok=True)
+            open(staged, 'wb').close()
+            media.acquire(db, 'images', SHA, 'jpg', 4, staged)
+            db.commit()
+        db.execute('BEGIN IMMEDIATE')
+
+    monkeypatch.setattr(dialect.SQLite, 'lock_for_write', staticmethod(lock_for_write))
+    with app.app_context():
+        stats = media.gc(database.get_db())
+    assert len(locks) == 2
+    assert stats['files_removed'] == 0
+    assert os.path.exists(orphan)
@@ -0,0 +1,22 @@
+from flask import template_rendered
+
+import database
+
+
+def test_index_marks_read_and_renders_without_the_writer(app, login):
+    alice, bobby = login('alice'), login('bobby')
+    with app.app_context():
+        alice_id = database.get_db().execute("SELECT id FROM users WHERE username='alice'").fetchone()[0]
+    bobby.post(f'/follow/{alice_id}')
+    assert alice.get('/notifications/count').get_json()['count'] == 1
+
+    writer_held = []
+
+    def rendered(sender, template, context, **extra):
+        if template.name == 'notifications.html':
+            writer_held.append(database.get_pool()._writer_lock.locked())
+
+    with template_rendered.connected_to(rendered, app):
+        assert alice.get('/notifications').status_code == 200
+    assert writer_held == [False]
+    assert alice.get('/notifications/count').get_json()['count'] == 0
@@ -0,0 +1,56 @@
+import database
+import pagination
+
+
+def _walk(client, url, limit):
+    """The ids on every page of url, following next_cursor to the end."""
+    pages, cursor = [], None
+    while True:
+        body = client.get(url, query_string={'limit': limit, **({'cursor': cursor} if cursor else {})}).get_json()
+        pages.append([item['id'] for item in body['items']])
+        cursor = body['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def _same_second(app, *tables):
+    with app.app_context():
+        db = database.get_db()
+        for table in tables:
+            db.execute(f"UPDATE {table} SET created_at = '2026-01-01 12:00:00'")
+        db.commit()
+
+
+def test_posts_with_tied_timestamps_page_by_id(app, login):
+    alice = login('alice')
+    ids = [alice.post('/post', data={'content': f'post {n}'}).get_json()['post']['id'] for n in range(5)]
+    _same_second(app, 'posts', 'timeline')   # the timeline keeps a copy of created_at
+    assert _walk(alice, '/api/users/1/posts', 2) == [ids[4:2:-1], ids[2:0:-1], ids[:1]]
+    assert _walk(alice, '/api/feed', 2) == [ids[4:2:-1], ids[2:0:-1], ids[:1]]
+
+
+def test_a_full_last_page_has_no_next_cursor(app, login):
+    alice = login('alice')
+    post_id = alice.post('/post', data={'content': 'hi'}).get_json()['post']['id']
+    for n in range(4):
+        alice.post(f'/api/comments/{post_id}', json={'content': f'comment {n}'})
+    _same_second(app, 'comments')
+    pages = _walk(alice, f'/api/comments/{post_id}', 2)
+    assert [len(page) for page in pages] == [2, 2]
+    assert sum(pages, []) == sorted(sum(pages, []))     # oldest first
+
+
+def test_follower_lists_page_through_ties(app, login):
+    alice = login('alice')
+    followers = [login(f'fan{n}') for n in range(3)]
+    for fan in followers:
+        fan.post('/follow/1')
+    _same_second(app, 'followers')
+    assert _walk(alice, '/api/users/1/followers', 2) == [[4, 3], [2]]
+    assert _walk(followers[0], '/api/users/2/following', 2) == [[1]]
+
+
+def test_a_garbled_cursor_starts_over():
+    assert pagination.decode_cursor('not-a-cursor') is None
+    assert pagination.decode_cursor(pagination.encode_cursor('2026-01-01 12:00:00', 7)) == \
+        ('2026-01-01 12:00:00', 7)
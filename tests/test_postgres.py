@@ -0,0 +1,104 @@
+"""Run against a real server: TEST_DATABASE_URL=postgresql://... pytest -m postgres
+
+The database at TEST_DATABASE_URL is wiped by every test.
+"""
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import database
+import dialect
+import pgsql
+import transfer
+
+URL = os.environ.get('TEST_DATABASE_URL', '')
+
+pytestmark = pytest.mark.postgres
+
+
+@pytest.fixture
+def postgres(app, monkeypatch):
+    """Switch the app to an empty TEST_DATABASE_URL database, migrated."""
+    if not dialect.is_postgres_url(URL):
+        pytest.skip('TEST_DATABASE_URL is not set to a PostgreSQL database')
+    try:
+        db = pgsql.connect(URL)
+    except Exception as e:
+        pytest.skip(f'PostgreSQL is not available: {e}')
+    try:
+        db.executescript('DROP SCHEMA public CASCADE; CREATE SCHEMA public')
+        db.commit()
+    finally:
+        db.close()
+    monkeypatch.setattr(database, 'DATABASE', URL)
+    database.init_db()
+    database.migrate_db()
+    yield app
+    database._pools.pop(URL, None)
+
+
+def test_pool_hands_out_read_only_readers_and_concurrent_writers(postgres):
+    pool = database.get_pool()
+    assert isinstance(pool, database.PostgresPool)
+    reader = pool.acquire_reader()
+    try:
+        with pytest.raises(Exception, match='read-only'):
+            reader.execute("INSERT INTO users (username, password_hash) VALUES ('x', 'x')")
+    finally:
+        pool.release_reader(reader)
+
+    first = pool.acquire_writer()
+    second = []
+    thread = threading.Thread(target=lambda: second.append(pool.acquire_writer()))
+    thread.start()
+    thread.join(timeout=5)
+    assert second and second[0] is not first       # the server takes concurrent writers
+    for db in (first, second[0]):
+        db.execute("INSERT INTO users (username, password_hash) VALUES (?, 'x')", (f'w{id(db)}',))
+        db.commit()
+        pool.release_writer(db)
+    db = pool.acquire_writer()
+    try:
+        with pytest.raises(sqlite3.IntegrityError):
+            db.execute("INSERT INTO users (username, password_hash) VALUES (?, 'x')", (f'w{id(first)}',))
+    finally:
+        pool.release_writer(db)
+
+
+def _content(login):
+    alice, bobby = login('alice'), login('bobby')
+    post_id = alice.post('/post', data={'content': 'hello 100%'}).get_json()['post']['id']
+    assert bobby.post(f'/like/{post_id}').get_json() == {'liked': True, 'count': 1}
+    assert bobby.post(f'/api/comments/{post_id}', json={'content': 'hi?'}).status_code == 200
+    return alice
+
+
+def test_app_runs_on_postgres(postgres, login):
+    alice = _content(login)
+    assert 'hello 100%' in alice.get('/').get_data(as_text=True)
+
+
+def test_transfer_round_trip_through_sqlite(postgres, login, monkeypatch, tmp_path):
+    _content(login)
+    path, back = str(tmp_path / 'from-pg.jsonl.gz'), str(tmp_path / 'from-sqlite.jsonl')
+    with postgres.app_context():
+        exported = transfer.export(database.get_read_db(), path)
+    assert exported['posts'] == 1 and exported['likes'] == 1
+
+    monkeypatch.setattr(database, 'DATABASE', str(tmp_path / 'copy.db'))
+    database.init_db()
+    database.migrate_db()
+    with postgres.app_context():
+        assert transfer.load(database.get_db(), path) == exported
+        transfer.export(database.get_read_db(), back)
+
+    monkeypatch.setattr(database, 'DATABASE', URL)
+    with postgres.app_context():
+        db = database.get_db()
+        assert transfer.load(db, back) == exported
+        # Sequences continue after the loaded ids
+        db.execute("INSERT INTO users (username, password_hash) VALUES ('carol', 'x')")
+        db.commit()
+        assert db.execute("SELECT id FROM users WHERE username = 'carol'").fetchone()[0] == 3
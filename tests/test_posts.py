@@ -0,0 +1,29 @@
+import pytest
+
+import database
+
+
+def _post_with_media(app, client, n):
+    for i in range(n):
+        post_id = client.post('/post', data={'content': f'post {i}'}).get_json()['post']['id']
+        with app.app_context():
+            db = database.get_db()
+            db.executemany(
+                'INSERT INTO post_media (post_id, filename, media_type, position) VALUES (?, ?, ?, ?)',
+                [(post_id, f'{post_id}-{p}.jpg', 'image', p) for p in range(2)])
+            db.commit()
+
+
+@pytest.mark.parametrize('path', ['/', '/profile/alice'])
+def test_page_query_count_does_not_grow_with_posts(app, login, queries, path):
+    alice, bobby = login('alice'), login('bobby')
+    with app.app_context():
+        alice_id = database.get_db().execute("SELECT id FROM users WHERE username='alice'").fetchone()[0]
+    bobby.post(f'/follow/{alice_id}')
+
+    counts = []
+    for n in (1, 14):                       # 1 post, then 15: both fit one page
+        _post_with_media(app, alice, n)
+        assert bobby.get(path).status_code == 200     # warm the user cache
+        counts.append(len(queries(lambda: bobby.get(path))))
+    assert counts[0] == counts[1]
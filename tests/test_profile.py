@@ -0,0 +1,65 @@
+import io
+import os
+
+from flask import template_rendered
+from PIL import Image
+
+import database
+import images
+import media
+
+
+def _jpeg():
+    buf = io.BytesIO()
+    Image.new('RGB', (300, 200), (10, 20, 30)).save(buf, 'JPEG')
+    return buf.getvalue()
+
+
+def _edit(client, name, avatar):
+    return client.post(f'/profile/{name}/edit', data={'bio': 'hi', 'avatar_file': (io.BytesIO(avatar), 'me.jpg')},
+                       content_type='multipart/form-data')
+
+
+def test_edit_form_renders_without_the_writer(app, login):
+    alice, writer_held = login('alice'), []
+
+    def rendered(sender, template, context, **extra):
+        writer_held.append(database.get_pool()._writer_lock.locked())
+
+    with template_rendered.connected_to(rendered, app):
+        assert alice.get('/profile/alice/edit').status_code == 200
+    assert writer_held == [False]
+
+
+def test_avatar_is_processed_before_the_writer_is_taken(app, login, monkeypatch):
+    process, writer_held = images.process, []
+
+    def processed(*args, **kwargs):
+        writer_held.append(database.get_pool()._writer_lock.locked())
+        return process(*args, **kwargs)
+
+    monkeypatch.setattr(images, 'process', processed)
+    assert _edit(login('alice'), 'alice', _jpeg()).status_code == 302
+    assert writer_held == [False]
+
+    with app.app_context():
+        user = database.get_db().execute("SELECT avatar_img, avatar_variants FROM users WHERE username='alice'").fetchone()
+    variants = images.load(user['avatar_variants'])
+    assert variants['widths'] == [48, 96, 200]
+    assert all(os.path.exists(os.path.join(media.UPLOAD_FOLDER, name)) for name in images.files(user['avatar_img'], variants))
+    assert not os.listdir(os.path.join(media.UPLOAD_FOLDER, media.TMP_FOLDER))
+
+
+def test_same_avatar_twice_shares_one_blob(app, login):
+    avatar = _jpeg()
+    _edit(login('alice'), 'alice', avatar)
+    _edit(login('bobby'), 'bobby', avatar)
+    with app.app_context():
+        db = database.get_db()
+        assert [tuple(r) for r in db.execute('SELECT refcount FROM blobs')] == [(2,)]
+        avatar_imgs = {r[0] for r in db.execute('SELECT avatar_img FROM users')}
+    assert len(avatar_imgs) == 1
+    # Only the variants are kept, not the uploaded original
+    original = images.base_of(avatar_imgs.pop()) + '.jpg'
+    assert not os.path.exists(os.path.join(media.UPLOAD_FOLDER, original))
+    assert not os.listdir(os.path.join(media.UPLOAD_FOLDER, media.TMP_FOLDER))
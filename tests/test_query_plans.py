@@ -0,0 +1,12 @@
+import database
+import querycheck
+
+
+def test_hot_routes_do_no_full_table_scans(app):
+    assert querycheck.check(app) == []
+
+
+def test_unindexed_lookup_is_reported(app):
+    with app.app_context():
+        found = querycheck.full_scans(database.get_db(), ["SELECT * FROM posts WHERE content = 'x'"])
+    assert [detail for _, detail in found] == ['SCAN posts']
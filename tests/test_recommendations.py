@@ -0,0 +1,17 @@
+import database
+import jobs
+import recommendations
+
+
+def test_worker_refreshes_recommendations(app, login):
+    alice, bobby, carol = login('alice'), login('bobby'), login('carol')
+    with app.app_context():
+        ids = {r['username']: r['id'] for r in database.get_db().execute('SELECT id, username FROM users')}
+    bobby.post(f"/follow/{ids['alice']}")
+    alice.post(f"/follow/{ids['carol']}")
+
+    with app.app_context():
+        db = database.get_db()
+        jobs.work(db, once=True, log=lambda line: None)
+        suggested = [(r['username'], r['mutual_count']) for r in recommendations.for_user(db, ids['bobby'])]
+    assert suggested[0] == ('carol', 1)
@@ -0,0 +1,53 @@
+import database
+import fulltext
+
+
+def _search(client, q):
+    body = client.get('/search', query_string={'q': q}, headers={'X-Requested-With': 'XMLHttpRequest'}).get_json()
+    return {(r['type'], r['id']) for r in body['results']}
+
+
+def test_prefixes_match_users_posts_and_comments(app, login):
+    alice, bobby = login('alice'), login('bobby')
+    post_id = alice.post('/post', data={'content': 'Photography tips for café lighting'}).get_json()['post']['id']
+    comment_id = bobby.post(f'/api/comments/{post_id}', json={'content': 'great photos'}).get_json()['id']
+    assert _search(bobby, 'ali') == {('user', 1)}
+    assert _search(bobby, 'pho') == {('post', post_id), ('comment', comment_id)}
+    assert _search(bobby, 'photo TIP') == {('post', post_id)}
+    assert _search(bobby, 'cafe') == {('post', post_id)}          # diacritics removed
+    assert _search(bobby, 'zebra') == set()
+
+
+def test_triggers_follow_edits_and_deletes(app, login):
+    alice, bobby = login('alice'), login('bobby')
+    alice.post('/profile/alice/edit', data={'bio': 'mountaineer'})
+    post_id = alice.post('/post', data={'content': 'summit day'}).get_json()['post']['id']
+    comment_id = bobby.post(f'/api/comments/{post_id}', json={'content': 'summit envy'}).get_json()['id']
+    assert _search(bobby, 'mountain') == {('user', 1)}
+    assert _search(bobby, 'summit') == {('post', post_id), ('comment', comment_id)}
+
+    alice.post('/profile/alice/edit', data={'bio': 'sailor'})
+    assert _search(bobby, 'mountain') == set()
+    assert _search(bobby, 'sail') == {('user', 1)}
+    bobby.post(f'/api/comments/{comment_id}/delete')
+    assert _search(bobby, 'summit') == {('post', post_id)}
+    alice.post(f'/api/posts/{post_id}/delete')
+    assert _search(bobby, 'summit') == set()
+
+
+def test_rebuild_restores_a_stale_index(app, login):
+    alice = login('alice')
+    post_id = alice.post('/post', data={'content': 'kayak'}).get_json()['post']['id']
+    with app.app_context():
+        db = database.get_db()
+        db.execute("INSERT INTO posts_fts (posts_fts, rowid, content) VALUES ('delete', ?, 'kayak')", (post_id,))
+        db.commit()
+        assert fulltext.search_posts(db, fulltext.match_query('kayak')) == []
+        fulltext.rebuild(db)
+        assert [r['id'] for r in fulltext.search_posts(db, fulltext.match_query('kayak'))] == [post_id]
+
+
+def test_match_query_quotes_every_token():
+    assert fulltext.match_query('ali bo') == '"ali"* "bo"*'
+    assert fulltext.match_query('"a" OR b*') == '"a"* "OR"* "b"*'
+    assert fulltext.match_query(' -*" ') is None
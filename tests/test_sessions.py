@@ -0,0 +1,73 @@
+import time
+
+import database
+import sessions
+
+
+def _sid(client):
+    cookie = client.get_cookie('session')
+    return cookie and cookie.value
+
+
+def _row(app, sid):
+    with app.app_context():
+        return database.get_read_db().execute('SELECT * FROM sessions WHERE id = ?', (sid,)).fetchone()
+
+
+def _set_expiry(app, sid, expires_at):
+    with app.app_context():
+        db = database.get_db()
+        db.execute('UPDATE sessions SET expires_at = ? WHERE id = ?', (expires_at, sid))
+        db.commit()
+
+
+def test_signing_in_issues_a_new_session_id(app):
+    client = app.test_client()
+    client.post('/register', data={'username': 'alice', 'password': 'secret1'})
+    anonymous = _sid(client)                    # carries the flashed message
+    assert _row(app, anonymous)['user_id'] is None
+    client.post('/login', data={'username': 'alice', 'password': 'secret1'})
+    assert _sid(client) != anonymous
+    assert _row(app, anonymous) is None
+    assert _row(app, _sid(client))['user_id'] == 1
+
+
+def test_expiry_slides_but_page_views_do_not_write(app, login, queries):
+    alice = login('alice')
+    sid = _sid(alice)
+    alice.get('/')                              # shows (and clears) the registration flash
+    statements = queries(lambda: alice.get('/'))
+    touched = [sql for sql in statements if 'sessions' in sql]
+    assert touched and all(sql.lstrip().startswith('SELECT') for sql in touched)
+
+    now = time.time()
+    _set_expiry(app, sid, now + sessions.LIFETIME - sessions.REFRESH - 60)
+    assert alice.get('/').status_code == 200
+    assert _row(app, sid)['expires_at'] >= now + sessions.LIFETIME - 60
+    assert _sid(alice) == sid
+
+
+def test_an_expired_session_signs_out(app, login):
+    alice = login('alice')
+    sid = _sid(alice)
+    _set_expiry(app, sid, time.time() - 1)
+    response = alice.get('/')
+    assert response.status_code == 302 and '/login' in response.location
+    assert _sid(alice) is None
+    with app.app_context():
+        db = database.get_db()
+        assert sessions.sweep(db) == 1
+        db.commit()
+
+
+def test_logout_and_revoke_invalidate_sessions(app, login):
+    alice, phone = login('alice'), app.test_client()
+    phone.post('/login', data={'username': 'alice', 'password': 'secret1'})
+    sid = _sid(alice)
+    alice.get('/logout')
+    assert _row(app, sid) is None
+    assert phone.get('/').status_code == 200
+
+    result = app.test_cli_runner().invoke(args=['revoke-sessions', 'alice'])
+    assert result.output == 'Revoked 1 sessions\n'
+    assert phone.get('/').status_code == 302
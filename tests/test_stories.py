@@ -0,0 +1,31 @@
+from flask import template_rendered
+
+import database
+import stories
+
+
+def test_view_marks_seen_and_renders_without_the_writer(app, login):
+    alice, bobby = login('alice'), login('bobby')
+    with app.app_context():
+        ids = {r['username']: r['id'] for r in database.get_db().execute('SELECT id, username FROM users')}
+    alice_id = ids['alice']
+    bobby.post(f'/follow/{alice_id}')
+    alice.post('/story/create', data={'content': 'one'})
+    alice.post('/story/create', data={'content': 'two'})
+    with app.app_context():
+        first, second = [r[0] for r in database.get_db().execute('SELECT id FROM stories ORDER BY id')]
+
+    writer_held, pages = [], []
+
+    def rendered(sender, template, context, **extra):
+        if template.name == 'story_view.html':
+            writer_held.append(database.get_pool()._writer_lock.locked())
+            pages.append((context['prev_id'], context['next_id']))
+
+    with template_rendered.connected_to(rendered, app):
+        assert bobby.get(f'/story/{first}').status_code == 200
+    assert writer_held == [False]
+    assert pages[0][1] == second
+    with app.app_context():
+        ring = {r['user_id']: r for r in stories.ring(database.get_read_db(), ids['bobby'])}
+    assert ring[alice_id]['unseen'] == 1
@@ -0,0 +1,55 @@
+import database
+import timeline
+
+
+def _inbox(app, user_id):
+    with app.app_context():
+        return [r[0] for r in database.get_read_db().execute(
+            'SELECT post_id FROM timeline WHERE user_id = ? ORDER BY created_at DESC, post_id DESC', (user_id,))]
+
+
+def _feed(client):
+    return [item['id'] for item in client.get('/api/feed').get_json()['items']]
+
+
+def test_posts_fan_out_to_followers(app, login):
+    alice, bobby = login('alice'), login('bobby')
+    bobby.post('/follow/1')
+    post_id = alice.post('/post', data={'content': 'hi'}).get_json()['post']['id']
+    assert _inbox(app, 1) == _inbox(app, 2) == [post_id]
+    assert _feed(bobby) == [post_id]
+
+
+def test_following_backfills_and_unfollowing_prunes(app, login, monkeypatch):
+    monkeypatch.setattr(timeline, 'BACKFILL', 2)
+    alice, bobby = login('alice'), login('bobby')
+    ids = [alice.post('/post', data={'content': f'post {n}'}).get_json()['post']['id'] for n in range(3)]
+    own = bobby.post('/post', data={'content': 'mine'}).get_json()['post']['id']
+
+    bobby.post('/follow/1')
+    assert set(_inbox(app, 2)) == {own, ids[2], ids[1]}
+    bobby.post('/follow/1')
+    assert _inbox(app, 2) == [own]
+    assert _feed(bobby) == [own]
+
+
+def test_popular_authors_are_merged_at_read_time(app, login, monkeypatch):
+    monkeypatch.setattr(timeline, 'FANOUT_LIMIT', 0)
+    alice, bobby = login('alice'), login('bobby')
+    bobby.post('/follow/1')
+    first = alice.post('/post', data={'content': 'one'}).get_json()['post']['id']
+    own = bobby.post('/post', data={'content': 'mine'}).get_json()['post']['id']
+    last = alice.post('/post', data={'content': 'two'}).get_json()['post']['id']
+    assert _inbox(app, 2) == [own]
+    assert _feed(bobby) == [last, own, first]
+
+
+def test_rebuild_matches_the_incremental_timelines(app, login):
+    alice, bobby, carol = login('alice'), login('bobby'), login('carol')
+    bobby.post('/follow/1')
+    carol.post('/follow/2')
+    for client in (alice, bobby, carol):
+        client.post('/post', data={'content': 'hello'})
+    before = {user_id: _inbox(app, user_id) for user_id in (1, 2, 3)}
+    assert app.test_cli_runner().invoke(args=['rebuild-timeline']).exit_code == 0
+    assert {user_id: _inbox(app, user_id) for user_id in (1, 2, 3)} == before
@@ -0,0 +1,43 @@
+import database
+import jobs
+import trending
+
+
+def _like_and_comment(login):
+    alice, bobby = login('alice'), login('bobby')
+    post_id = alice.post('/post', data={'content': 'hot'}).get_json()['post']['id']
+    bobby.post(f'/like/{post_id}')
+    bobby.post(f'/api/comments/{post_id}', json={'content': 'nice'})
+    return post_id
+
+
+def test_engagement_ranks_a_post(app, login):
+    post_id = _like_and_comment(login)
+    with app.app_context():
+        db = database.get_read_db()
+        [(top_id, score)] = trending.top(db)
+        assert top_id == post_id
+        assert abs(score - (trending.WEIGHTS['like'] + trending.WEIGHTS['comment'])) < 1e-3
+        assert [r['id'] for r in trending.top_posts(db, 1)] == [post_id]
+
+
+def test_posts_outside_the_window_are_skipped_before_compaction(app, login):
+    post_id = _like_and_comment(login)
+    with app.app_context():
+        db = database.get_db()
+        db.execute("UPDATE posts SET created_at = datetime('now', '-8 days') WHERE id = ?", (post_id,))
+        db.commit()
+        assert trending.top(db) == []
+        assert trending.top_posts(db, 1) == []
+        assert db.execute('SELECT COUNT(*) FROM post_scores').fetchone()[0] == 1
+
+
+def test_worker_compacts_periodically(app, login):
+    post_id = _like_and_comment(login)
+    assert 'compact_trending' in jobs.PERIODIC
+    with app.app_context():
+        db = database.get_db()
+        db.execute("UPDATE posts SET created_at = datetime('now', '-8 days') WHERE id = ?", (post_id,))
+        db.commit()
+        jobs.work(db, once=True, log=lambda line: None)
+        assert db.execute('SELECT COUNT(*) FROM post_scores').fetchone()[0] == 0
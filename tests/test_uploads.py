@@ -0,0 +1,32 @@
+import database
+import uploads
+
+VIDEO = b'\x00\x00\x00\x18ftypmp42' + b'v' * 3000
+
+
+def _complete_upload(client):
+    upload = client.post('/api/uploads', json={'filename': 'clip.mp4', 'size': len(VIDEO)}).get_json()
+    client.put(f"/api/uploads/{upload['id']}?offset=0", data=VIDEO)
+    assert client.post(f"/api/uploads/{upload['id']}/complete").status_code == 200
+    return upload['id']
+
+
+def test_upload_can_be_posted_after_a_rolled_back_take(app, login):
+    alice = login('alice')
+    upload_id = _complete_upload(alice)
+    with app.app_context():
+        db = database.get_db()
+        uid = db.execute("SELECT id FROM users WHERE username='alice'").fetchone()[0]
+        assert uploads.take(db, uid, upload_id)[0]
+        db.rollback()       # the part file has already been moved into the blob store
+
+    response = alice.post('/post', data={'content': '', 'upload_ids': [upload_id]})
+    assert response.status_code == 200
+    assert response.get_json()['post']['media'][0]['media_type'] == 'video'
+
+
+def test_upload_is_taken_once(app, login):
+    alice = login('alice')
+    upload_id = _complete_upload(alice)
+    assert alice.post('/post', data={'content': 'a', 'upload_ids': [upload_id]}).get_json()['post']['media']
+    assert alice.post('/post', data={'content': 'b', 'upload_ids': [upload_id]}).get_json()['post']['media'] == []
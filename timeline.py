@@ -0,0 +1,111 @@
+"""Fan-out-on-write home timelines.
+
+create_post copies each new post id into the timeline of every follower, so
+reading the home feed is one range scan over (user_id, created_at, post_id).
+Authors with more than FANOUT_LIMIT followers are not fanned out; their
+posts are merged in at read time instead.
+"""
+import os
+
+ENABLED = os.environ.get('TIMELINE_FANOUT', '1') == '1'
+FANOUT_LIMIT = 5000   # followers above which an author is merged at read time
+BACKFILL = 200        # posts copied into a timeline when following someone
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS timeline (
+        user_id INTEGER NOT NULL,
+        post_id INTEGER NOT NULL,
+        author_id INTEGER NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (user_id, created_at, post_id),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_timeline_post ON timeline(post_id);
+    CREATE INDEX IF NOT EXISTS idx_timeline_author ON timeline(user_id, author_id);
+"""
+
+
+def _is_fanned_out(db, author_id):
+    row = db.execute('SELECT followers_count FROM user_stats WHERE user_id=?', (author_id,)).fetchone()
+    return not row or row['followers_count'] <= FANOUT_LIMIT
+
+
+def fan_out(db, post_id, author_id):
+    """Push a new post into its author's and (if not too popular) followers' timelines. No commit."""
+    if not ENABLED:
+        return
+    db.execute('''
+        INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, created_at)
+        SELECT user_id, id, user_id, created_at FROM posts WHERE id = ?
+    ''', (post_id,))
+    if _is_fanned_out(db, author_id):
+        db.execute('''
+            INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, created_at)
+            SELECT f.follower_id, p.id, p.user_id, p.created_at
+            FROM posts p JOIN followers f ON f.following_id = p.user_id
+            WHERE p.id = ?
+        ''', (post_id,))
+
+
+def backfill(db, user_id, author_id):
+    """Copy an author's recent posts into a new follower's timeline. No commit."""
+    if not ENABLED or not _is_fanned_out(db, author_id):
+        return
+    db.execute('''
+        INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, created_at)
+        SELECT ?, id, user_id, created_at FROM posts
+        WHERE user_id = ?
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    ''', (user_id, author_id, BACKFILL))
+
+
+def prune(db, user_id, author_id):
+    """Drop an unfollowed author's posts from a timeline. No commit."""
+    if ENABLED:
+        db.execute('DELETE FROM timeline WHERE user_id=? AND author_id=?', (user_id, author_id))
+
+
+def page_ids(db, uid, cursor, limit):
+    """Post ids for one home-feed page: the user's inbox merged with followed high-follower authors."""
+    keyset = '(created_at, post_id) < (?, ?)' if cursor else 'TRUE'
+    inbox = db.execute(f'''
+        SELECT post_id, created_at FROM timeline
+        WHERE user_id = ? AND {keyset}
+        ORDER BY created_at DESC, post_id DESC
+        LIMIT ?
+    ''', (uid, *(cursor or ()), limit + 1)).fetchall()
+
+    keyset = '(p.created_at, p.id) < (?, ?)' if cursor else 'TRUE'
+    merged = db.execute(f'''
+        SELECT p.id AS post_id, p.created_at FROM posts p
+        WHERE p.user_id IN (
+            SELECT f.following_id FROM followers f
+            JOIN user_stats us ON us.user_id = f.following_id
+            WHERE f.follower_id = ? AND us.followers_count > ?
+        ) AND {keyset}
+        ORDER BY p.created_at DESC, p.id DESC
+        LIMIT ?
+    ''', (uid, FANOUT_LIMIT, *(cursor or ()), limit + 1)).fetchall()
+
+    rows = {r['post_id']: (r['created_at'], r['post_id']) for r in (*inbox, *merged)}
+    return sorted(rows, key=rows.get, reverse=True)[:limit + 1]
+
+
+def rebuild(db):
+    """Re-materialize every timeline from the follow graph and commit."""
+    db.execute('DELETE FROM timeline')
+    db.execute('''
+        INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, created_at)
+        SELECT user_id, id, user_id, created_at FROM posts
+    ''')
+    db.execute('''
+        INSERT OR IGNORE INTO timeline (user_id, post_id, author_id, created_at)
+        SELECT f.follower_id, p.id, p.user_id, p.created_at
+        FROM followers f
+        JOIN posts p ON p.user_id = f.following_id
+        LEFT JOIN user_stats us ON us.user_id = f.following_id
+        WHERE COALESCE(us.followers_count, 0) <= ?
+    ''', (FANOUT_LIMIT,))
+    db.commit()
@@ -0,0 +1,110 @@
+"""Copy the data between databases: `flask export-data` / `flask import-data`.
+
+The export is JSON lines, gzipped when the file name ends in .gz: a header
+with the schema version and the table list, then per table a line naming
+it and its columns followed by one line per row. Tables are written parents
+first, so foreign keys hold at every insert on the way back in. Search
+indexes are left out and rebuilt, so an export from SQLite loads into
+PostgreSQL and back:
+
+    flask export-data social.jsonl.gz
+    DATABASE_URL=postgresql://... flask migrate
+    DATABASE_URL=postgresql://... flask import-data social.jsonl.gz
+
+Both sides must be at the same schema version (run `flask migrate` on
+each first). Import replaces the contents of every table in the file, in
+one transaction.
+"""
+import base64
+import gzip
+import json
+
+import dialect
+import fulltext
+
+FORMAT = 'social-export'
+BATCH = 500                 # rows per executemany on import
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _encode(value):
+    return {'b64': base64.b64encode(value).decode()} if isinstance(value, bytes) else value
+
+
+def _decode(value):
+    return base64.b64decode(value['b64']) if isinstance(value, dict) else value
+
+
+def export(db, path):
+    """Write every table of db to path. Returns {table: rows}."""
+    d = dialect.of(db)
+    tables = d.tables(db)
+    counts = {}
+    # One snapshot for all tables, without holding up writers
+    db.execute(d.snapshot)
+    try:
+        with _open(path, 'w') as out:
+            out.write(json.dumps({'format': FORMAT, 'schema_version': d.schema_version(db),
+                                  'dialect': d.name, 'tables': tables}) + '\n')
+            for table in tables:
+                cursor = db.execute(f'SELECT * FROM {table}')
+                columns = [c[0] for c in cursor.description]
+                out.write(json.dumps({'table': table, 'columns': columns}) + '\n')
+                counts[table] = 0
+                while rows := cursor.fetchmany(BATCH):
+                    for row in rows:
+                        out.write(json.dumps([_encode(v) for v in row]) + '\n')
+                    counts[table] += len(rows)
+    finally:
+        db.execute('ROLLBACK')
+    return counts
+
+
+def load(db, path):
+    """Replace the contents of db's tables with an export. Commits. Returns {table: rows}."""
+    d = dialect.of(db)
+    counts = {}
+    with _open(path, 'r') as lines:
+        header = json.loads(next(lines))
+        if header.get('format') != FORMAT:
+            raise ValueError(f'{path} is not an export-data file')
+        version = d.schema_version(db)
+        if header['schema_version'] != version:
+            raise ValueError(f"{path} is at schema version {header['schema_version']}, this database at "
+                             f'{version}; run `flask migrate` on both sides first')
+        missing = set(header['tables']) - set(d.tables(db))
+        if missing:
+            raise ValueError(f'tables missing here: {", ".join(sorted(missing))}')
+        try:
+            for table in reversed(header['tables']):
+                db.execute(f'DELETE FROM {table}')
+            insert, batch = None, []
+            for line in lines:
+                item = json.loads(line)
+                if isinstance(item, dict):
+                    if batch:
+                        db.executemany(insert, batch)
+                    table, columns = item['table'], item['columns']
+                    insert = (f'INSERT INTO {table} ({", ".join(columns)}) '
+                              f'VALUES ({", ".join("?" * len(columns))})')
+                    batch, counts[table] = [], 0
+                    continue
+                batch.append([_decode(v) for v in item])
+                counts[table] += 1
+                if len(batch) >= BATCH:
+                    db.executemany(insert, batch)
+                    batch = []
+            if batch:
+                db.executemany(insert, batch)
+            d.reset_sequences(db, header['tables'])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    fulltext.rebuild(db)
+    return counts
@@ -0,0 +1,151 @@
+"""Incrementally maintained, time-decayed trending scores.
+
+An engagement at time t adds weight * 2 ** ((t - epoch) / HALF_LIFE) to its
+post's score. Every stored score is therefore "as of" the shared epoch, so
+ranking never needs to touch old rows: newer engagement simply weighs more.
+compact() rebases the epoch to now (keeping the numbers small) and drops
+posts that are too old or too cold to ever trend again; the worker runs it
+every COMPACT_INTERVAL. Until it does, readers skip posts older than WINDOW.
+"""
+import time
+from datetime import datetime, timezone
+
+import jobs
+
+HALF_LIFE = 6 * 3600          # seconds for an engagement's weight to halve
+WINDOW = 7 * 24 * 3600        # posts older than this are dropped on compaction
+COMPACT_AFTER = 7 * 24 * 3600 # record() compacts if the epoch is older than this
+COMPACT_INTERVAL = 24 * 3600  # how often the worker compacts
+MIN_SCORE = 0.01              # scores below this (as of now) are dropped
+WEIGHTS = {'like': 1.0, 'comment': 3.0}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS trending_epoch (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        epoch REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS post_scores (
+        post_id INTEGER PRIMARY KEY,
+        score REAL NOT NULL DEFAULT 0,
+        FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_post_scores_score ON post_scores(score);
+"""
+
+
+def _epoch(db):
+    row = db.execute('SELECT epoch FROM trending_epoch WHERE id = 1').fetchone()
+    return row[0] if row else None
+
+
+def _ensure_epoch(db):
+    epoch = _epoch(db)
+    if epoch is not None:
+        return epoch
+    now = time.time()
+    db.execute('INSERT OR IGNORE INTO trending_epoch (id, epoch) VALUES (1, ?)', (now,))
+    return now
+
+
+def _boost(epoch, at):
+    return 2 ** ((at - epoch) / HALF_LIFE)
+
+
+def _timestamp(value):
+    """SQLite CURRENT_TIMESTAMP text (UTC) -> unix seconds."""
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp()
+
+
+def record(db, post_id, kind, direction=1):
+    """Apply a like/comment (direction=1) or its removal (-1) to a post's score. No commit.
+
+    Removals subtract the weight the engagement would have now, which slightly
+    over-corrects for old engagement; scores are clamped at zero.
+    """
+    now = time.time()
+    epoch = _ensure_epoch(db)
+    if now - epoch > COMPACT_AFTER:
+        compact(db, commit=False)
+        epoch = now
+    delta = direction * WEIGHTS[kind] * _boost(epoch, now)
+    db.execute('''
+        INSERT INTO post_scores (post_id, score) VALUES (?, MAX(?, 0))
+        ON CONFLICT(post_id) DO UPDATE SET score = MAX(score + ?, 0)
+    ''', (post_id, delta, delta))
+
+
+def top(db, limit=12):
+    """[(post_id, score_as_of_now)] for the hottest posts."""
+    epoch = _epoch(db)
+    if epoch is None:
+        return []
+    scale = _boost(epoch, time.time())
+    rows = db.execute('''
+        SELECT s.post_id, s.score FROM post_scores s
+        JOIN posts p ON p.id = s.post_id
+        WHERE p.created_at >= datetime(?, 'unixepoch')
+        ORDER BY s.score DESC LIMIT ?
+    ''', (time.time() - WINDOW, limit)).fetchall()
+    return [(r['post_id'], r['score'] / scale) for r in rows]
+
+
+def top_posts(db, uid, limit=12):
+    """Post rows for the trending grid, hottest first."""
+    return db.execute('''
+        SELECT p.*, u.username, u.avatar_color,
+               COALESCE(ps.like_count, 0) as like_count,
+               COALESCE(ps.comment_count, 0) as comment_count,
+               EXISTS(SELECT 1 FROM likes WHERE post_id=p.id AND user_id=?) as user_liked
+        FROM (SELECT s.post_id, s.score FROM post_scores s
+              JOIN posts recent ON recent.id = s.post_id
+              WHERE recent.created_at >= datetime(?, 'unixepoch')
+              ORDER BY s.score DESC LIMIT ?) t
+        JOIN posts p ON p.id = t.post_id
+        JOIN users u ON p.user_id = u.id
+        LEFT JOIN post_stats ps ON ps.post_id = p.id
+        ORDER BY t.score DESC
+    ''', (uid, time.time() - WINDOW, limit)).fetchall()
+
+
+def compact(db, commit=True):
+    """Rebase scores to the current time and drop old or negligible entries."""
+    now = time.time()
+    factor = 1 / _boost(_ensure_epoch(db), now)
+    db.execute('UPDATE post_scores SET score = score * ?', (factor,))
+    db.execute('UPDATE trending_epoch SET epoch = ? WHERE id = 1', (now,))
+    db.execute('DELETE FROM post_scores WHERE score < ?', (MIN_SCORE,))
+    db.execute('''
+        DELETE FROM post_scores WHERE post_id IN (
+            SELECT id FROM posts WHERE created_at < datetime(?, 'unixepoch')
+        )
+    ''', (now - WINDOW,))
+    if commit:
+        db.commit()
+
+
+def rebuild(db):
+    """Recompute every score from likes and comments inside WINDOW and commit."""
+    now = time.time()
+    db.execute('DELETE FROM post_scores')
+    db.execute('DELETE FROM trending_epoch')
+    db.execute('INSERT INTO trending_epoch (id, epoch) VALUES (1, ?)', (now,))
+    scores = {}
+    for kind, table in (('like', 'likes'), ('comment', 'comments')):
+        rows = db.execute(f'''
+            SELECT e.post_id, e.created_at FROM {table} e
+            JOIN posts p ON p.id = e.post_id
+            WHERE p.created_at >= datetime(?, 'unixepoch')
+        ''', (now - WINDOW,))
+        for row in rows:
+            weight = WEIGHTS[kind] * _boost(now, _timestamp(row['created_at']))
+            scores[row['post_id']] = scores.get(row['post_id'], 0) + weight
+    db.executemany('INSERT INTO post_scores (post_id, score) VALUES (?, ?)',
+                   [(pid, score) for pid, score in scores.items() if score >= MIN_SCORE])
+    db.commit()
+
+
+@jobs.handler('compact_trending')
+def _compact_trending_job(db):
+    compact(db, commit=False)
+
+jobs.periodic('compact_trending', COMPACT_INTERVAL)
@@ -0,0 +1,198 @@
+"""Chunked, resumable uploads.
+
+The client declares a file (name, size, optional SHA-256), PUTs it in
+sequential chunks at the offset the server reports, then completes it. Chunks
+are streamed straight from the request body into UPLOAD_FOLDER/tmp/<id>.part,
+so neither the size limit nor the type check waits for the whole file. A
+completed upload stays there until it is attached to a post by id
+(create_post's upload_ids) and handed to the blob store (media.acquire).
+"""
+import hashlib
+import os
+import time
+import uuid
+
+from werkzeug.utils import secure_filename
+
+import jobs
+import media
+
+CHUNK_SIZE = 5 * 1024 * 1024    # size the client is told to send
+MAX_CHUNK = 8 * 1024 * 1024     # largest chunk accepted in one request
+READ_BLOCK = 64 * 1024          # bytes copied from the request stream at a time
+UPLOAD_TTL = 24 * 3600          # unattached uploads are removed after this
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS uploads (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        filename TEXT NOT NULL,
+        media_type TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        received INTEGER NOT NULL DEFAULT 0,
+        sha256 TEXT DEFAULT '',
+        status TEXT NOT NULL DEFAULT 'open',
+        path TEXT DEFAULT '',
+        created_at REAL NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_uploads_created ON uploads(created_at);
+"""
+
+
+class UploadError(Exception):
+    """Rejected upload request; status is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def _sniff(head, media_type, ext):
+    """Cheap magic-number check on the first bytes of a file."""
+    if media_type == 'image':
+        return (head.startswith((b'\xff\xd8\xff', b'\x89PNG', b'GIF8'))
+                or (head[:4] == b'RIFF' and head[8:12] == b'WEBP'))
+    if media_type == 'video':
+        return head[4:8] == b'ftyp' or head.startswith(b'\x1a\x45\xdf\xa3')
+    if ext == 'wav':
+        return head[:4] == b'RIFF' and head[8:12] == b'WAVE'
+    if ext == 'ogg':
+        return head.startswith(b'OggS')
+    if ext == 'm4a':
+        return head[4:8] == b'ftyp'
+    # mp3 / aac: ID3 tag or an MPEG/ADTS frame sync
+    return head.startswith(b'ID3') or (len(head) > 1 and head[0] == 0xff and head[1] & 0xe0 == 0xe0)
+
+
+def _part_path(upload_id):
+    return os.path.join(media.UPLOAD_FOLDER, media.TMP_FOLDER, f'{upload_id}.part')
+
+
+def _as_json(row):
+    return {'id': row['id'], 'size': row['size'], 'received': row['received'],
+            'status': row['status'], 'chunk_size': CHUNK_SIZE}
+
+
+def create(db, user_id, filename, size, sha256=''):
+    """Register a new upload and return its state. Commits."""
+    name = secure_filename(filename or '')
+    media_type = media.get_media_type(name)
+    if not media_type:
+        raise UploadError('Непідтримуваний тип файлу')
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError('Invalid size')
+    if size > media.MAX_SIZE[media_type]:
+        raise UploadError('Файл занадто великий', 413)
+    upload_id = uuid.uuid4().hex
+    os.makedirs(os.path.dirname(_part_path(upload_id)), exist_ok=True)
+    open(_part_path(upload_id), 'wb').close()
+    db.execute('''INSERT INTO uploads (id, user_id, filename, media_type, size, sha256, created_at)
+                  VALUES (?,?,?,?,?,?,?)''',
+               (upload_id, user_id, name, media_type, size, (sha256 or '').lower(), time.time()))
+    db.commit()
+    return _as_json(get(db, user_id, upload_id))
+
+
+def get(db, user_id, upload_id):
+    row = db.execute('SELECT * FROM uploads WHERE id=? AND user_id=?', (upload_id, user_id)).fetchone()
+    if row is None:
+        raise UploadError('Not found', 404)
+    return row
+
+
+def status(db, user_id, upload_id):
+    return _as_json(get(db, user_id, upload_id))
+
+
+def receive(read_db, get_write_db, user_id, upload_id, offset, stream, length):
+    """Append one chunk from stream at offset. Returns the new state.
+
+    The body is copied to disk before the write connection is requested, so
+    a slow client never holds the database writer.
+    """
+    row = get(read_db, user_id, upload_id)
+    if row['status'] != 'open':
+        raise UploadError('Upload already completed', 409, received=row['received'])
+    if offset != row['received']:
+        raise UploadError('Wrong offset', 409, received=row['received'])
+    limit = min(MAX_CHUNK, row['size'] - offset)
+    if length is not None and length > limit:
+        raise UploadError('Chunk too large', 413, received=row['received'])
+
+    written = 0
+    with open(_part_path(upload_id), 'r+b') as f:
+        f.seek(offset)
+        f.truncate()
+        while True:
+            block = stream.read(READ_BLOCK)
+            if not block:
+                break
+            if offset == 0 and written == 0 and not _sniff(block[:16], row['media_type'],
+                                                          row['filename'].rsplit('.', 1)[-1].lower()):
+                f.truncate(offset)
+                raise UploadError('Вміст файлу не відповідає його типу', 415)
+            written += len(block)
+            if written > limit:
+                f.truncate(offset)
+                raise UploadError('Chunk too large', 413, received=row['received'])
+            f.write(block)
+
+    db = get_write_db()
+    if not db.execute('UPDATE uploads SET received=? WHERE id=? AND received=?',
+                      (offset + written, upload_id, offset)).rowcount:
+        db.rollback()
+        raise UploadError('Concurrent chunk', 409, received=get(db, user_id, upload_id)['received'])
+    db.commit()
+    return dict(_as_json(row), received=offset + written)
+
+
+def complete(read_db, get_write_db, user_id, upload_id):
+    """Verify size and checksum; the hash also addresses the file in the blob store."""
+    row = get(read_db, user_id, upload_id)
+    if row['status'] == 'complete':
+        return _as_json(row)
+    if row['received'] != row['size']:
+        raise UploadError('Upload incomplete', 409, received=row['received'])
+    digest = hashlib.sha256()
+    with open(_part_path(upload_id), 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    if row['sha256'] and digest.hexdigest() != row['sha256']:
+        raise UploadError('Checksum mismatch', 422)
+
+    db = get_write_db()
+    db.execute("UPDATE uploads SET status='complete', sha256=?, path=? WHERE id=?",
+               (digest.hexdigest(), f'{media.TMP_FOLDER}/{upload_id}.part', upload_id))
+    db.commit()
+    return dict(_as_json(row), status='complete')
+
+
+def take(db, user_id, upload_id):
+    """Claim a completed upload for a post. No commit.
+
+    Returns (filename, media_type, variants) like media.save_file, or
+    (None, None, None) if the id is unknown, not finished or already used.
+    """
+    row = db.execute("SELECT * FROM uploads WHERE id=? AND user_id=? AND status='complete'",
+                     (upload_id, user_id)).fetchone()
+    if row is None:
+        return None, None, None
+    db.execute('DELETE FROM uploads WHERE id=?', (upload_id,))
+    filename, variants = media.acquire(db, media.SUBFOLDERS[row['media_type']], row['sha256'],
+                                       row['filename'].rsplit('.', 1)[-1].lower(), row['size'],
+                                       _part_path(upload_id))
+    return filename, row['media_type'], variants
+
+
+@jobs.handler('expire_uploads')
+def _expire_uploads_job(db):
+    rows = db.execute('SELECT id, status, path FROM uploads WHERE created_at < ?',
+                      (time.time() - UPLOAD_TTL,)).fetchall()
+    for row in rows:
+        if os.path.exists(_part_path(row['id'])):
+            os.remove(_part_path(row['id']))
+        db.execute('DELETE FROM uploads WHERE id=?', (row['id'],))
+
+jobs.periodic('expire_uploads', 3600)
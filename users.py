@@ -0,0 +1,109 @@
+"""In-process cache of user profile rows.
+
+Profile rows are read on almost every page (the viewer's avatar, theme and
+accent in the header; the author on a profile page) and change only on
+edit_profile. Rows are kept in a per-process LRU of MAX_ENTRIES without
+password_hash. users.version is bumped by changed(), and the session lookup
+(sessions.py) reads the viewer's version along with the session, so the
+viewer always sees their own edits whichever worker serves them. Rows looked
+up without a version (other people's profiles) are trusted for TTL seconds,
+which bounds how long another worker can show a stale bio.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import session
+
+import database
+
+MAX_ENTRIES = int(os.environ.get('USER_CACHE_SIZE', 10000))
+TTL = 60
+
+COLUMNS = ('id, username, bio, avatar_color, accent_color, theme, avatar_img, '
+           'avatar_variants, created_at, version')
+
+_rows = OrderedDict()       # user_id -> (loaded_at, row)
+_ids = {}                   # username -> user_id; usernames never change
+_lock = threading.Lock()
+hits = misses = 0
+
+
+def _load(db, where, value):
+    row = db.execute(f'SELECT {COLUMNS} FROM users WHERE {where} = ?', (value,)).fetchone()
+    if row is None:
+        return None
+    row = dict(row)
+    with _lock:
+        _rows[row['id']] = (time.monotonic(), row)
+        _rows.move_to_end(row['id'])
+        _ids[row['username']] = row['id']
+        while len(_rows) > MAX_ENTRIES:
+            _, (_, evicted) = _rows.popitem(last=False)
+            _ids.pop(evicted['username'], None)
+    return row
+
+
+def _cached(user_id, version):
+    global hits, misses
+    with _lock:
+        entry = _rows.get(user_id)
+        if entry is not None:
+            loaded_at, row = entry
+            fresh = row['version'] == version if version is not None else time.monotonic() - loaded_at < TTL
+            if fresh:
+                _rows.move_to_end(user_id)
+                hits += 1
+                return row
+        misses += 1
+    return None
+
+
+def get(db, user_id, version=None):
+    """Profile row (dict) for user_id, or None. Pass the version the caller
+    knows to be current (the viewer's, from the session) to skip the TTL."""
+    return _cached(user_id, version) or _load(db, 'id', user_id)
+
+
+def by_username(db, username):
+    user_id = _ids.get(username)
+    row = _cached(user_id, None) if user_id is not None else None
+    return row or _load(db, 'username', username)
+
+
+def current():
+    """The signed-in viewer's row, or None."""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    return get(database.get_read_db(), user_id, getattr(session, 'user_version', None))
+
+
+def changed(db, user_id):
+    """Call after updating a users row. No commit."""
+    db.execute('UPDATE users SET version = version + 1 WHERE id = ?', (user_id,))
+    forget(user_id)
+
+
+def forget(user_id):
+    with _lock:
+        entry = _rows.pop(user_id, None)
+        if entry is not None:
+            _ids.pop(entry[1]['username'], None)
+
+
+def viewer():
+    """Template context: the viewer's header fields, with defaults when signed out."""
+    user = current() or {}
+    return {'viewer': {
+        'username': user.get('username') or '',
+        'theme': user.get('theme') or 'light',
+        'accent': user.get('accent_color') or '#6366f1',
+        'avatar_img': user.get('avatar_img') or '',
+    }}
+
+
+def stats():
+    with _lock:
+        return {'entries': len(_rows), 'hits': hits, 'misses': misses}